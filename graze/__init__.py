@@ -8,18 +8,22 @@ from graze.base import (
     GrazeWithDataRefresh,
     GrazeReturningFilepaths,
     graze,
+    Grazer,
+    graze_chunks,
     url_to_localpath,
     localpath_to_url,
     url_to_filepath,
     url_to_contents,
     key_egress_print_downloading_message,
 )
-from graze.util import handle_missing_dir, tiny_url
+from graze.util import handle_missing_dir, tiny_url, InsufficientSpace
 from graze.share_links import (
     ShareLinkKind,
     ResolvedShareLink,
     ShareLinkResolutionError,
     resolve_share_url,
+    resolve_share_urls,
+    ShareLinkResolutions,
     direct_download_url,
     share_link_resolvers,
     add_share_link_resolver,
@@ -27,10 +31,36 @@ from graze.share_links import (
 from graze.content_kind import (
     ContentKindMismatch,
     SNIFF_BYTES,
+    ANY_KIND,
     sniff_content_family,
     assert_content_kind,
     kind_checked,
 )
+from graze.ranges import read_range, SparseBlockFile
+from graze.negative_cache import NegativeCache, KnownFailure
+from graze.retry import RetryPolicy
+from graze.rate_limit import HostScheduler, HostLimits
+from graze.circuit_breaker import CircuitBreaker, CircuitOpenError
+from graze.timeouts import Timeouts, DeadlineExceeded, timeout_scope
+from graze.mirrors import HedgedSource, MirrorStats, hedged_fetch
+from graze.bandwidth import (
+    BandwidthLimiter,
+    bandwidth_scope,
+    priority_scope,
+    INTERACTIVE,
+    BACKGROUND,
+)
+from graze.scheduler import DownloadScheduler, QueueFull
+from graze.bulk import BulkDownload
+from graze.spill import SpillingCache, SpilledContents
+from graze.layouts import sharded_localpath
+from graze.canonical import UrlCanonicalizer, canonical_url
+from graze.progress import (
+    DownloadProgress,
+    ProgressTracker,
+    TerminalProgress,
+    progress_scope,
+)
 from graze.graze_exceptional import (
     graze_cache,
     add_exception,
@@ -0,0 +1,7 @@
+"""Run the ``graze`` command: ``python -m graze --help``."""
+
+import sys
+
+from graze.cli import main
+
+sys.exit(main())
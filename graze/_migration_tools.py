@@ -2,6 +2,7 @@
 Migration tools
 """
 
+import errno
 import os
 from graze.base import (
     pjoin,
@@ -133,3 +134,71 @@ def change_files_to_new_url_to_filepath_format(
     """
 
     return _migrate_versions(src_root, old_grazer)
+
+
+def migrate_layout(rootdir=DFLT_GRAZE_DIR, *, to="sharded", dst_root=None):
+    """Move the files of the cache folder ``rootdir`` to the ``to`` key layout (one of
+    ``graze.base.LAYOUTS``: ``"sharded"`` or ``"nested"``), in ``dst_root`` (by
+    default, ``rootdir`` itself).
+
+    The url of a file is the one of its sidecar if it has one (see
+    ``graze.layouts``), and the one of its key in the nested layout if not. Files
+    already where they should be are left as they are, so an interrupted migration
+    can just be run again. Returns the number of files moved.
+
+    A file is never moved over another: if the key of its url in the ``to`` layout
+    is a file already (the url is cached in both layouts, say), ``FileExistsError``
+    is raised, and the files moved so far stay moved (remove either copy, and run
+    it again).
+
+    >>> import tempfile
+    >>> from graze.base import GrazeBase
+    >>> rootdir = tempfile.mkdtemp()
+    >>> GrazeBase(rootdir)['http://a.com/x/y.csv'] = b'1,2,3'
+    >>> migrate_layout(rootdir, to='sharded')
+    1
+    >>> g = GrazeBase(rootdir, layout='sharded')
+    >>> list(g), g['http://a.com/x/y.csv']
+    (['http://a.com/x/y.csv'], b'1,2,3')
+    >>> migrate_layout(rootdir, to='nested'), list(GrazeBase(rootdir))
+    (1, ['http://a.com/x/y.csv'])
+    """
+    from graze.base import LAYOUTS, localpath_to_url
+    from graze.layouts import (
+        is_digest_name,
+        iter_folder_keys,
+        remove_url_sidecar,
+        write_url_sidecar,
+    )
+    from graze.util import remove_empty_dirs
+
+    if to not in LAYOUTS:
+        raise ValueError(f"Unknown layout {to!r}: not one of {list(LAYOUTS)}")
+    url_to_key, _ = LAYOUTS[to]
+    rootdir = os.path.expanduser(rootdir)
+    dst_root = rootdir if dst_root is None else os.path.expanduser(dst_root)
+
+    n_moved = 0
+    for key, url in iter_folder_keys(rootdir):
+        if url is None:
+            url = localpath_to_url(key)
+        src = os.path.join(rootdir, key)
+        dst = os.path.join(dst_root, url_to_key(url))
+        if dst == src:
+            continue
+        if os.path.lexists(dst):
+            raise FileExistsError(
+                errno.EEXIST,
+                f"Not moving the file of {url} over another file: {src} (remove "
+                f"either, and migrate again)",
+                dst,
+            )
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # (the url is kept at every step: interrupted, the migration can be rerun)
+        if is_digest_name(dst):
+            write_url_sidecar(dst, url)
+        os.replace(src, dst)
+        remove_url_sidecar(src)
+        remove_empty_dirs(os.path.dirname(src), rootdir)
+        n_moved += 1
+    return n_moved
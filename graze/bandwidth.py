@@ -0,0 +1,251 @@
+"""Bandwidth limits, shared fairly (and by priority) between concurrent downloads.
+
+A bulk warm-up can take all of a machine's bandwidth, leaving none for the fetches
+someone is actually waiting for. A ``BandwidthLimiter`` caps the bytes per second
+downloaded, globally and/or per host pattern, and hands the bandwidth out by
+*priority*: as long as an ``INTERACTIVE`` download is waiting for bandwidth, the
+``BACKGROUND`` ones wait.
+
+>>> limiter = BandwidthLimiter(rate=10_000_000, host_rates={'*.example.com': 1_000_000})
+>>> limiter.rates_of('http://data.example.com/big.csv')
+(10000000, 1000000)
+
+Limits can be changed at any time (``None`` removes one):
+
+>>> limiter.set_rate(5_000_000)
+>>> limiter.set_rate(None, host='*.example.com')
+>>> limiter.rates_of('http://data.example.com/big.csv')
+(5000000, None)
+
+Downloads pay for their chunks with ``consume(url, nbytes)``, which waits until the
+bandwidth is available. graze's chunked download functions (``chks_of_url_contents``,
+``requests_iter_chunks``, and so the streaming writer of ``graze_chunks``) do so
+through ``throttled``, with the limiter of the current ``bandwidth_scope``. Give one
+to an ``Internet``, and mark batch work as background:
+
+>>> from graze import Graze, Internet
+>>> g = Graze(source=Internet(bandwidth=limiter))  # doctest: +SKIP
+>>> with priority_scope(BACKGROUND):  # doctest: +SKIP
+...     scheduler.map(g.__getitem__, urls_to_warm_up)
+
+Downloads are ``INTERACTIVE`` unless said otherwise.
+"""
+
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fnmatch import fnmatchcase
+from typing import Optional
+
+from graze.rate_limit import host_of
+
+#: Priority classes (the lower, the more urgent).
+INTERACTIVE = 0
+BACKGROUND = 10
+
+DFLT_BURST_SECONDS = 0.5
+
+
+class _ByteBucket:
+    """A token bucket of bytes that can go into debt: a chunk is always let through
+    once the bucket isn't in debt, and the next ones wait for the debt to be repaid."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable):
+        self.rate = rate
+        self.capacity = rate * burst
+        self.clock = clock
+        self._tokens = self.capacity
+        self._last = clock()
+
+    def wait_time(self) -> float:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        return max(0.0, -self._tokens / self.rate)
+
+    def spend(self, nbytes: int) -> None:
+        self._tokens -= nbytes
+
+
+class BandwidthLimiter:
+    """Global and per-host limits of download bandwidth (thread-safe).
+
+    Args:
+        rate: The global limit, in bytes per second (None for no limit).
+        host_rates: Host pattern (``fnmatch`` style) -> bytes per second. The first
+            matching pattern wins.
+        burst: How many seconds worth of bandwidth can be used at once, after a quiet
+            spell.
+        clock: The function giving the (monotonic) time.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        *,
+        host_rates: Mapping[str, float] = (),
+        burst: float = DFLT_BURST_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.burst = burst
+        self.clock = clock
+        self._rate = rate
+        self._host_rates = dict(host_rates)
+        self._global_bucket = None
+        self._host_buckets = {}
+        self._waiting = Counter()
+        self._condition = threading.Condition()
+        self._reset_buckets()
+
+    def _reset_buckets(self):
+        self._global_bucket = (
+            None
+            if self._rate is None
+            else _ByteBucket(self._rate, self.burst, self.clock)
+        )
+        self._host_buckets.clear()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @property
+    def host_rates(self) -> dict:
+        return dict(self._host_rates)
+
+    def set_rate(self, rate: Optional[float], *, host: Optional[str] = None) -> None:
+        """Change the global limit, or (with ``host``) that of a host pattern."""
+        with self._condition:
+            if host is None:
+                self._rate = rate
+            elif rate is None:
+                self._host_rates.pop(host, None)
+            else:
+                self._host_rates[host] = rate
+            self._reset_buckets()
+            self._condition.notify_all()
+
+    def host_rate(self, host: str) -> Optional[float]:
+        """The limit of host (None if it has none)."""
+        for pattern, rate in self._host_rates.items():
+            if fnmatchcase(host, pattern.lower()):
+                return rate
+        return None
+
+    def rates_of(self, url: str) -> tuple:
+        """The ``(global, host)`` limits that apply to url."""
+        return self._rate, self.host_rate(host_of(url))
+
+    def _buckets(self, host: str) -> list:
+        if host not in self._host_buckets:
+            rate = self.host_rate(host)
+            bucket = None if rate is None else _ByteBucket(rate, self.burst, self.clock)
+            self._host_buckets[host] = bucket
+        buckets = [self._global_bucket, self._host_buckets[host]]
+        return [b for b in buckets if b is not None]
+
+    def _more_urgent_waiting(self, priority: int) -> bool:
+        return any(n for p, n in self._waiting.items() if p < priority)
+
+    def consume(self, url: str, nbytes: int, priority: Optional[int] = None) -> None:
+        """Wait until the bandwidth to download nbytes from url is available, and
+        use it. ``priority`` defaults to that of the current ``priority_scope``."""
+        if priority is None:
+            priority = current_priority()
+        host = host_of(url)
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    buckets = self._buckets(host)
+                    if not self._more_urgent_waiting(priority):
+                        wait_time = max((b.wait_time() for b in buckets), default=0.0)
+                        if wait_time == 0:
+                            for bucket in buckets:
+                                bucket.spend(nbytes)
+                            return
+                    else:
+                        wait_time = 0.05  # (woken up sooner, when they're served)
+                    self._condition.wait(wait_time)
+            finally:
+                self._waiting[priority] -= 1
+                if not self._waiting[priority]:
+                    del self._waiting[priority]
+                self._condition.notify_all()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(rate={self._rate!r}, "
+            f"host_rates={self._host_rates!r})"
+        )
+
+
+_limiter: ContextVar[Optional[BandwidthLimiter]] = ContextVar(
+    "graze_bandwidth_limiter", default=None
+)
+_priority: ContextVar[int] = ContextVar("graze_download_priority", default=INTERACTIVE)
+
+
+def current_limiter() -> Optional[BandwidthLimiter]:
+    """The bandwidth limiter of the current scope (None if there's none)."""
+    return _limiter.get()
+
+
+def current_priority() -> int:
+    """The download priority of the current scope."""
+    return _priority.get()
+
+
+@contextmanager
+def bandwidth_scope(
+    limiter: Optional[BandwidthLimiter] = None, *, priority: Optional[int] = None
+):
+    """A context in which downloads are throttled by limiter (if given, else that of
+    the enclosing scope), with priority (if given, else that of the enclosing
+    scope)."""
+    limiter_token = _limiter.set(limiter) if limiter is not None else None
+    priority_token = _priority.set(priority) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            _priority.reset(priority_token)
+        if limiter_token is not None:
+            _limiter.reset(limiter_token)
+
+
+def iter_in_bandwidth_scope(
+    chunks: Iterable, limiter: Optional[BandwidthLimiter] = None, *, priority=None
+) -> Iterator:
+    """Yield the items of chunks, each of them computed in a ``bandwidth_scope``
+    (see ``graze.timeouts.iter_in_timeout_scope`` for why)."""
+    iterator = iter(chunks)
+    while True:
+        with bandwidth_scope(limiter, priority=priority):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def priority_scope(priority: int):
+    """A context in which downloads have this priority."""
+    return bandwidth_scope(priority=priority)
+
+
+def throttled(chunks: Iterable[bytes], url: str) -> Iterator[bytes]:
+    """Yield the chunks (downloaded from url), paying for each with the limiter of
+    the current scope, if there's one. (The limiter and priority are those of when
+    the iteration starts.)"""
+    limiter = current_limiter()
+    if limiter is None:
+        yield from chunks
+        return
+    priority = current_priority()
+    for chunk in chunks:
+        limiter.consume(url, len(chunk), priority)
+        yield chunk
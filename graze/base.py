@@ -2,8 +2,11 @@
 
 from typing import Optional, Union, Any, Protocol, Iterator
 from collections.abc import Callable, MutableMapping
+from dataclasses import KW_ONLY, dataclass, field
 import os
+import stat
 import time
+from urllib.error import HTTPError
 from warnings import warn
 from operator import attrgetter
 from functools import partialmethod, partial
@@ -14,18 +17,62 @@ import requests
 from dol.filesys import ensure_slash_suffix
 
 # from py2store import add_ipython_key_completions, wrap_kvs, LocalBinaryStore
-from dol import add_ipython_key_completions, wrap_kvs, Files
-
-# from py2store.stores.local_store import AutoMkDirsOnSetitemMixin
-from dol import mk_dirs_if_missing
+from dol import Pipe, add_ipython_key_completions, wrap_kvs, Files
 
 from graze.util import (
     handle_missing_dir,
     is_special_url,
+    special_url_route,
     download_from_special_url,
     human_readable_bytes,
     get_content_size,
     inner_most_key,
+    DFLT_STREAM_CHK_SIZE,
+    chunks_of_bytes,
+    chunks_of_file,
+    tee_chunks_to_file,
+    preallocate,
+    InsufficientSpace,
+    write_in_dir,
+)
+from graze.retry import status_code_of, retrying
+from graze.bandwidth import (
+    bandwidth_scope,
+    current_limiter,
+    iter_in_bandwidth_scope,
+    throttled,
+)
+from graze.mirrors import DFLT_HEDGE_AFTER, HedgedSource, Mirrors
+from graze.canonical import as_canonicalizer
+from graze.layouts import (
+    MAX_KEY_BYTES,
+    fallback_localpath,
+    is_digest_name,
+    is_safe_name,
+    is_url_sidecar_key,
+    iter_folder_keys,
+    read_url_sidecar,
+    remove_url_sidecar,
+    sharded_localpath,
+    url_sidecar_key,
+    write_url_sidecar,
+)
+from graze.progress import (
+    Reporter,
+    current_reporter,
+    iter_in_progress_scope,
+    progress_scope,
+    reported,
+    total_of,
+)
+from graze.timeouts import (
+    check_deadline,
+    is_cancellable,
+    iter_in_timeout_scope,
+    requests_timeout,
+    timeout_scope,
+    transfer_deadline,
+    within,
 )
 
 Url = str
@@ -65,14 +112,25 @@ def url_to_localpath(url: str) -> str:
     'https/www.example.com_f/subdir1_f/subdir2_f/file.txt'
     >>> url_to_localpath('www.example.com/subdir1/subdir2/file.txt')
     'www.example.com/subdir1_f/subdir2_f/file.txt'
+
+    Urls with components that can't be file names (too long, or like ``..``), or
+    too long to be a path, get a digest key (see ``graze.layouts``):
+
+    >>> url_to_localpath('http://a.com/search?q=' + 'x' * 300)  # doctest: +ELLIPSIS
+    'http/a.com_f/search?q=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx~c44cdb5f53b5db17...'
     """
     path = url.replace("https://", "https/").replace("http://", "http/")
     path_subdirs = list(filter(None, path.split(psep)))
     path_subdirs[1:-1] = [x + SUBDIR_SUFFIX for x in path_subdirs[1:-1]]
-    return pjoin(*path_subdirs)
+    localpath = pjoin(*path_subdirs)
+    if not all(map(is_safe_name, path_subdirs)) or (
+        len(localpath.encode("utf-8", "surrogatepass")) > MAX_KEY_BYTES
+    ):
+        return fallback_localpath(url, path_subdirs)
+    return localpath
 
 
-def localpath_to_url(path: str) -> str:
+def localpath_to_url(path: str, *, rootdir: Optional[str] = None) -> str:
     """
     >>> localpath_to_url('http/www.example.com_f/subdir1_f/subdir2_f/file.txt')
     'http://www.example.com/subdir1/subdir2/file.txt'
@@ -80,7 +138,22 @@ def localpath_to_url(path: str) -> str:
     'https:/www.example.com/subdir1/subdir2/file.txt/'
     >>> localpath_to_url('www.example.com/subdir1_f/subdir2_f/file.txt')
     'www.example.com/subdir1/subdir2/file.txt'
+
+    The url of a digest key (see ``url_to_localpath``) is the one of its sidecar,
+    in the cache folder ``rootdir``:
+
+    >>> import tempfile
+    >>> rootdir = tempfile.mkdtemp()
+    >>> url = 'http://www.example.com/search?q=' + 'x' * 300
+    >>> graze(url, rootdir, source=lambda url: b'results')
+    b'results'
+    >>> localpath_to_url(url_to_localpath(url), rootdir=rootdir) == url
+    True
     """
+    if rootdir is not None and is_digest_name(path):
+        url = read_url_sidecar(os.path.join(os.path.expanduser(rootdir), path))
+        if url is not None:
+            return url
     path_subdirs = path.split(psep)
     path_subdirs[1:-1] = [x[:SUBDIR_SUFFIX_IDX] for x in path_subdirs[1:-1]]
     url = pjoin(*path_subdirs)
@@ -91,6 +164,19 @@ _url_to_localpath = url_to_localpath  # backward compatibility
 _localpath_to_url = localpath_to_url  # backward compatibility
 
 
+def _digest_key_to_url(key: str) -> str:
+    # (the url of a digest key is in its sidecar: one without is reported as is)
+    return key
+
+
+#: The cache key layouts (see ``graze.layouts``): name -> (url_to_cache_key,
+#: cache_key_to_url)
+LAYOUTS = {
+    "nested": (url_to_localpath, localpath_to_url),
+    "sharded": (sharded_localpath, _digest_key_to_url),
+}
+
+
 # --------------------------------------------------------------------------------------
 # Cache helpers for flexible caching backends
 
@@ -127,42 +213,53 @@ def _resolve_cache_and_key(
     """
     Resolve cache and cache_key, handling conflicts and defaults.
 
+    The cache defaults to ``DFLT_GRAZE_DIR``, unless the cache_key is a full
+    filepath (in which case the file *is* the cache).
+
     Returns:
         tuple: (resolved_cache, resolved_cache_key, is_explicit_filepath)
     """
-    # Handle backwards compatibility: rootdir vs cache conflict
+    # Check for rootdir/cache conflict FIRST (before any assignments)
     if rootdir is not None and cache is not None:
         raise ValueError(
             "Cannot specify both 'rootdir' and 'cache'. "
             "'rootdir' is deprecated; use 'cache' instead."
         )
 
-    # Use rootdir if cache not specified (backwards compatibility)
-    if cache is None and rootdir is not None:
-        cache = rootdir
-
-    # Resolve cache_key
+    # Resolve cache_key first to know if it's a full filepath
     if cache_key is None:
         resolved_cache_key = url_to_localpath(url)
+        is_explicit_filepath = False
     elif callable(cache_key):
         resolved_cache_key = cache_key(url)
+        is_explicit_filepath = _is_full_filepath(resolved_cache_key)
     else:
         resolved_cache_key = cache_key
+        is_explicit_filepath = _is_full_filepath(resolved_cache_key)
 
-    # Check if cache_key is a full filepath
-    is_explicit_filepath = _is_full_filepath(resolved_cache_key)
+    # Handle backwards compatibility and defaults
+    # Only set cache to default if not using explicit filepath
+    if cache is None and rootdir is None and not is_explicit_filepath:
+        cache = DFLT_GRAZE_DIR
+    elif cache is None and rootdir is not None:
+        cache = rootdir
 
+    # Check for explicit filepath conflict (after cache may have been set to default)
     if is_explicit_filepath and cache is not None:
-        raise ValueError(
-            f"cache_key appears to be a full filepath ({resolved_cache_key}), "
-            f"but 'cache' was also provided ({cache}). This is ambiguous. "
-            f"Either provide cache_key as a full filepath with cache=None, "
-            f"or provide both cache and a relative cache_key."
-        )
+        raise _ambiguous_cache_error(resolved_cache_key, cache)
 
     return cache, resolved_cache_key, is_explicit_filepath
 
 
+def _ambiguous_cache_error(cache_key: str, cache) -> ValueError:
+    return ValueError(
+        f"cache_key appears to be a full filepath ({cache_key}), "
+        f"but 'cache' was also provided ({cache}). This is ambiguous. "
+        f"Either provide cache_key as a full filepath with cache=None, "
+        f"or provide both cache and a relative cache_key."
+    )
+
+
 def _cache_contains(
     cache: Optional[Union[str, MutableMapping]],
     cache_key: str,
@@ -189,31 +286,111 @@ def _cache_contains(
         return False
 
 
+def _read_file_if_fresh(
+    filepath: str, max_age: int | float | None = None
+) -> tuple[Optional[bytes], Optional[float]]:
+    """Read the file at filepath, if there's one (and it's at most max_age seconds
+    old), with one ``open``, ``fstat`` and ``read`` (no ``exists`` check before).
+
+    Returns ``(contents, age)``: the contents are None if the file is missing or
+    stale, and its age (seconds since its mtime) is None if it's missing.
+    """
+    try:
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return None, None
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            return None, None
+        age = time.time() - st.st_mtime
+        if max_age is not None and age > max_age:
+            return None, age
+        return _read_fd(fd, st.st_size), age
+    finally:
+        os.close(fd)
+
+
+def _file_age(filepath: str) -> Optional[float]:
+    """The seconds since the file was modified (None if there's no file)"""
+    try:
+        return time.time() - os.stat(filepath).st_mtime
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _read_fd(fd: int, size: int) -> bytes:
+    """Read size bytes of fd (fewer, if it has fewer)"""
+    contents = os.read(fd, size) if size else b""
+    if len(contents) < size:  # (a short read: rare, for regular files)
+        parts = [contents]
+        while size := size - len(parts[-1]):
+            if not (part := os.read(fd, size)):
+                break
+            parts.append(part)
+        contents = b"".join(parts)
+    return contents
+
+
+def _direct_filepath(
+    cache: Optional[Union[str, MutableMapping]],
+    cache_key: str,
+    is_explicit_filepath: bool,
+) -> Optional[str]:
+    """The file of cache_key, if the cache's contents can be read from (and written
+    to) it directly: explicit filepaths, folder paths, and plain ``Files`` (or
+    ``LocalFiles``), not mappings that may transform or redirect what they give."""
+    if is_explicit_filepath:
+        return os.path.expanduser(cache_key)
+    if isinstance(cache, str):
+        return os.path.join(os.path.expanduser(cache), cache_key)
+    if type(cache) in (Files, LocalFiles):
+        return os.path.join(cache.rootdir, cache_key)
+    return None
+
+
+def _cached_contents(
+    cache: Optional[Union[str, MutableMapping]],
+    cache_key: str,
+    is_explicit_filepath: bool,
+    refresh: Union[bool, Callable],
+    url: str,
+) -> Optional[Contents]:
+    """The contents of cache_key in the cache, unless they're missing or to be
+    refreshed (then None).
+
+    A file is read with ``_read_file_if_fresh``, whose ``fstat`` also gives the age a
+    ``max_age`` refresh (see ``_max_age_to_refresh_func``) is decided on.
+    """
+    filepath = _direct_filepath(cache, cache_key, is_explicit_filepath)
+    if filepath is not None:
+        max_age = getattr(refresh, "max_age", None)
+        if max_age is None and _should_refresh(
+            refresh, cache, cache_key, url, is_explicit_filepath
+        ):
+            return None
+        return _read_file_if_fresh(filepath, max_age)[0]
+
+    if _should_refresh(refresh, cache, cache_key, url, is_explicit_filepath):
+        return None
+    if not _cache_contains(cache, cache_key, is_explicit_filepath):
+        return None
+    return _cache_get(cache, cache_key, is_explicit_filepath)
+
+
 def _cache_get(
     cache: Optional[Union[str, MutableMapping]],
     cache_key: str,
     is_explicit_filepath: bool,
 ) -> Optional[Contents]:
     """Get contents from cache."""
-    if is_explicit_filepath:
-        expanded_path = os.path.expanduser(cache_key)
-        if os.path.exists(expanded_path):
-            with open(expanded_path, "rb") as f:
-                return f.read()
-        return None
+    if is_explicit_filepath or isinstance(cache, str):
+        filepath = _direct_filepath(cache, cache_key, is_explicit_filepath)
+        return _read_file_if_fresh(filepath)[0]
 
     if cache is None:
         return None
 
-    if isinstance(cache, str):
-        # It's a folder path
-        expanded_cache = os.path.expanduser(cache)
-        full_path = os.path.join(expanded_cache, cache_key)
-        if os.path.exists(full_path):
-            with open(full_path, "rb") as f:
-                return f.read()
-        return None
-
     # It's a MutableMapping
     try:
         return cache[cache_key]
@@ -226,40 +403,77 @@ def _cache_set(
     cache_key: str,
     contents: Contents,
     is_explicit_filepath: bool,
+    *,
+    url: Optional[str] = None,
 ):
-    """Store contents in cache."""
-    if is_explicit_filepath:
-        expanded_path = os.path.expanduser(cache_key)
-        os.makedirs(os.path.dirname(expanded_path) or ".", exist_ok=True)
-        with open(expanded_path, "wb") as f:
-            f.write(contents)
+    """Store contents in cache (and url, if given, in the sidecar of a cache_key
+    that's a digest: see ``graze.layouts``)."""
+    # (the directories of files are made with write_in_dir: only if they're not
+    # known to exist already)
+    if is_explicit_filepath or isinstance(cache, str):
+        # It's an explicit filepath, or a folder path
+        filepath = _direct_filepath(cache, cache_key, is_explicit_filepath)
+        write_in_dir(partial(_write_to_file, contents, filepath), filepath)
+    elif cache is None:
         return
+    elif hasattr(cache, "rootdir"):
+        # It's a MutableMapping, likely a file-based store like Files (so
+        # directories must exist)
+        full_path = os.path.join(cache.rootdir, cache_key)
+        write_in_dir(partial(cache.__setitem__, cache_key, contents), full_path)
+    else:
+        cache[cache_key] = contents
 
-    if cache is None:
+    if url is not None:
+        _record_url(cache, cache_key, is_explicit_filepath, url)
+
+
+def _record_url(
+    cache: Optional[Union[str, MutableMapping]],
+    cache_key: str,
+    is_explicit_filepath: bool,
+    url: str,
+):
+    """Keep url in the sidecar of cache_key, if it's a digest (whose url can't be
+    told from it)"""
+    if not is_digest_name(cache_key):
         return
+    filepath = _cache_filepath(cache, cache_key, is_explicit_filepath)
+    if filepath is not None:
+        write_url_sidecar(filepath, url)
+    elif cache is not None:
+        cache[url_sidecar_key(cache_key)] = url.encode()
 
-    if isinstance(cache, str):
-        # It's a folder path
-        expanded_cache = os.path.expanduser(cache)
-        full_path = os.path.join(expanded_cache, cache_key)
-        os.makedirs(os.path.dirname(full_path) or expanded_cache, exist_ok=True)
-        with open(full_path, "wb") as f:
-            f.write(contents)
+
+def _forget_url(
+    cache: Optional[Union[str, MutableMapping]],
+    cache_key: str,
+    is_explicit_filepath: bool,
+):
+    """Remove the url sidecar of cache_key (if any)"""
+    if not is_digest_name(cache_key):
         return
+    filepath = _cache_filepath(cache, cache_key, is_explicit_filepath)
+    if filepath is not None:
+        remove_url_sidecar(filepath)
+    elif cache is not None:
+        cache.pop(url_sidecar_key(cache_key), None)
 
-    # It's a MutableMapping - need to ensure directories exist if it's file-based
-    # Try to create dirs for the key (gracefully handle if cache doesn't support it)
-    try:
-        # For Files and similar stores, we need to ensure parent dirs exist
-        if hasattr(cache, "rootdir"):
-            # It's likely a file-based store like Files
-            full_path = os.path.join(cache.rootdir, cache_key)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-    except (AttributeError, OSError):
-        # Not a file-based store, or dirs already exist, just continue
-        pass
 
-    cache[cache_key] = contents
+def _cache_filepath(
+    cache: Optional[Union[str, MutableMapping]],
+    cache_key: str,
+    is_explicit_filepath: bool,
+) -> Optional[str]:
+    """The local filepath backing ``cache_key``, or None if the cache isn't file-based."""
+    if is_explicit_filepath:
+        return os.path.expanduser(cache_key)
+    if isinstance(cache, str):
+        return os.path.join(os.path.expanduser(cache), cache_key)
+    if hasattr(cache, "rootdir"):
+        # For MutableMapping with rootdir (like Files)
+        return os.path.join(cache.rootdir, cache_key)
+    return None
 
 
 def _should_refresh(
@@ -280,7 +494,12 @@ def _should_refresh(
 
 
 def _max_age_to_refresh_func(max_age: Union[int, float]) -> Callable:
-    """Convert max_age to a refresh function."""
+    """Convert max_age to a refresh function.
+
+    The function has a ``max_age`` attribute: the lookups of file-based caches
+    (``_cached_contents``) use it with the age of the file they read, rather than
+    calling the function (which would ``stat`` it again).
+    """
 
     def refresh_func(cache_key: str, url: str) -> bool:
         # For MutableMapping, we can't easily check file age
@@ -299,9 +518,24 @@ def _max_age_to_refresh_func(max_age: Union[int, float]) -> Callable:
         age = time.time() - os.stat(filepath).st_mtime
         return age > max_age
 
+    refresh_func.max_age = max_age
     return refresh_func
 
 
+def _resolve_refresh(
+    refresh: Union[bool, Callable], max_age: int | float | None
+) -> Union[bool, Callable]:
+    """The refresh to use, given the ``refresh`` and ``max_age`` of ``graze``."""
+    if max_age is None:
+        return refresh
+    if callable(refresh) or refresh is True:
+        raise ValueError(
+            "Cannot specify both 'max_age' and 'refresh'. "
+            "Use either max_age for time-based refresh, or refresh for custom logic."
+        )
+    return _max_age_to_refresh_func(max_age)
+
+
 # End of cache helpers
 # --------------------------------------------------------------------------------------
 
@@ -323,7 +557,6 @@ FOLDER_SUFFIX = SUBDIR_SUFFIX  # TODO: Check usage and delete if none
 #     return path.replace('https/', 'https://').replace('http/', 'http://')
 
 
-@mk_dirs_if_missing
 class LocalFiles(Files):
     """Store to read/write/delete local files, creating directories on write."""
 
@@ -331,6 +564,15 @@ class LocalFiles(Files):
         handle_missing_dir(rootdir)
         super().__init__(ensure_slash_suffix(rootdir))
 
+    def __setitem__(self, k, v):
+        filepath = self._id_of_key(k)
+        rootdir = os.path.join(os.path.normpath(self.rootdir), "")
+        if os.path.normpath(filepath).startswith(rootdir):
+            # (directories only made if not known to exist; see util.known_dirs)
+            write_in_dir(partial(super().__setitem__, k, v), filepath)
+        else:
+            super().__setitem__(k, v)  # (a key out of rootdir: no dirs for it)
+
 
 @add_ipython_key_completions
 @wrap_kvs(
@@ -344,6 +586,11 @@ class LocalGrazed(LocalFiles):
 class RequestFailure(RuntimeError):
     """To be used when the request to get the contents of a url failed"""
 
+    def __init__(self, *args, status_code: Optional[int] = None, headers=None):
+        super().__init__(*args)
+        self.status_code = status_code
+        self.headers = headers
+
 
 def _dflt_selenium_response_func(response_obj):
     page_src = response_obj.page_source
@@ -426,13 +673,39 @@ class url_to_contents:
 
     @staticmethod
     def requests_get(url: URL, response_func=attrgetter("content"), **request_kwargs):
-        resp = requests.request("get", url=url, **request_kwargs)
+        """Get the url with ``requests``, bounded by the timeouts (and deadline) of the
+        current ``graze.timeouts.timeout_scope``, unless a ``timeout`` is given, and
+        throttled by the limiter of the current ``graze.bandwidth.bandwidth_scope``
+        (and reporting to the reporter of the current
+        ``graze.progress.progress_scope``)."""
+        check_deadline(url)
+        until = transfer_deadline()
+        request_kwargs.setdefault("timeout", requests_timeout(until))
+        limited = (
+            until is not None
+            or current_limiter() is not None
+            or is_cancellable()
+            or current_reporter() is not None
+        )
+        if not limited or "stream" in request_kwargs:
+            resp = requests.request("get", url=url, **request_kwargs)
+        else:
+            # stream, to check the time (and cancellation), pay for the bandwidth, and
+            # report progress, chunk-wise
+            resp = requests.request("get", url=url, stream=True, **request_kwargs)
+            chunks = resp.iter_content(chunk_size=DFLT_STREAM_CHK_SIZE)
+            chunks = throttled(within(chunks, until, url), url)
+            if resp.status_code == 200:
+                chunks = reported(chunks, url, total_of(resp.headers))
+            resp._content = b"".join(chunks)
         if resp.status_code == 200:
             return response_func(resp)
         else:
             raise RequestFailure(
                 f"Response code was {resp.status_code}.\n"
-                f"The first 500 characters of the content were: {resp.content[:500]}"
+                f"The first 500 characters of the content were: {resp.content[:500]}",
+                status_code=resp.status_code,
+                headers=resp.headers,
             )
 
     selenium_chrome = staticmethod(partial(selenium_url_to_contents, browser="Chrome"))
@@ -445,19 +718,45 @@ class url_to_contents:
 
 DFLT_URL_TO_CONTENT = url_to_contents.requests_get
 
-# Moved to util
+
+def requests_iter_chunks(
+    url: URL, chk_size: int = DFLT_STREAM_CHK_SIZE, **request_kwargs
+) -> Iterator[bytes]:
+    """Yield the contents of a url in chunks, as they come off the network.
+
+    The streaming counterpart of ``url_to_contents.requests_get``: the first chunk
+    is available as soon as the server starts answering, not once the whole
+    response has been received.
+    """
+    check_deadline(url)
+    until = transfer_deadline()
+    request_kwargs.setdefault("timeout", requests_timeout(until))
+    with requests.request("get", url=url, stream=True, **request_kwargs) as resp:
+        if resp.status_code != 200:
+            raise RequestFailure(
+                f"Response code was {resp.status_code}.\n"
+                f"The first 500 characters of the content were: {resp.content[:500]}",
+                status_code=resp.status_code,
+                headers=resp.headers,
+            )
+        chunks = within(resp.iter_content(chunk_size=chk_size), until, url)
+        yield from reported(throttled(chunks, url), url, total_of(resp.headers))
+
+
 # TODO: Should move more of this stuff below to util too
-# def _ensure_dirs_of_file_exists(filepath: str):
-#     """Recursively ensure all dirs necessary for filepath exist.
-#     Return filepath (useful for pipelines)"""
-#     dirpath = os.path.dirname(filepath)
-#     os.makedirs(dirpath, exist_ok=True)  # TODO: REALLY don't like this here.
-#     return filepath
-from graze.util import _ensure_dirs_of_file_exists
 
 
 def _write_to_file(contents, filepath, *, mode="wb"):
+    """Write contents to filepath, reserving their disk space first (see
+    ``graze.util.preallocate``) when they're (large) bytes"""
     with open(filepath, mode) as f:
+        if mode == "wb":
+            try:
+                preallocate(f, len(contents))
+            except InsufficientSpace:
+                f.close()
+                os.remove(filepath)  # (rather than leave an empty file behind)
+                raise
         f.write(contents)
     return filepath
 
@@ -482,6 +781,12 @@ def key_egress_print_downloading_message(url):
 
 
 def key_egress_print_downloading_message_with_size(url):
+    """Print a message, with the size of the contents, before downloading url.
+
+    Note: Getting the size takes a ``HEAD`` request of its own. To show the size (and
+    how the download is going) without one, give a ``graze.progress.TerminalProgress``
+    as ``progress`` instead: it uses the ``Content-Length`` of the download itself.
+    """
     size = get_content_size(url)
     if size is None:
         size = " (size unknown)"
@@ -543,23 +848,30 @@ def url_to_file_download(
     Need to decide how to download the url based on some characteristics of the url?
     Put this in the url_to_contents logic -- or, for a *provider* rule (this is a
     Dropbox folder link, so it needs dl=1 and comes back as a ZIP), register an
-    adapter with `graze.add_share_link_resolver` and let `special_url_routes`
-    dispatch to it.
+    adapter with `graze.add_share_link_resolver` and let `share_link_routes`
+    dispatch to it (or, to take over a url's download entirely, add a route with
+    `graze.util.add_special_url_route`: those are consulted first).
 
     """
+    key = None
     if filepath is None:
-        filepath = os.path.join(rootdir, url_to_path(url))
+        key = url_to_path(url)
+        filepath = os.path.join(rootdir, key)
 
     if os.path.exists(filepath) and not overwrite:
         # if file exists and we're not supposed to overwrite it, just get the contents
         contents = read_contents_of_file(filepath)
     else:
         # if not, get the contents of the url
-        url = url if url_egress is None else url_egress(url)
+        original_url, url = url, url if url_egress is None else url_egress(url)
         contents = url_to_contents(url)
         if ensure_dirs:
-            _ensure_dirs_of_file_exists(filepath)
-        write_contents_to_file(contents, filepath)
+            write = partial(write_contents_to_file, contents, filepath)
+            write_in_dir(write, filepath)
+        else:
+            write_contents_to_file(contents, filepath)
+        if is_digest_name(key):  # (the url of a digest key is kept in its sidecar)
+            write_url_sidecar(filepath, original_url)
 
     return return_func(filepath, contents, url)
 
@@ -569,15 +881,60 @@ _url_to_file_download = url_to_file_download  # backcompatibility alias
 
 # TODO: Think of a better way to handle the contents vs file download cases
 #   For example, better if Internet is not aware at all of local files
+def _iter_in_host_slot(host_scheduler, url_to_chunks, url, *args):
+    """Yield from ``url_to_chunks(url, *args)``, holding a slot of the url's host
+    until the last chunk is in"""
+    with host_scheduler.slot(url):
+        yield from url_to_chunks(url, *args)
+
+
 class Internet:
     def __init__(
         self,
         url_to_contents=DFLT_URL_TO_CONTENT,
         url_to_file_download=None,  # TODO: Find a good explicit default
+        *,
+        url_to_chunks=None,
+        negative_cache=None,
+        retry=None,
+        host_scheduler=None,
+        circuit_breaker=None,
+        timeouts=None,
+        deadline=None,
+        bandwidth=None,
+        scheduler=None,
+        progress=None,
     ):
         """From the url, get content off the internet.
 
         :param url_to_contents: The function that gets you the contents from the url
+        :param url_to_chunks: A ``(url, chk_size)`` function yielding the contents in
+            chunks, used by ``iter_chunks``. If None, ``requests_iter_chunks`` is used
+            with the default ``url_to_contents``, and a custom ``url_to_contents``
+            has its result chunked (so that it's still the one getting the contents).
+        :param negative_cache: A ``graze.negative_cache.NegativeCache`` to record
+            failed fetches in. Urls it knows to fail raise a ``KnownFailure`` (a
+            ``KeyError``) without going to the network.
+        :param retry: A ``graze.retry.RetryPolicy`` saying when and how to retry a
+            failed fetch (the default, None, is to try once).
+        :param host_scheduler: A ``graze.rate_limit.HostScheduler`` enforcing per-host
+            rate limits and concurrency caps: every request (every attempt, when
+            retrying) holds a slot of its host while it runs.
+        :param circuit_breaker: A ``graze.circuit_breaker.CircuitBreaker``: requests
+            to a host whose circuit it opened (because too many of them failed)
+            raise a ``CircuitOpenError`` (a ``KeyError``) right away.
+        :param timeouts: The ``graze.timeouts.Timeouts`` (connect, read and total) of
+            the requests (defaults to those of the enclosing ``timeout_scope``, which
+            default to ``graze.timeouts.DFLT_TIMEOUTS``).
+        :param deadline: The number of seconds a fetch, retries, redirects and
+            share-link hops included, may take (None for no limit).
+        :param bandwidth: A ``graze.bandwidth.BandwidthLimiter`` to throttle the
+            downloads with.
+        :param scheduler: A ``graze.scheduler.DownloadScheduler`` to run the fetches
+            with (by priority, with bounded concurrency, and cancellable). Streamed
+            fetches (``iter_chunks``) aren't scheduled.
+        :param progress: A ``graze.progress`` reporter (e.g. a ``TerminalProgress``),
+            called with the ``DownloadProgress`` of the downloads.
         """
         self.url_to_contents = url_to_contents
         if url_to_file_download is None:
@@ -585,6 +942,18 @@ class Internet:
                 _url_to_file_download, url_to_contents=url_to_contents
             )
         self.url_to_file_download = url_to_file_download
+        if url_to_chunks is None and url_to_contents is DFLT_URL_TO_CONTENT:
+            url_to_chunks = requests_iter_chunks
+        self.url_to_chunks = url_to_chunks
+        self.negative_cache = negative_cache
+        self.retry = retry
+        self.host_scheduler = host_scheduler
+        self.circuit_breaker = circuit_breaker
+        self.timeouts = timeouts
+        self.deadline = deadline
+        self.bandwidth = bandwidth
+        self.scheduler = scheduler
+        self.progress = progress
 
     # TODO: implement the key-specific getitem mapping externally to make it open-closed
     def __getitem__(self, k):
@@ -594,19 +963,110 @@ class Internet:
             # files) being created:
             k = k[:-1]
 
-        if is_special_url(k):
-            return download_from_special_url(k)
-        else:
-            return self._get_contents_of_url(k)
+        return self._fetch(k)
+
+    def _download(self, url, file=None):
+        """Get the contents of the url, or download them to file (no error handling)"""
+        route = special_url_route(url)  # (None for a plain url: a memo lookup)
+        if route is not None:
+            # (the route does its own retrying, so is guarded as a whole)
+            download = partial(download_from_special_url, route=route)
+            return self._guarded(download)(url, file, retry=self.retry)
+        args = (url,) if file is None else (url, file)
+        return retrying(self.retry, self._guarded(self._get_contents_of_url), *args)
+
+    def _guarded(self, func):
+        """func, made to go through the circuit breaker of the url's host, and to
+        hold a slot of it (if the Internet has a circuit breaker, a host scheduler)"""
+        if self.host_scheduler is not None:
+            func = partial(self.host_scheduler.call, func)
+        if self.circuit_breaker is not None:
+            func = partial(self.circuit_breaker.call, func)
+        return func
+
+    def _guarded_chunks(self, url_to_chunks):
+        """Like ``_guarded``, for a ``url_to_chunks`` function"""
+        if self.host_scheduler is not None:
+            url_to_chunks = partial(
+                _iter_in_host_slot, self.host_scheduler, url_to_chunks
+            )
+        if self.circuit_breaker is not None:
+            url_to_chunks = partial(self.circuit_breaker.iter_call, url_to_chunks)
+        return url_to_chunks
+
+    def _fetch(self, url, file=None):
+        """Get the contents of the url (or download them to file), recording failures
+        in the negative cache if there's one, and raising ``KeyError`` for a failed
+        request."""
+        if self.scheduler is None:
+            return self._fetch_now(url, file)
+        key = url if file is None else (url, file)
+        return self.scheduler.run(self._fetch_job, key)
+
+    def _fetch_job(self, key):
+        """The fetch of a (scheduler) job: key is a url, or a (url, file) pair"""
+        url, file = (key, None) if isinstance(key, str) else key
+        return self._fetch_now(url, file)
+
+    def _fetch_now(self, url, file=None):
+        """``_fetch``, without going through the scheduler"""
+        negative_cache = self.negative_cache
+        if negative_cache is not None:
+            negative_cache.check(url)
+        try:
+            with timeout_scope(self.timeouts, deadline=self.deadline):
+                with bandwidth_scope(self.bandwidth), progress_scope(self.progress):
+                    contents = self._download(url, file)
+        except (RequestFailure, HTTPError) as e:
+            if negative_cache is not None:
+                negative_cache.record(url, status_code_of(e), str(e)[:500])
+            if isinstance(e, RequestFailure):
+                raise KeyError(str(e))
+            raise
+        if negative_cache is not None:
+            negative_cache.forget(url)
+        return contents
 
     def _get_contents_of_url(self, url, file=None):
+        """Get the contents of a (plain, not special) url, or download them to file:
+        one attempt, that ``_download`` guards and retries, and ``_fetch`` handles
+        the errors of (a ``RequestFailure`` becoming a ``KeyError``)."""
+        if file is None:
+            return self.url_to_contents(url)
+        else:
+            return self.url_to_file_download(url, file)
+
+    def iter_chunks(self, url, chk_size=DFLT_STREAM_CHK_SIZE) -> Iterator[bytes]:
+        """Yield the contents of the url in chunks, as they're downloaded."""
+        url = url.strip()
+        if url.endswith("/"):
+            url = url[:-1]
+
+        if is_special_url(url) or self.url_to_chunks is None:
+            # Special url routes are whole-download functions
+            yield from chunks_of_bytes(self._fetch(url), chk_size)
+            return
+
+        negative_cache = self.negative_cache
+        if negative_cache is not None:
+            negative_cache.check(url)
+        url_to_chunks = self._guarded_chunks(self.url_to_chunks)
+        if self.retry is None:
+            chunks = url_to_chunks(url, chk_size)
+        else:
+            chunks = self.retry.iter_call(url_to_chunks, url, chk_size)
+        chunks = iter_in_bandwidth_scope(chunks, self.bandwidth)
+        chunks = iter_in_progress_scope(chunks, self.progress)
         try:
-            if file is None:
-                return self.url_to_contents(url)
-            else:
-                return self.url_to_file_download(url, file)
+            yield from iter_in_timeout_scope(
+                chunks, self.timeouts, deadline=self.deadline
+            )
         except RequestFailure as e:
+            if negative_cache is not None:
+                negative_cache.record(url, e.status_code, str(e)[:500])
             raise KeyError(str(e))
+        if negative_cache is not None:
+            negative_cache.forget(url)
 
     def download_to_file(self, url, file=None):
         """Download the contents of the url to the given filepath"""
@@ -616,10 +1076,7 @@ class Internet:
             # files) being created:
             url = url[:-1]
 
-        if is_special_url(url):
-            return download_from_special_url(url, file)
-        else:
-            return self._get_contents_of_url(url, file)
+        return self._fetch(url, file)
 
 
 # TODO: Use reususable caching decorator?
@@ -647,24 +1104,30 @@ def _iterate_cache(
     if cache is None:
         return
 
-    if isinstance(cache, str):
-        # It's a folder path
-        expanded_cache = os.path.expanduser(cache)
-        if not os.path.exists(expanded_cache):
-            return
-
-        # Walk the directory and yield URLs
-        for root, dirs, files in os.walk(expanded_cache):
-            for filename in files:
-                # Get relative path from cache root
-                filepath = os.path.join(root, filename)
-                relpath = os.path.relpath(filepath, expanded_cache)
-                # Convert to URL
-                yield cache_key_to_url(relpath)
+    rootdir = _cache_rootdir(cache)
+    if rootdir is not None:
+        # It's a folder path (or a plain Files): walk it, skipping url sidecars (and
+        # taking the url of digest keys from them)
+        for key, url in iter_folder_keys(rootdir):
+            yield cache_key_to_url(key) if url is None else url
     else:
         # It's a MutableMapping
         for key in cache:
-            yield cache_key_to_url(key)
+            if is_url_sidecar_key(key):
+                continue
+            url = None
+            if is_digest_name(key) and (sidecar := cache.get(url_sidecar_key(key))):
+                url = sidecar.decode()
+            yield cache_key_to_url(key) if url is None else url
+
+
+def _cache_rootdir(cache: Union[str, MutableMapping]) -> Optional[str]:
+    """The folder of a folder path (or plain ``Files``) cache (else None)"""
+    if isinstance(cache, str):
+        return os.path.expanduser(cache)
+    if type(cache) is Files:
+        return cache.rootdir
+    return None
 
 
 def _get_cache_size(cache: Optional[Union[str, MutableMapping]]) -> int:
@@ -672,16 +1135,11 @@ def _get_cache_size(cache: Optional[Union[str, MutableMapping]]) -> int:
     if cache is None:
         return 0
 
-    if isinstance(cache, str):
-        expanded_cache = os.path.expanduser(cache)
-        if not os.path.exists(expanded_cache):
-            return 0
-        count = 0
-        for root, dirs, files in os.walk(expanded_cache):
-            count += len(files)
-        return count
+    rootdir = _cache_rootdir(cache)
+    if rootdir is not None:
+        return sum(1 for _ in iter_folder_keys(rootdir))
     else:
-        return len(cache)
+        return len(cache) - sum(map(is_url_sidecar_key, cache))
 
 
 # --------------------------------------------------------------------------------------
@@ -711,6 +1169,19 @@ class GrazeBase(MutableMapping):
             Defaults to url_to_localpath.
         cache_key_to_url: Function to convert cache key back to URL.
             Defaults to localpath_to_url.
+        mirrors: Function giving the urls equivalent to a url (see ``graze``), to
+            get its contents from whichever delivers first.
+        hedge_after: With mirrors, the seconds to wait for a mirror before also
+            asking the next one.
+        progress: A ``graze.progress`` reporter (e.g. a ``TerminalProgress``) to
+            report the progress of downloads to.
+        layout: The name of a key layout (of ``LAYOUTS``), giving url_to_cache_key
+            and cache_key_to_url: "nested" (the default, ``url_to_localpath``), or
+            "sharded" (``graze.layouts.sharded_localpath``: fixed-depth folders
+            named after the digest of the url, the url kept in a sidecar).
+        canonicalize: If True (or a function of urls, like a
+            ``graze.canonical.UrlCanonicalizer``), the cache key of a url is that of
+            its canonical form (see ``graze.canonical``).
 
     Examples:
         >>> # With folder cache (default)
@@ -734,12 +1205,31 @@ class GrazeBase(MutableMapping):
         url_to_cache_key: Callable[[str], str] = url_to_localpath,
         cache_key_to_url: Callable[[str], str] = localpath_to_url,
         refresh: Union[bool, Callable] = False,
+        mirrors: Optional[Mirrors] = None,
+        hedge_after: float = DFLT_HEDGE_AFTER,
+        progress: Optional[Reporter] = None,
+        layout: Optional[str] = None,
+        canonicalize: Union[bool, Callable[[str], str]] = False,
     ):
         # Set defaults
         if cache is None:
             cache = DFLT_GRAZE_DIR
         if source is None:
             source = Internet()
+        if layout is not None:
+            if layout not in LAYOUTS:
+                raise ValueError(
+                    f"Unknown layout {layout!r}: not one of {list(LAYOUTS)}"
+                )
+            if (url_to_cache_key, cache_key_to_url) != LAYOUTS["nested"]:
+                raise ValueError(
+                    "Cannot specify both 'layout' and 'url_to_cache_key' or "
+                    "'cache_key_to_url'"
+                )
+            url_to_cache_key, cache_key_to_url = LAYOUTS[layout]
+        self.canonicalize = as_canonicalizer(canonicalize)
+        if self.canonicalize is not None:
+            url_to_cache_key = Pipe(self.canonicalize, url_to_cache_key)
 
         # Store configuration
         self.cache = cache
@@ -748,6 +1238,9 @@ class GrazeBase(MutableMapping):
         self.url_to_cache_key = url_to_cache_key
         self.cache_key_to_url = cache_key_to_url
         self.refresh = refresh
+        self.mirrors = mirrors
+        self.hedge_after = hedge_after
+        self.progress = progress
 
     def __getitem__(self, url: str) -> Contents:
         """Get contents for URL (downloads if not cached)."""
@@ -759,12 +1252,71 @@ class GrazeBase(MutableMapping):
             source=self.source,
             key_ingress=self.key_ingress,
             refresh=self.refresh,
+            mirrors=self.mirrors,
+            hedge_after=self.hedge_after,
+            progress=self.progress,
+        )
+
+    def iter_chunks(
+        self, url: str, chunk_size: int = DFLT_STREAM_CHK_SIZE
+    ) -> Iterator[bytes]:
+        """Yield the contents for URL in chunks (see ``graze_chunks``).
+
+        Served from the cache if there, otherwise streamed from the source while
+        being written to the cache.
+        """
+        return graze_chunks(
+            url,
+            cache=self.cache,
+            cache_key=self.url_to_cache_key(url),
+            source=self.source,
+            key_ingress=self.key_ingress,
+            refresh=self.refresh,
+            chunk_size=chunk_size,
+            progress=self.progress,
         )
 
+    def read_range(
+        self, url: str, start: Optional[int] = 0, stop: Optional[int] = None, **kwargs
+    ) -> bytes:
+        """Get bytes ``[start:stop]`` of the contents of URL, without getting it all.
+
+        If the whole contents are cached in a file, the range is read from there.
+        Otherwise only the blocks overlapping the range are fetched (with HTTP
+        ``Range`` requests) and cached, sparsely, under ``ranges_rootdir`` -- see
+        ``graze.ranges.read_range``, which ``kwargs`` are passed on to.
+        """
+        from graze.ranges import read_range
+
+        cache_key = self.url_to_cache_key(url)
+        filepath = _cache_filepath(self.cache, cache_key, is_explicit_filepath=False)
+        if filepath is not None and os.path.isfile(filepath):
+            with open(filepath, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                start, stop, _ = slice(start, stop).indices(size)
+                f.seek(start)
+                return f.read(max(stop - start, 0))
+        kwargs.setdefault("rootdir", self.ranges_rootdir)
+        return read_range(url, start, stop, **kwargs)
+
+    @property
+    def ranges_rootdir(self) -> str:
+        """Where ``read_range`` keeps partial (sparse) copies of urls.
+
+        A sibling of the cache folder (rather than inside it), so that a partial copy
+        is never mistaken for a cached url.
+        """
+        from graze.ranges import DFLT_RANGES_DIR
+
+        filepath = _cache_filepath(self.cache, "", is_explicit_filepath=False)
+        if filepath is None:
+            return DFLT_RANGES_DIR
+        return os.path.normpath(filepath) + "_ranges"
+
     def __setitem__(self, url: str, contents: Contents):
         """Manually set contents for URL in cache."""
         cache_key = self.url_to_cache_key(url)
-        _cache_set(self.cache, cache_key, contents, is_explicit_filepath=False)
+        _cache_set(self.cache, cache_key, contents, is_explicit_filepath=False, url=url)
 
     def __delitem__(self, url: str):
         """Delete cached contents for URL."""
@@ -785,6 +1337,7 @@ class GrazeBase(MutableMapping):
         else:
             # It's a MutableMapping
             del self.cache[cache_key]
+        _forget_url(self.cache, cache_key, is_explicit_filepath=False)
 
     def __contains__(self, url: str) -> bool:
         """Check if URL is cached."""
@@ -980,6 +1533,9 @@ class GrazeWithDataRefresh(Graze):
             'warn_and_return_local' warn the user of the stale data, but return the
             stale data anyway
 
+        If the source has a ``circuit_breaker`` (see ``graze.circuit_breaker``), a
+        refresh from a host whose circuit is open fails right away, so the stale data
+        is returned without waiting on the host.
         """
         # Store time_to_live and on_error before calling super().__init__
         self.time_to_live = time_to_live
@@ -1030,69 +1586,94 @@ class GrazeWithDataRefresh(Graze):
     def __getitem__(self, url: str) -> Union[Contents, str]:
         """Get contents for URL with refresh logic and error handling."""
         url = url.strip()
+        cache_key = self.url_to_cache_key(url)
+
+        filepath = _direct_filepath(self.cache, cache_key, False)
+        if filepath is not None:
+            # One open, fstat and read: the age (for freshness) is the fstat's
+            if self.return_filepaths:
+                age = _file_age(filepath)
+                if age is not None and age <= self.time_to_live:
+                    return filepath
+            else:
+                contents, age = _read_file_if_fresh(filepath, self.time_to_live)
+                if contents is not None:
+                    return contents
+            if age is not None:  # (there's data, but it's stale)
+                return self._refreshed(url, cache_key)
+            return super().__getitem__(url)
 
         # Check if we need to refresh
-        cache_key = self.url_to_cache_key(url)
         should_refresh = (
             self.refresh(cache_key, url) if callable(self.refresh) else self.refresh
         )
 
         if should_refresh and url in self:
-            # Data exists but is stale - try to refresh, handle errors based on on_error setting
-            try:
-                # Use graze() function with refresh=True
-                if self.return_filepaths:
-                    return graze(
-                        url,
-                        cache=self.cache,
-                        cache_key=cache_key,
-                        source=self.source,
-                        key_ingress=self.key_ingress,
-                        refresh=True,
-                        return_key=True,
-                    )
-                else:
-                    return graze(
-                        url,
-                        cache=self.cache,
-                        cache_key=cache_key,
-                        source=self.source,
-                        key_ingress=self.key_ingress,
-                        refresh=True,
-                    )
-            except Exception as e:
-                # Handle error based on on_error setting
-                filepath = self.filepath_of(url)
-                if os.path.exists(filepath):
-                    age = time.time() - os.stat(filepath).st_mtime
-                else:
-                    age = None
-
-                if self.on_error == "raise":
-                    raise
-                elif (
-                    self.on_error == "warn" or self.on_error == "warn_and_return_local"
-                ):
-                    if age is not None:
-                        warn(
-                            f"There was an error getting a fresh copy of {url}, "
-                            f"so I'll give you a copy that's {age:.1f} seconds old. "
-                            f"The error was: {e}"
-                        )
-                    else:
-                        warn(f"There was an error getting {url}: {e}")
-
-                # For 'ignore' and after warning, return stale data directly
-                # Read the file directly without triggering download
-                if self.return_filepaths:
-                    return filepath
-                else:
-                    with open(filepath, "rb") as f:
-                        return f.read()
+            return self._refreshed(url, cache_key)
 
         # Get data normally (from cache or download)
         return super().__getitem__(url)
 
+    def _refreshed(self, url: str, cache_key: str) -> Union[Contents, str]:
+        """Get fresh data for url, whose cached data is stale, handling errors based
+        on the on_error setting"""
+        try:
+            # Use graze() function with refresh=True
+            return graze(
+                url,
+                cache=self.cache,
+                cache_key=cache_key,
+                source=self.source,
+                key_ingress=self.key_ingress,
+                refresh=True,
+                return_key=self.return_filepaths,
+            )
+        except Exception as e:
+            # Handle error based on on_error setting
+            filepath = self.filepath_of(url)
+            age = _file_age(filepath)
+
+            if self.on_error == "raise":
+                raise
+            elif self.on_error == "warn" or self.on_error == "warn_and_return_local":
+                if age is not None:
+                    warn(
+                        f"There was an error getting a fresh copy of {url}, "
+                        f"so I'll give you a copy that's {age:.1f} seconds old. "
+                        f"The error was: {e}"
+                    )
+                else:
+                    warn(f"There was an error getting {url}: {e}")
+
+            # For 'ignore' and after warning, return stale data directly
+            # Read the file directly without triggering download
+            if self.return_filepaths:
+                return filepath
+            else:
+                with open(filepath, "rb") as f:
+                    return f.read()
+
+
+class _CallableWrapper:
+    """A callable source, as a ``Gettable`` (``source[url]`` is ``source(url)``)"""
+
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __getitem__(self, key):
+        return self.func(key)
+
+
+def _as_gettable(source: Union[Callable, Gettable, None]) -> Gettable:
+    """The ``Gettable`` of a ``graze`` source (an ``Internet()`` if it's None)"""
+    if source is None:
+        return Internet()
+    if callable(source) and not hasattr(source, "__getitem__"):
+        return _CallableWrapper(source)
+    return source
+
 
 def graze(
     url: str,
@@ -1104,6 +1685,11 @@ def graze(
     refresh: Union[bool, Callable] = False,
     max_age: int | float | None = None,
     return_key: bool = False,
+    timeout: Optional[float] = None,
+    mirrors: Optional[Mirrors] = None,
+    hedge_after: float = DFLT_HEDGE_AFTER,
+    progress: Optional[Reporter] = None,
+    canonicalize: Union[bool, Callable[[str], str]] = False,
     # Deprecated parameters (kept for backwards compatibility)
     rootdir: Optional[str] = None,
     return_filepaths: Optional[bool] = None,
@@ -1115,7 +1701,9 @@ def graze(
     :param cache: Where to store the contents. Can be:
         - None: use DFLT_GRAZE_DIR as folder path (unless cache_key is full filepath)
         - str: folder path for file-based caching
-        - MutableMapping: custom cache object (e.g., Files, dict)
+        - MutableMapping: custom cache object (e.g., Files, dict). A
+          ``graze.spill.SpillingCache`` keeps big contents on disk (they're then
+          returned as a ``SpilledContents`` handle, not bytes).
     :param cache_key: The key to use in the cache. Can be:
         - None: auto-generate using url_to_localpath
         - str: explicit cache key (or full filepath if starts with / or ~)
@@ -1132,6 +1720,21 @@ def graze(
     :param max_age: If not None, number of seconds cached data is considered fresh.
         If cached data is older, it will be re-downloaded. Cannot be used with refresh.
     :param return_key: If True, return the cache_key instead of contents.
+    :param timeout: If not None, the number of seconds the download (retries,
+        redirects and share-link hops included) may take, after which it fails with
+        a ``graze.timeouts.DeadlineExceeded`` (a ``TimeoutError``).
+    :param mirrors: Urls equivalent to url (or a function giving them, from url). If
+        given, the contents are taken from whichever of url and its mirrors delivers
+        first (see ``graze.mirrors.hedged_fetch``), and cached under url.
+    :param hedge_after: With mirrors, the number of seconds to wait for a mirror
+        before also asking the next one.
+    :param progress: A function (e.g. a ``graze.progress.TerminalProgress``) to call
+        with the ``graze.progress.DownloadProgress`` of the download (bytes received,
+        total, rate and eta), as it goes.
+    :param canonicalize: If True (or a function of urls, like a
+        ``graze.canonical.UrlCanonicalizer``), the cache key is that of the canonical
+        form of url, so that the ways of writing the same url share it (see
+        ``graze.canonical``). The url fetched is still url.
     :param rootdir: (DEPRECATED) Use 'cache' instead. Folder path for caching.
     :param return_filepaths: (DEPRECATED) Use 'return_key' instead.
 
@@ -1163,112 +1766,316 @@ def graze(
             raise ValueError("Cannot specify both 'return_key' and 'return_filepaths'")
         return_key = return_filepaths
 
-    # Handle max_age and refresh conflict
-    if max_age is not None and refresh != False:
-        if callable(refresh) or refresh is True:
-            raise ValueError(
-                "Cannot specify both 'max_age' and 'refresh'. "
-                "Use either max_age for time-based refresh, or refresh for custom logic."
+    # Convert max_age to refresh function if provided (and check it's not both)
+    refresh = _resolve_refresh(refresh, max_age)
+
+    canonical = as_canonicalizer(canonicalize)
+    key_url = url if canonical is None else canonical(url)
+    cache, resolved_cache_key, is_explicit_filepath = _resolve_cache_and_key(
+        key_url, cache, cache_key, rootdir
+    )
+
+    # Try to get from cache (unless refreshing)
+    contents = _cached_contents(
+        cache, resolved_cache_key, is_explicit_filepath, refresh, url
+    )
+    if contents is not None:
+        if return_key:
+            return (
+                _cache_filepath(cache, resolved_cache_key, is_explicit_filepath)
+                or resolved_cache_key
             )
+        return contents
 
-    # Convert max_age to refresh function if provided
-    if max_age is not None:
-        refresh = _max_age_to_refresh_func(max_age)
+    # Download fresh content (the source is only needed, so made, on a miss)
+    source = _as_gettable(source)
+    if mirrors is not None:
+        source = HedgedSource(source, mirrors, hedge_after=hedge_after)
+    fetched_url = url if key_ingress is None else key_ingress(url)
 
-    # Check for rootdir/cache conflict FIRST (before any assignments)
-    if rootdir is not None and cache is not None:
-        raise ValueError(
-            "Cannot specify both 'rootdir' and 'cache'. "
-            "'rootdir' is deprecated; use 'cache' instead."
+    contents = _fetched(source, cache, fetched_url, timeout=timeout, progress=progress)
+
+    # Cache the contents
+    _cache_set(cache, resolved_cache_key, contents, is_explicit_filepath, url=url)
+
+    if return_key:
+        return (
+            _cache_filepath(cache, resolved_cache_key, is_explicit_filepath)
+            or resolved_cache_key
         )
 
-    # Resolve cache_key first to know if it's a full filepath
-    if cache_key is None:
-        resolved_cache_key = url_to_localpath(url)
+    return contents
+
+
+@dataclass(frozen=True, eq=False)
+class Grazer:
+    """A ``graze``, compiled: everything but the url is resolved once, when it's
+    made, so that a call only does the lookup (and the fetch, on a miss).
+
+    ``grazer(url)`` is ``graze(url, cache, cache_key=..., source=..., ...)``, with
+    the arguments the ``Grazer`` was made with (see ``graze``). But the defaults, the
+    ``max_age`` (made into a refresh function), the folder of the cache, whether a
+    (fixed) ``cache_key`` is a full filepath, and the source (an ``Internet()`` if
+    None, callables made ``Gettable``, and mirrors hedged) are worked out, and
+    checked, once and for all -- which is what most of the time of a cache hit of
+    ``graze`` is spent on. Use one to get many urls with the same settings.
+
+    >>> source = lambda url: b'contents of ' + url.encode()
+    >>> cache = {}
+    >>> grazer = Grazer(cache, source=source)
+    >>> grazer('http://a.com/x')
+    b'contents of http://a.com/x'
+    >>> cache
+    {'http/a.com_f/x': b'contents of http://a.com/x'}
+    >>> Grazer(cache, source=source, return_key=True)('http://a.com/x')
+    'http/a.com_f/x'
+
+    A ``Grazer`` is immutable (make another one to change its settings), and so can
+    be shared, by threads too:
+
+    >>> grazer.cache = {}  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    dataclasses.FrozenInstanceError: cannot assign to field 'cache'
+
+    Inconsistent settings are errors when it's made, not when it's called:
+
+    >>> Grazer(cache, refresh=True, max_age=60)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    ValueError: Cannot specify both 'max_age' and 'refresh'...
+    """
+
+    cache: Optional[Union[str, MutableMapping]] = None
+    _: KW_ONLY
+    cache_key: Optional[Union[str, Callable]] = None
+    source: Union[Callable, Gettable] = None
+    key_ingress: Callable | None = None
+    refresh: Union[bool, Callable] = False
+    max_age: int | float | None = None
+    return_key: bool = False
+    timeout: Optional[float] = None
+    mirrors: Optional[Mirrors] = None
+    hedge_after: float = DFLT_HEDGE_AFTER
+    progress: Optional[Reporter] = None
+    canonicalize: Union[bool, Callable[[str], str]] = False
+
+    # The resolved settings (of the lookup, and of the fetch)
+    _cache: Optional[Union[str, MutableMapping]] = field(init=False, repr=False)
+    _key_of: Callable[[str], str] = field(init=False, repr=False)
+    _key_is_fixed: bool = field(init=False, repr=False)
+    _is_explicit_filepath: bool = field(init=False, repr=False)
+    _refresh: Union[bool, Callable] = field(init=False, repr=False)
+    _source: Gettable = field(init=False, repr=False)
+
+    def __post_init__(self):
+        resolved = partial(object.__setattr__, self)  # (it's frozen)
+        refresh = _resolve_refresh(self.refresh, self.max_age)
+        if not isinstance(refresh, bool) and not callable(refresh):
+            raise ValueError(f"refresh must be bool or callable. Got: {type(refresh)}")
+        resolved("_refresh", refresh)
+
+        cache_key = self.cache_key
         is_explicit_filepath = False
-    elif callable(cache_key):
-        resolved_cache_key = cache_key(url)
-        is_explicit_filepath = _is_full_filepath(resolved_cache_key)
+        if cache_key is None:
+            resolved("_key_of", url_to_localpath)
+        elif callable(cache_key):
+            resolved("_key_of", cache_key)  # (checked, per url, when called)
+        else:
+            resolved("_key_of", lambda url: cache_key)
+            is_explicit_filepath = _is_full_filepath(cache_key)
+        resolved("_key_is_fixed", not callable(cache_key))
+        resolved("_is_explicit_filepath", is_explicit_filepath)
+        canonical = as_canonicalizer(self.canonicalize)
+        if canonical is not None and (cache_key is None or callable(cache_key)):
+            resolved("_key_of", Pipe(canonical, self._key_of))
+
+        cache = self.cache
+        if is_explicit_filepath:
+            if cache is not None:
+                raise _ambiguous_cache_error(cache_key, cache)
+        elif cache is None:
+            cache = DFLT_GRAZE_DIR
+        if isinstance(cache, str):
+            cache = os.path.expanduser(cache)
+        resolved("_cache", cache)
+
+        source = _as_gettable(self.source)
+        if self.mirrors is not None:
+            source = HedgedSource(source, self.mirrors, hedge_after=self.hedge_after)
+        resolved("_source", source)
+
+    def __call__(self, url: str):
+        """The contents of url (or its cache key, with ``return_key``)"""
+        key = self._key_of(url)
+        cache, is_explicit_filepath = self._cache, self._is_explicit_filepath
+        if not self._key_is_fixed and _is_full_filepath(key):
+            if self.cache is not None:
+                raise _ambiguous_cache_error(key, self.cache)
+            cache, is_explicit_filepath = None, True
+
+        contents = _cached_contents(
+            cache, key, is_explicit_filepath, self._refresh, url
+        )
+        if contents is not None:
+            if self.return_key:
+                return _cache_filepath(cache, key, is_explicit_filepath) or key
+            return contents
+
+        fetched_url = url if self.key_ingress is None else self.key_ingress(url)
+        contents = _fetched(
+            self._source,
+            cache,
+            fetched_url,
+            timeout=self.timeout,
+            progress=self.progress,
+        )
+        _cache_set(cache, key, contents, is_explicit_filepath, url=url)
+        if self.return_key:
+            return _cache_filepath(cache, key, is_explicit_filepath) or key
+        return contents
+
+
+def _fetched(
+    source: Gettable,
+    cache,
+    url: str,
+    *,
+    timeout: Optional[float] = None,
+    progress: Optional[Reporter] = None,
+):
+    """The contents of url, from source (the miss path of ``graze``)."""
+    with timeout_scope(deadline=timeout), progress_scope(progress):
+        if hasattr(cache, "spool") and hasattr(source, "iter_chunks"):
+            # (a cache that spills big contents to disk: receive them chunk-wise,
+            # so they're never all in memory)
+            return _spooled_contents(cache, source, url)
+        return source[url]
+
+
+def _spooled_contents(cache, source, url: str):
+    """The contents of url, streamed from source into a spool of the cache (see
+    ``graze.spill.SpillingCache``)"""
+    with cache.spool() as spool:
+        for chk in source.iter_chunks(url, DFLT_STREAM_CHK_SIZE):
+            spool.write(chk)
+    return spool.contents()
+
+
+def _iter_source_chunks(source, url: str, chunk_size: int) -> Iterator[bytes]:
+    """Yield the contents of url from source, streaming if source knows how to."""
+    if hasattr(source, "iter_chunks"):
+        yield from source.iter_chunks(url, chunk_size)
+    elif callable(source) and not hasattr(source, "__getitem__"):
+        yield from chunks_of_bytes(source(url), chunk_size)
     else:
-        resolved_cache_key = cache_key
-        is_explicit_filepath = _is_full_filepath(resolved_cache_key)
+        yield from chunks_of_bytes(source[url], chunk_size)
 
-    # Handle backwards compatibility and defaults
-    # Only set cache to default if not using explicit filepath
-    if cache is None and rootdir is None and not is_explicit_filepath:
-        cache = DFLT_GRAZE_DIR
-    elif cache is None and rootdir is not None:
-        cache = rootdir
 
-    # Check for explicit filepath conflict (after cache may have been set to default)
-    if is_explicit_filepath and cache is not None:
-        raise ValueError(
-            f"cache_key appears to be a full filepath ({resolved_cache_key}), "
-            f"but 'cache' was also provided ({cache}). This is ambiguous. "
-            f"Either provide cache_key as a full filepath with cache=None, "
-            f"or provide both cache and a relative cache_key."
-        )
+class _TotalOfDownload:
+    """A progress reporter remembering the total number of bytes a download announced,
+    and passing the progress on to reporter (if any)"""
 
-    # Set source default
-    if source is None:
-        source = Internet()
+    def __init__(self, reporter: Optional[Reporter] = None):
+        self.reporter = reporter
+        self.total = None
 
-    # Convert callable source to Gettable if needed
-    if callable(source) and not hasattr(source, "__getitem__"):
-        # Wrap callable in a simple class with __getitem__
-        class _CallableWrapper:
-            def __init__(self, func):
-                self.func = func
+    def __call__(self, progress):
+        if self.total is None:
+            self.total = progress.total
+        if self.reporter is not None:
+            self.reporter(progress)
 
-            def __getitem__(self, key):
-                return self.func(key)
 
-        source = _CallableWrapper(source)
+def graze_chunks(
+    url: str,
+    cache: Optional[Union[str, MutableMapping]] = None,
+    *,
+    cache_key: Optional[Union[str, Callable]] = None,
+    source: Union[Callable, Gettable] = None,
+    key_ingress: Callable | None = None,
+    refresh: Union[bool, Callable] = False,
+    max_age: int | float | None = None,
+    chunk_size: int = DFLT_STREAM_CHK_SIZE,
+    timeout: Optional[float] = None,
+    progress: Optional[Reporter] = None,
+    rootdir: Optional[str] = None,
+) -> Iterator[bytes]:
+    """Like ``graze``, but yield the contents in chunks instead of returning them.
+
+    On a cache hit, the chunks are read from the cache. On a miss, they are yielded
+    as they come from the source (if it has an ``iter_chunks`` method, as
+    ``Internet`` does), and written to the cache at the same time. So the first
+    chunk is available as soon as the source produces it, instead of after the full
+    download and write.
+
+    The cache is only written once the stream completes: caches that are files
+    (folders, ``Files``) get the chunks in a temporary file that is moved into place
+    at the end, and other caches (wrapped stores included) get the whole contents
+    set at the end. If the stream fails (or you stop iterating before the end),
+    nothing is cached.
+
+    See ``graze`` for the meaning of the other arguments.
+
+    >>> cache = {}
+    >>> source = lambda url: b'contents of ' + url.encode()
+    >>> list(graze_chunks('http://a.b/c', cache, cache_key='c', source=source, chunk_size=8))
+    [b'contents', b' of http', b'://a.b/c']
+    >>> cache
+    {'c': b'contents of http://a.b/c'}
+    """
+    refresh = _resolve_refresh(refresh, max_age)
+
+    cache, resolved_cache_key, is_explicit_filepath = _resolve_cache_and_key(
+        url, cache, cache_key, rootdir
+    )
+    # (only caches whose files are their contents are read and written directly:
+    # others, file-based or not, are gone through, so they can transform or redirect)
+    filepath = _direct_filepath(cache, resolved_cache_key, is_explicit_filepath)
 
-    # Determine if we should refresh
     should_download = _should_refresh(
         refresh, cache, resolved_cache_key, url, is_explicit_filepath
     )
-
-    # Try to get from cache if not refreshing
     if not should_download and _cache_contains(
         cache, resolved_cache_key, is_explicit_filepath
     ):
+        if filepath is not None:
+            yield from chunks_of_file(filepath, chunk_size)
+            return
         contents = _cache_get(cache, resolved_cache_key, is_explicit_filepath)
         if contents is not None:
-            if return_key:
-                if is_explicit_filepath:
-                    return os.path.expanduser(resolved_cache_key)
-                elif isinstance(cache, str):
-                    return os.path.join(os.path.expanduser(cache), resolved_cache_key)
-                elif hasattr(cache, "rootdir"):
-                    # For MutableMapping with rootdir (like Files)
-                    return os.path.join(cache.rootdir, resolved_cache_key)
-                else:
-                    return resolved_cache_key
-            return contents
-
-    # Download fresh content
-    if key_ingress is not None:
-        url = key_ingress(url)
-
-    contents = source[url]
-
-    # Cache the contents
-    _cache_set(cache, resolved_cache_key, contents, is_explicit_filepath)
+            yield from chunks_of_bytes(contents, chunk_size)
+            return
 
-    if return_key:
-        if is_explicit_filepath:
-            return os.path.expanduser(resolved_cache_key)
-        elif isinstance(cache, str):
-            return os.path.join(os.path.expanduser(cache), resolved_cache_key)
-        elif hasattr(cache, "rootdir"):
-            # For MutableMapping with rootdir (like Files)
-            return os.path.join(cache.rootdir, resolved_cache_key)
-        else:
-            return resolved_cache_key
+    if source is None:
+        source = Internet()
+    fetched_url = url if key_ingress is None else key_ingress(url)
 
-    return contents
+    chunks = iter_in_timeout_scope(
+        _iter_source_chunks(source, fetched_url, chunk_size), deadline=timeout
+    )
+    if filepath is not None:
+        # (the total the download announces is what the file is preallocated to)
+        total_of_download = _TotalOfDownload(progress or current_reporter())
+        chunks = iter_in_progress_scope(chunks, total_of_download)
+        yield from tee_chunks_to_file(
+            chunks, filepath, size=lambda: total_of_download.total
+        )
+        _record_url(cache, resolved_cache_key, is_explicit_filepath, url)
+    elif hasattr(cache, "spool"):
+        with cache.spool() as spool:
+            for chk in iter_in_progress_scope(chunks, progress):
+                spool.write(chk)
+                yield chk
+        contents = spool.contents()
+        _cache_set(cache, resolved_cache_key, contents, is_explicit_filepath, url=url)
+    else:
+        received = []
+        for chk in iter_in_progress_scope(chunks, progress):
+            received.append(chk)
+            yield chk
+        contents = b"".join(received)
+        _cache_set(cache, resolved_cache_key, contents, is_explicit_filepath, url=url)
 
 
 graze.key_ingress_print_downloading_message = key_egress_print_downloading_message
@@ -0,0 +1,439 @@
+"""Bulk downloads that survive crashes: a journal of what's pending, done and failed.
+
+Warming a cache with half a million urls takes a while, and whatever can die
+halfway through eventually will. A ``BulkDownload`` keeps a journal (an sqlite
+file) of the state of each of its urls -- ``pending``, ``in_flight``, ``done`` or
+``failed`` -- so that running it again picks up exactly where it left off: urls
+``done`` aren't even looked at (no ``stat`` per url to find out what's cached), and
+those that were ``in_flight`` when it died are pending again.
+
+>>> import os, tempfile
+>>> root = tempfile.mkdtemp()
+>>> source = lambda url: b'contents of ' + url.encode()
+>>> bulk = BulkDownload(
+...     os.path.join(root, 'journal.sqlite'), cache=os.path.join(root, 'cache'),
+...     source=source,
+... )
+>>> bulk.add(['http://a.com/1', 'http://a.com/2', 'http://a.com/3'])
+3
+>>> progress = bulk.run()
+>>> progress.done, progress.failed, progress.pending
+(3, 0, 0)
+>>> bulk.state('http://a.com/2')
+'done'
+
+Each url is fetched with ``graze`` (so with its cache semantics: a url already in
+the cache isn't downloaded again), in ``max_workers`` threads, with the
+``graze.bandwidth.BACKGROUND`` priority (so that interactive fetches come first).
+A failed url is retried according to the ``retry`` policy (a
+``graze.retry.RetryPolicy``): if its error is retryable, it's pending again after the
+policy's delay, until it has had ``retry.max_attempts`` attempts. Then it's
+``failed`` (``retry_failed`` makes failed urls pending again).
+
+Progress (counts, throughput, and an estimate of the time left) is returned by
+``progress()``, and given to the ``on_progress`` callback after each url.
+"""
+
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+
+from graze.bandwidth import BACKGROUND, priority_scope
+from graze.retry import RetryPolicy, status_code_of
+
+PENDING, IN_FLIGHT, DONE, FAILED = "pending", "in_flight", "done", "failed"
+
+DFLT_MAX_WORKERS = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    nbytes INTEGER,
+    status_code INTEGER,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS urls_by_state_and_seq ON urls (state, seq);
+"""
+
+
+@dataclass(frozen=True)
+class Progress:
+    """Where a bulk download stands.
+
+    The counts are those of the journal; the rates are those of the current run.
+    """
+
+    pending: int
+    in_flight: int
+    done: int
+    failed: int
+    nbytes: int
+    elapsed: float
+    done_this_run: int = 0
+    nbytes_this_run: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.pending + self.in_flight + self.done + self.failed
+
+    @property
+    def urls_per_second(self) -> float:
+        return self.done_this_run / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.nbytes_this_run / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """The estimated seconds left (None if there's no rate to go by yet)."""
+        if not self.urls_per_second:
+            return None
+        return (self.pending + self.in_flight) / self.urls_per_second
+
+    def __str__(self):
+        eta = "?" if self.eta is None else f"{self.eta:.0f}s"
+        return (
+            f"{self.done}/{self.total} done, {self.failed} failed, "
+            f"{self.urls_per_second:.1f} urls/s, "
+            f"{self.bytes_per_second / 1e6:.2f} MB/s, eta {eta}"
+        )
+
+
+def _error_of(error: BaseException) -> BaseException:
+    """The error that says the most: the one with a status code, if error (e.g. the
+    ``KeyError`` of ``Internet``) was raised while handling one."""
+    context = error
+    while context is not None:
+        if status_code_of(context) is not None:
+            return context
+        context = context.__cause__ or context.__context__
+    return error
+
+
+class BulkDownload:
+    """A crash-resumable download of many urls into a ``graze`` cache.
+
+    Args:
+        journal: The path of the (sqlite) journal file.
+        cache, source, cache_key, key_ingress, refresh, max_age: What to give
+            ``graze`` (see it).
+        retry: When, and how long after, to retry a failed url. Defaults to
+            ``RetryPolicy()``.
+        max_workers: The number of urls fetched concurrently.
+        priority: The priority of the fetches (see ``graze.bandwidth``).
+        on_progress: Called with the ``Progress`` after each url.
+    """
+
+    def __init__(
+        self,
+        journal: str,
+        *,
+        cache=None,
+        source=None,
+        cache_key: Optional[Callable] = None,
+        key_ingress: Optional[Callable] = None,
+        refresh=False,
+        max_age=None,
+        retry: Optional[RetryPolicy] = None,
+        max_workers: int = DFLT_MAX_WORKERS,
+        priority: int = BACKGROUND,
+        on_progress: Optional[Callable[[Progress], None]] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.journal = os.path.expanduser(journal)
+        self.graze_kwargs = dict(
+            cache=cache,
+            cache_key=cache_key,
+            source=source,
+            key_ingress=key_ingress,
+            refresh=refresh,
+            max_age=max_age,
+        )
+        self.retry = RetryPolicy() if retry is None else retry
+        self.max_workers = max_workers
+        self.priority = priority
+        self.on_progress = on_progress
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.journal, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._counts, self._nbytes = self._counted_states()
+        self._started = None
+        self._done_this_run = 0
+        self._nbytes_this_run = 0
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _counted_states(self) -> tuple[dict, int]:
+        """The number of urls of each state in the journal, and the bytes of those
+        done. Counted once (a scan of the journal), then kept up to date by the
+        changes made to it."""
+        rows = self._execute(
+            "SELECT state, COUNT(*), COALESCE(SUM(nbytes), 0) FROM urls GROUP BY state"
+        )
+        counts = dict.fromkeys((PENDING, IN_FLIGHT, DONE, FAILED), 0)
+        nbytes = 0
+        for state, n, state_nbytes in rows:
+            counts[state] = n
+            if state == DONE:
+                nbytes = state_nbytes
+        return counts, nbytes
+
+    def _moved(self, from_state: str, to_state: str, n: int = 1):
+        # (called with the lock held, along with the change to the journal)
+        self._counts[from_state] -= n
+        self._counts[to_state] += n
+
+    # ---------------------------------------------------------------------------------
+    # The journal
+
+    def add(self, urls: Iterable[str], *, batch_size: int = 10_000) -> int:
+        """Add urls to the journal (as pending, if not there already). Returns the
+        number of urls added."""
+        added = 0
+        batch = []
+
+        def flush():
+            nonlocal added
+            with self._lock:
+                before = self._db.total_changes
+                self._db.execute("BEGIN")
+                try:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO urls (url) VALUES (?)", batch
+                    )
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._db.execute("COMMIT")
+                n_added = self._db.total_changes - before
+                self._counts[PENDING] += n_added
+                added += n_added
+            batch.clear()
+
+        for url in urls:
+            batch.append((url,))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return added
+
+    def state(self, url: str) -> Optional[str]:
+        """The state of url in the journal (None if it's not in it)."""
+        rows = self._execute("SELECT state FROM urls WHERE url = ?", (url,))
+        return rows[0][0] if rows else None
+
+    def urls(self, state: Optional[str] = None) -> list:
+        """The urls (of a given state, or all), in the order they were added."""
+        if state is None:
+            rows = self._execute("SELECT url FROM urls ORDER BY seq")
+        else:
+            sql = "SELECT url FROM urls WHERE state = ? ORDER BY seq"
+            rows = self._execute(sql, (state,))
+        return [url for url, in rows]
+
+    def failures(self) -> dict:
+        """url -> (status code, error message) of the failed urls."""
+        rows = self._execute(
+            "SELECT url, status_code, error FROM urls WHERE state = ? ORDER BY seq",
+            (FAILED,),
+        )
+        return {url: (status_code, error) for url, status_code, error in rows}
+
+    def retry_failed(self) -> int:
+        """Make failed urls pending again (with a fresh count of attempts)."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE urls SET state = ?, attempts = 0, not_before = 0 "
+                "WHERE state = ?",
+                (PENDING, FAILED),
+            )
+            self._moved(FAILED, PENDING, cursor.rowcount)
+            return cursor.rowcount
+
+    def progress(self) -> Progress:
+        """The ``Progress`` of the download (from counts kept along with the journal,
+        so it costs no query)."""
+        elapsed = 0.0 if self._started is None else self.clock() - self._started
+        with self._lock:
+            return Progress(
+                pending=self._counts[PENDING],
+                in_flight=self._counts[IN_FLIGHT],
+                done=self._counts[DONE],
+                failed=self._counts[FAILED],
+                nbytes=self._nbytes,
+                elapsed=elapsed,
+                done_this_run=self._done_this_run,
+                nbytes_this_run=self._nbytes_this_run,
+            )
+
+    # ---------------------------------------------------------------------------------
+    # Running
+
+    def _recover(self):
+        """Make the urls left in flight (by a run that died) pending again."""
+        self._execute("UPDATE urls SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT))
+        counts, nbytes = self._counted_states()  # (in case the journal was shared)
+        with self._lock:
+            self._counts, self._nbytes = counts, nbytes
+
+    def _claim(self) -> Optional[str]:
+        """Mark the next pending url (that's due) as in flight, and return it.
+
+        The pending urls are walked in the order of the ``(state, seq)`` index, the
+        first one due ending the walk: no sort of the pending urls (only those put
+        off by a retry delay are stepped over)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT seq, url FROM urls INDEXED BY urls_by_state_and_seq "
+                "WHERE state = ? AND not_before <= ? ORDER BY seq LIMIT 1",
+                (PENDING, self.clock()),
+            ).fetchone()
+            if row is None:
+                return None
+            seq, url = row
+            self._db.execute(
+                "UPDATE urls SET state = ?, updated = ? WHERE seq = ?",
+                (IN_FLIGHT, self.clock(), seq),
+            )
+            self._moved(PENDING, IN_FLIGHT)
+            return url
+
+    def _next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending url is due (None if there's none)."""
+        rows = self._execute(
+            "SELECT MIN(not_before) FROM urls WHERE state = ?", (PENDING,)
+        )
+        not_before = rows[0][0]
+        return None if not_before is None else max(not_before - self.clock(), 0.0)
+
+    def _fetch(self, url: str):
+        from graze.base import graze
+
+        try:
+            key = graze(url, return_key=True, **self.graze_kwargs)
+        except Exception as error:
+            self._failed(url, error)
+        else:
+            self._done(url, self._nbytes_of(key))
+
+    def _nbytes_of(self, key: str) -> Optional[int]:
+        """The size of the cached contents of key (the filepath ``graze`` gives for a
+        folder cache, read back from the cache only for a mapping one)."""
+        if os.path.isfile(key):
+            return os.path.getsize(key)
+        cache = self.graze_kwargs["cache"]
+        if cache is None or isinstance(cache, str):
+            return None
+        contents = cache.get(key)
+        return len(contents) if contents is not None else None
+
+    def _done(self, url: str, nbytes: Optional[int]):
+        with self._lock:
+            self._db.execute(
+                "UPDATE urls SET state = ?, nbytes = ?, error = NULL, updated = ? "
+                "WHERE url = ?",
+                (DONE, nbytes, self.clock(), url),
+            )
+            self._moved(IN_FLIGHT, DONE)
+            self._nbytes += nbytes or 0
+            self._done_this_run += 1
+            self._nbytes_this_run += nbytes or 0
+
+    def _failed(self, url: str, error: Exception):
+        error = _error_of(error)
+        with self._lock:
+            (attempts,) = self._db.execute(
+                "SELECT attempts FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            attempts += 1
+            retry = self.retry
+            if attempts < retry.max_attempts and retry.is_retryable(error):
+                state, not_before = PENDING, self.clock() + retry.delay(attempts, error)
+            else:
+                state, not_before = FAILED, 0
+            self._db.execute(
+                "UPDATE urls SET state = ?, attempts = ?, not_before = ?, "
+                "status_code = ?, error = ?, updated = ? WHERE url = ?",
+                (
+                    state,
+                    attempts,
+                    not_before,
+                    status_code_of(error),
+                    f"{type(error).__name__}: {error}"[:1000],
+                    self.clock(),
+                    url,
+                ),
+            )
+            self._moved(IN_FLIGHT, state)
+
+    def run(self, *, max_urls: Optional[int] = None) -> Progress:
+        """Fetch the pending urls (at most ``max_urls`` of them, if given), until
+        there are none left (failed urls being retried according to the policy).
+        Returns the ``Progress`` at the end."""
+        self._recover()
+        self._started = self.clock()
+        self._done_this_run = self._nbytes_this_run = 0
+        n_claimed = 0
+        with (
+            priority_scope(self.priority),
+            ThreadPoolExecutor(self.max_workers) as executor,
+        ):
+            running = set()
+            while True:
+                while len(running) < self.max_workers and (
+                    max_urls is None or n_claimed < max_urls
+                ):
+                    url = self._claim()
+                    if url is None:
+                        break
+                    n_claimed += 1
+                    run = contextvars.copy_context().run  # (with the priority)
+                    running.add(executor.submit(run, self._fetch, url))
+                if not running:
+                    due_in = self._next_due_in()
+                    if due_in is None or (
+                        max_urls is not None and n_claimed >= max_urls
+                    ):
+                        break
+                    self.sleep(due_in)
+                    continue
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # (raising what _fetch didn't handle)
+                    if self.on_progress is not None:
+                        self.on_progress(self.progress())
+        return self.progress()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.journal!r}: {self.progress()})"
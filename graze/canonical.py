@@ -0,0 +1,174 @@
+"""Canonical urls: one cache key for the many ways of writing the same url.
+
+``url_to_localpath`` maps the url as written, so ``http://Host/a?b=1&a=2``,
+``https://host/a?a=2&b=1#top`` and ``https://host:443/a?a=2&b=1`` are three cache
+keys, and three downloads, of the same contents. A ``UrlCanonicalizer`` rewrites a
+url to its canonical form:
+
+- the scheme and host lower-cased, the scheme's default port and the fragment
+  dropped, and an empty path made ``/``;
+- the query parameters sorted (by name, keeping the order of repeated ones), and
+  rid of those a host ignores (tracking parameters like ``utm_source``);
+- share links collapsed to their direct-download url (``resolve_share_url``).
+
+>>> canonical_url('HTTPS://Example.COM:443/a?b=1&utm_source=x&a=2#top')
+'https://example.com/a?a=2&b=1'
+>>> canonical_url('https://drive.google.com/file/d/1AbC/view?usp=sharing')
+'https://drive.google.com/uc?export=download&id=1AbC'
+
+Query parameters are sorted as they're written: never decoded and re-encoded (share
+links carry credentials in their query, that re-encoding could corrupt).
+
+Which parameters a host ignores is configurable, with host patterns (``fnmatch``
+style, as in ``graze.rate_limit.HostScheduler``), ``'*'`` being every host:
+
+>>> canonicalize = UrlCanonicalizer({'*': ['utm_*'], '*.shop.com': ['session']})
+>>> canonicalize('http://www.shop.com/item?session=42&id=7&utm_medium=email')
+'http://www.shop.com/item?id=7'
+
+Canonicalization is opt-in (parameters can matter, and only the user knows which
+don't): give ``canonicalize=True`` (or a ``UrlCanonicalizer``) to ``graze``,
+``Grazer`` or ``GrazeBase``, and urls that canonicalize the same share their cache
+key. The url fetched is still the one asked for.
+
+>>> from graze import graze
+>>> cache = {}
+>>> graze('http://a.com/x?b=1&a=2', cache, source=lambda url: b'1', canonicalize=True)
+b'1'
+>>> graze('http://A.com/x?a=2&b=1#y', cache, source=lambda url: b'2', canonicalize=True)
+b'1'
+"""
+
+from collections.abc import Callable, Iterable, Mapping
+from fnmatch import fnmatchcase
+from typing import Union
+from urllib.parse import urlsplit, urlunsplit
+
+from graze.share_links import resolve_share_url
+
+#: The ports that go without saying, per scheme.
+DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21}
+
+#: Query parameters (``fnmatch`` patterns) that don't change the contents of urls:
+#: those of analytics and ad click tracking.
+DFLT_TRACKING_PARAMS = (
+    "utm_*",
+    "gclid",
+    "dclid",
+    "gbraid",
+    "wbraid",
+    "fbclid",
+    "msclkid",
+    "yclid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "_gl",
+    "igshid",
+)
+
+#: Host pattern -> the query parameters (patterns) ignored in the urls of its hosts.
+DFLT_IGNORED_PARAMS = {"*": DFLT_TRACKING_PARAMS}
+
+
+def _param_name(component: str) -> str:
+    return component.split("=", 1)[0]
+
+
+class UrlCanonicalizer:
+    """Makes the canonical form of urls (see the module's docs).
+
+    Args:
+        ignored_params: Host pattern (``fnmatch`` style, e.g. ``'*.example.com'``)
+            -> the query parameters (names, or ``fnmatch`` patterns) to drop from its
+            urls. The parameters of all matching patterns are dropped.
+        resolve_share_links: Whether to collapse share links (of Dropbox, Google
+            Drive, ...) to their direct-download url.
+    """
+
+    def __init__(
+        self,
+        ignored_params: Mapping[str, Iterable[str]] = DFLT_IGNORED_PARAMS,
+        *,
+        resolve_share_links: bool = True,
+    ):
+        self.ignored_params = {
+            pattern.lower(): tuple(params) for pattern, params in ignored_params.items()
+        }
+        self.resolve_share_links = resolve_share_links
+        self._ignored_params_of_host = {}
+
+    def ignored_params_of(self, host: str) -> tuple:
+        """The query parameters (patterns) ignored in the urls of host."""
+        params = self._ignored_params_of_host.get(host)
+        if params is None:
+            params = tuple(
+                param
+                for pattern, host_params in self.ignored_params.items()
+                if fnmatchcase(host, pattern)
+                for param in host_params
+            )
+            self._ignored_params_of_host[host] = params
+        return params
+
+    def __call__(self, url: str) -> str:
+        """The canonical form of url (url itself if it's not an http(s)/ftp url)."""
+        url = self._normalized(url)
+        if self.resolve_share_links:
+            resolved = resolve_share_url(url)
+            if resolved.provider != "http" and resolved.direct_url is not None:
+                return self._normalized(resolved.direct_url)
+        return url
+
+    def _normalized(self, url: str) -> str:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.netloc:
+            return url
+        try:
+            port = parts.port
+        except ValueError:  # (not a valid port: not a url to make canonical)
+            return url
+        host = (parts.hostname or "").lower()
+        netloc = f"[{host}]" if ":" in host else host
+        if port is not None and port != DEFAULT_PORTS[scheme]:
+            netloc += f":{port}"
+        userinfo, at, _ = parts.netloc.rpartition("@")
+        if at:
+            netloc = f"{userinfo}@{netloc}"
+        query = self._query(host, parts.query)
+        return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+    def _query(self, host: str, query: str) -> str:
+        ignored = self.ignored_params_of(host)
+        components = [
+            component
+            for component in query.split("&")
+            if component
+            and not any(fnmatchcase(_param_name(component), p) for p in ignored)
+        ]
+        return "&".join(sorted(components, key=_param_name))
+
+
+#: The canonical form of a url, with the default ``UrlCanonicalizer``.
+canonical_url = UrlCanonicalizer()
+
+
+def as_canonicalizer(
+    canonicalize: Union[bool, None, Callable[[str], str]],
+) -> Union[None, Callable[[str], str]]:
+    """The function making urls canonical that the ``canonicalize`` argument (of
+    ``graze``, ``Grazer`` and ``GrazeBase``) stands for (None for none).
+
+    >>> as_canonicalizer(True) is canonical_url, as_canonicalizer(False)
+    (True, None)
+    """
+    if canonicalize is True:
+        return canonical_url
+    if canonicalize is None or canonicalize is False:
+        return None
+    if not callable(canonicalize):
+        raise TypeError(
+            f"canonicalize should be a bool or a function of urls: {canonicalize!r}"
+        )
+    return canonicalize
@@ -0,0 +1,263 @@
+"""Per-host circuit breakers: when a host is down, fail fast instead of waiting on it.
+
+When an origin goes down, every fetch from it waits for its connection to time out
+before failing, tying up the caller (or a worker thread) each time. A
+``CircuitBreaker`` watches the outcomes of the requests to each host and, when too
+many of them fail, *opens* the host's circuit: for a cool-down period, requests to it
+fail right away with a ``CircuitOpenError`` (a ``KeyError``, like a failed fetch).
+After the cool-down, the circuit is *half open*: a probe request is let through, and
+its outcome closes the circuit again, or re-opens it for another cool-down. Only a
+probe's outcome does: that of a request that was already under way when the circuit
+opened is ignored while the circuit isn't closed.
+
+>>> now = [0.0]
+>>> breaker = CircuitBreaker(
+...     failure_threshold=0.5, min_requests=4, cooldown=30, clock=lambda: now[0]
+... )
+>>> for _ in range(4):
+...     breaker.record_failure('http://down.com/x')
+>>> breaker.state('down.com')
+'open'
+>>> breaker.check('http://down.com/y')
+Traceback (most recent call last):
+  ...
+graze.circuit_breaker.CircuitOpenError: 'The circuit of down.com is open (4 of the last 4 requests failed): not trying again for 30.0s.'
+
+Other hosts aren't affected:
+
+>>> breaker.state('up.com')
+'closed'
+
+After the cool-down, one probe gets through, and its success closes the circuit:
+
+>>> now[0] += 30
+>>> breaker.state('down.com')
+'half_open'
+>>> probe = breaker.check('http://down.com/y')  # the probe: no error
+>>> breaker.record_success('http://down.com/y', probe=probe)
+>>> breaker.state('down.com')
+'closed'
+
+Only failures that say something about the *host* count: connection errors,
+timeouts, 5xx and 429 statuses (see ``is_host_failure``). A 404 is the url's problem,
+not the host's, so counts as a success.
+
+Give the breaker to an ``Internet``, and its fetches go through it:
+
+>>> from graze import Graze, Internet
+>>> g = Graze(source=Internet(circuit_breaker=CircuitBreaker()))  # doctest: +SKIP
+
+A ``GrazeWithDataRefresh`` whose source's circuit is open hence doesn't wait to give
+you its stale copy.
+"""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from graze.rate_limit import host_of
+from graze.retry import DFLT_RETRY_EXCEPTIONS, status_code_of
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(KeyError):
+    """Raised instead of fetching from a host whose circuit is open."""
+
+    def __init__(self, message, *, host=None, retry_at=None):
+        super().__init__(message)
+        self.host = host
+        self.retry_at = retry_at
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """Whether error says the host (rather than the url) is in trouble.
+
+    >>> from graze.base import RequestFailure
+    >>> is_host_failure(RequestFailure(status_code=503))
+    True
+    >>> is_host_failure(RequestFailure(status_code=404))
+    False
+    >>> is_host_failure(ConnectionRefusedError())
+    True
+    """
+    status_code = status_code_of(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+    return isinstance(error, DFLT_RETRY_EXCEPTIONS)
+
+
+@dataclass
+class _Circuit:
+    """The state of the circuit of one host."""
+
+    outcomes: deque = field(default_factory=deque)  # (time, failed) pairs
+    opened_at: Optional[float] = None
+    probes: set = field(default_factory=set)  # of the probes under way
+
+
+class CircuitBreaker:
+    """Per-host circuit breakers (thread-safe).
+
+    Args:
+        failure_threshold: The fraction of failed requests (in the ``window``) at which
+            a host's circuit opens.
+        min_requests: The number of requests (in the ``window``) needed before the
+            failure rate is taken seriously.
+        window: How far back (in seconds) outcomes are remembered.
+        cooldown: How long (in seconds) an open circuit stays open.
+        half_open_max_calls: How many probe requests a half open circuit lets
+            through at once.
+        is_failure: Says which errors count as failures of the host.
+        clock: The function giving the (monotonic) time.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: float = 0.5,
+        min_requests: int = 5,
+        window: float = 60.0,
+        cooldown: float = 30.0,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[BaseException], bool] = is_host_failure,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.cooldown = cooldown
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+        self.clock = clock
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, host: str) -> _Circuit:
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit()
+        return circuit
+
+    def _state(self, circuit: _Circuit) -> str:
+        if circuit.opened_at is None:
+            return CLOSED
+        if self.clock() - circuit.opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def state(self, host: str) -> str:
+        """The state of the circuit of host: ``'closed'``, ``'open'`` or
+        ``'half_open'``."""
+        with self._lock:
+            return self._state(self._circuit(host))
+
+    def check(self, url: str) -> Optional[object]:
+        """Raise ``CircuitOpenError`` if a request to url shouldn't be made now (else,
+        the request is counted as made: its outcome should be recorded).
+
+        If the request is let through as the probe of a half open circuit, a token
+        is returned, to give to the ``record_*`` method the outcome is recorded with
+        (as ``probe``): only a probe's outcome closes, or re-opens, the circuit.
+        """
+        host = host_of(url)
+        with self._lock:
+            circuit = self._circuit(host)
+            state = self._state(circuit)
+            if state == HALF_OPEN and len(circuit.probes) < self.half_open_max_calls:
+                probe = object()
+                circuit.probes.add(probe)
+                return probe
+            if state != CLOSED:
+                retry_at = circuit.opened_at + self.cooldown
+                failures = sum(failed for _, failed in circuit.outcomes)
+                wait_time = max(retry_at - self.clock(), 0.0)
+                raise CircuitOpenError(
+                    f"The circuit of {host} is open ({failures} of the last "
+                    f"{len(circuit.outcomes)} requests failed): not trying again "
+                    f"for {wait_time:.1f}s.",
+                    host=host,
+                    retry_at=retry_at,
+                )
+
+    def _record(self, url: str, failed: bool, probe: Optional[object] = None) -> None:
+        with self._lock:
+            circuit = self._circuit(host_of(url))
+            now = self.clock()
+            if circuit.opened_at is not None:
+                if probe not in circuit.probes:
+                    return  # a request started before opening: says nothing new
+                if failed:
+                    circuit.opened_at = now
+                else:
+                    circuit.outcomes.clear()
+                    circuit.opened_at = None
+                circuit.probes.clear()  # (the other probes' outcomes are stale too)
+                return
+            outcomes = circuit.outcomes
+            outcomes.append((now, failed))
+            while outcomes and outcomes[0][0] <= now - self.window:
+                outcomes.popleft()
+            failures = sum(f for _, f in outcomes)
+            if (
+                len(outcomes) >= self.min_requests
+                and failures / len(outcomes) >= self.failure_threshold
+            ):
+                circuit.opened_at = now
+
+    def record_success(self, url: str, *, probe: Optional[object] = None) -> None:
+        """Record that a request to url went fine (``probe``: what ``check``
+        returned for it)."""
+        self._record(url, failed=False, probe=probe)
+
+    def record_failure(self, url: str, *, probe: Optional[object] = None) -> None:
+        """Record that a request to url failed because of its host."""
+        self._record(url, failed=True, probe=probe)
+
+    def record_error(
+        self, url: str, error: BaseException, *, probe: Optional[object] = None
+    ) -> None:
+        """Record the outcome of a request to url that raised error."""
+        self._record(url, failed=self.is_failure(error), probe=probe)
+
+    def call(self, func: Callable, url: str, *args, **kwargs):
+        """Call ``func(url, *args, **kwargs)`` through the circuit of url's host."""
+        probe = self.check(url)
+        try:
+            result = func(url, *args, **kwargs)
+        except Exception as error:
+            self.record_error(url, error, probe=probe)
+            raise
+        self.record_success(url, probe=probe)
+        return result
+
+    def iter_call(self, func: Callable[..., Iterable], url: str, *args, **kwargs):
+        """Yield from ``func(url, *args, **kwargs)`` through the circuit of url's
+        host (a failure midway counts as a failure)."""
+        probe = self.check(url)
+        try:
+            yield from func(url, *args, **kwargs)
+        except GeneratorExit:  # the consumer stopped early: the host was fine
+            self.record_success(url, probe=probe)
+            raise
+        except Exception as error:
+            self.record_error(url, error, probe=probe)
+            raise
+        self.record_success(url, probe=probe)
+
+    def reset(self, host: Optional[str] = None) -> None:
+        """Close the circuit of host (of all hosts if None), forgetting outcomes."""
+        with self._lock:
+            if host is None:
+                self._circuits.clear()
+            else:
+                self._circuits.pop(host, None)
+
+    def __repr__(self):
+        with self._lock:
+            states = {h: self._state(c) for h, c in self._circuits.items()}
+        not_closed = {h: s for h, s in states.items() if s != CLOSED}
+        return f"{type(self).__name__}(not closed: {not_closed})"
@@ -0,0 +1,541 @@
+"""The ``graze`` command: fill, inspect and clean up a graze cache from the shell.
+
+Pre-populating a cache before a deploy (or cleaning one up after) shouldn't take an
+ad-hoc script per machine. The ``graze`` console script (also ``python -m graze``)
+works on the same cache folder -- and the same layout -- as ``Graze`` and ``graze``
+(``--cache``, defaulting to ``DFLT_GRAZE_DIR``):
+
+- ``graze fetch urls.txt`` fetches the urls listed in a file (or ``-`` for stdin),
+  in parallel, showing progress. With ``--journal``, the fetch can be interrupted and
+  resumed (see ``graze.bulk.BulkDownload``).
+- ``graze warm manifest.jsonl`` does the same for a manifest that also says, per url,
+  under which ``cache_key`` to keep it and how old (``max_age``, in seconds) a cached
+  copy may be before it's fetched again.
+- ``graze stats`` tells how many urls are cached, and how many bytes they take.
+- ``graze evict`` removes cached urls: given ones, those matching a pattern, or those
+  older than some number of seconds.
+- ``graze verify`` looks for cached contents that can't be right: empty files, and web
+  pages cached for urls of images, videos, and so on.
+
+A manifest has one entry per line: a url, or a json object with a ``url`` and
+(optionally) its ``cache_key`` and ``max_age``. A json list of such entries, or a csv
+file with a header line, works too:
+
+>>> read_manifest([
+...     'http://a.com/x.csv',
+...     '{"url": "http://a.com/y.csv", "cache_key": "y.csv", "max_age": 3600}',
+... ])  # doctest: +NORMALIZE_WHITESPACE
+[{'url': 'http://a.com/x.csv'},
+ {'url': 'http://a.com/y.csv', 'cache_key': 'y.csv', 'max_age': 3600}]
+
+The subcommands are made of functions that can be used directly:
+
+>>> import os, tempfile
+>>> rootdir = tempfile.mkdtemp()
+>>> warm([{'url': 'http://a.com/x.csv'}], rootdir, source=lambda url: b'1,2,3')
+{'http://a.com/x.csv': None}
+>>> cache_stats(rootdir)['files'], cache_stats(rootdir)['bytes']
+(1, 5)
+>>> evict(rootdir, match='*.csv')
+['http://a.com/x.csv']
+>>> cache_stats(rootdir)['files']
+0
+"""
+
+import argparse
+import csv
+import io
+import json
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from fnmatch import fnmatchcase
+from typing import Optional, TextIO
+
+from graze.bandwidth import BACKGROUND, priority_scope
+from graze.base import DFLT_GRAZE_DIR, graze, localpath_to_url, url_to_localpath
+from graze.content_kind import (
+    SNIFF_BYTES,
+    ContentKindMismatch,
+    assert_content_kind,
+)
+from graze.layouts import iter_folder_keys, remove_url_sidecar, write_url_sidecar
+from graze.rate_limit import DFLT_MAX_WORKERS, HostScheduler, host_of
+from graze.util import remove_empty_dirs
+
+# --------------------------------------------------------------------------------------
+# Inputs
+
+
+def read_urls(lines: Iterable[str]) -> list:
+    """The urls of lines (blank lines and ``#`` comments skipped, duplicates dropped).
+
+    >>> read_urls(['http://a.com/1', '', '# a comment', ' http://a.com/2 ', 'http://a.com/1'])
+    ['http://a.com/1', 'http://a.com/2']
+    """
+    urls = (line.strip() for line in lines)
+    return list(dict.fromkeys(url for url in urls if url and not url.startswith("#")))
+
+
+def read_manifest(lines: Iterable[str]) -> list:
+    """The entries (dicts with a ``url``, and maybe a ``cache_key`` and ``max_age``) of
+    a manifest's lines: json lines (or plain urls), a json list, or csv with a header.
+
+    >>> read_manifest(['url,cache_key,max_age', 'http://a.com/x,x.bin,60', 'http://a.com/y,,'])
+    [{'url': 'http://a.com/x', 'cache_key': 'x.bin', 'max_age': 60.0}, {'url': 'http://a.com/y'}]
+    """
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return []
+    first = lines[0].lstrip()
+    if first.startswith("["):
+        entries = json.loads("".join(lines))
+    elif first.startswith("{") or "://" in first.split(",")[0]:
+        entries = [_manifest_line_entry(line) for line in lines]
+        entries = [entry for entry in entries if entry is not None]
+    else:
+        entries = list(csv.DictReader(io.StringIO("".join(_with_newline(lines)))))
+    return [_normalized_entry(entry) for entry in entries]
+
+
+def _with_newline(lines):
+    return (line if line.endswith("\n") else line + "\n" for line in lines)
+
+
+def _manifest_line_entry(line: str) -> Optional[dict]:
+    line = line.strip()
+    if line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        return json.loads(line)
+    return {"url": line}
+
+
+def _normalized_entry(entry) -> dict:
+    if isinstance(entry, str):
+        entry = {"url": entry}
+    if not entry.get("url"):
+        raise ValueError(f"A manifest entry has no url: {entry!r}")
+    normalized = {"url": entry["url"].strip()}
+    if entry.get("cache_key"):
+        normalized["cache_key"] = entry["cache_key"]
+    max_age = entry.get("max_age")
+    if max_age not in (None, ""):
+        normalized["max_age"] = float(max_age) if isinstance(max_age, str) else max_age
+    return normalized
+
+
+def _lines_of(path: str) -> list:
+    """The lines of the file at path (of stdin, if path is ``-``)."""
+    if path == "-":
+        return sys.stdin.readlines()
+    with open(os.path.expanduser(path)) as f:
+        return f.readlines()
+
+
+# --------------------------------------------------------------------------------------
+# The cache folder
+
+
+def cached_files(rootdir: str = DFLT_GRAZE_DIR) -> Iterator[tuple]:
+    """The ``(url, filepath)`` pairs of the urls cached in rootdir (in any layout: see
+    ``graze.layouts``)."""
+    rootdir = os.path.expanduser(rootdir)
+    for key, url in iter_folder_keys(rootdir):
+        yield localpath_to_url(key) if url is None else url, os.path.join(rootdir, key)
+
+
+def cache_stats(rootdir: str = DFLT_GRAZE_DIR, *, top: int = 10) -> dict:
+    """The number of files, bytes, oldest and newest modification times of the
+    cache, and the ``top`` hosts by number of files."""
+    n_files = n_bytes = 0
+    oldest = newest = None
+    hosts = Counter()
+    for url, filepath in cached_files(rootdir):
+        stat = os.stat(filepath)
+        n_files += 1
+        n_bytes += stat.st_size
+        oldest = stat.st_mtime if oldest is None else min(oldest, stat.st_mtime)
+        newest = stat.st_mtime if newest is None else max(newest, stat.st_mtime)
+        hosts[host_of(url)] += 1
+    return {
+        "rootdir": os.path.expanduser(rootdir),
+        "files": n_files,
+        "bytes": n_bytes,
+        "oldest": oldest,
+        "newest": newest,
+        "hosts": dict(hosts.most_common(top)),
+    }
+
+
+def evict(
+    rootdir: str = DFLT_GRAZE_DIR,
+    urls: Iterable[str] = (),
+    *,
+    match: Optional[str] = None,
+    older_than: Optional[float] = None,
+    dry_run: bool = False,
+    clock: Callable[[], float] = time.time,
+) -> list:
+    """Remove the cached urls that are among ``urls``, or match the ``match`` pattern
+    (``fnmatch`` style), or are older than ``older_than`` seconds. Returns the urls
+    removed (that would be removed, with ``dry_run``)."""
+    urls = {url_to_localpath(url) for url in urls}
+    now = clock()
+    evicted = []
+    for url, filepath in cached_files(rootdir):
+        if not (
+            url_to_localpath(url) in urls
+            or (match is not None and fnmatchcase(url, match))
+            or (
+                older_than is not None and now - os.stat(filepath).st_mtime > older_than
+            )
+        ):
+            continue
+        if not dry_run:
+            _remove_cached_file(filepath, rootdir)
+        evicted.append(url)
+    return evicted
+
+
+def _remove_cached_file(filepath: str, rootdir: str):
+    """Remove filepath (and its url sidecar, if any), and the folders it leaves
+    empty"""
+    os.remove(filepath)
+    remove_url_sidecar(filepath)
+    remove_empty_dirs(os.path.dirname(filepath), rootdir)
+
+
+def expected_kind(url: str) -> Optional[str]:
+    """The kind of contents the extension of url announces (if any, and one that
+    ``graze.content_kind`` can check).
+
+    >>> expected_kind('https://a.com/photo.JPG'), expected_kind('https://a.com/page')
+    ('image', None)
+    """
+    mime_type, _ = mimetypes.guess_type(url.lower())
+    if mime_type is None:
+        return None
+    family = mime_type.split("/")[0]
+    if family in ("image", "video", "audio"):
+        return family
+    if mime_type == "application/json":
+        return "json"
+    return None
+
+
+def verify(
+    rootdir: str = DFLT_GRAZE_DIR, *, delete: bool = False, expect_kind=None
+) -> dict:
+    """The problems (url -> description) of the cached contents: empty files, and
+    contents that aren't of the kind their url announces (e.g. a web page cached for
+    an image url). With ``delete``, the faulty files are removed.
+
+    ``expect_kind`` is the kind to expect of all the urls (by default, the one their
+    extension announces, if any).
+    """
+    problems = {}
+    for url, filepath in cached_files(rootdir):
+        with open(filepath, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+        if not head:
+            problems[url] = "empty file"
+        elif kind := expect_kind or expected_kind(url):
+            try:
+                assert_content_kind(head, expect_kind=kind, url=url)
+            except ContentKindMismatch as error:
+                problems[url] = str(error)
+        if delete and url in problems:
+            _remove_cached_file(filepath, rootdir)
+    return problems
+
+
+# --------------------------------------------------------------------------------------
+# Fetching
+
+
+def warm(
+    entries: Iterable[dict],
+    rootdir: str = DFLT_GRAZE_DIR,
+    *,
+    source=None,
+    max_age: Optional[float] = None,
+    max_workers: int = DFLT_MAX_WORKERS,
+    on_done: Optional[Callable[[str, Optional[Exception]], None]] = None,
+) -> dict:
+    """Make sure the urls of the (manifest) entries are cached (and fresh) in rootdir.
+
+    Each entry is a dict with a ``url``, and maybe the ``cache_key`` and ``max_age``
+    to ``graze`` it with (``max_age`` defaulting to the one given here). The urls are
+    fetched in parallel (round-robin over their hosts, with the ``BACKGROUND``
+    priority), and ``on_done(url, error)`` is called as each one is done. The url of
+    a ``cache_key`` is kept in its sidecar (see ``graze.layouts``), so that ``stats``,
+    ``evict`` and ``verify`` see the url rather than the key.
+
+    Returns the error (None for a success) of each url.
+    """
+    entries = {entry["url"]: entry for entry in entries}
+
+    def warm_one(url):
+        entry = entries[url]
+        error = None
+        try:
+            filepath = graze(
+                url,
+                rootdir,
+                cache_key=entry.get("cache_key"),
+                source=source,
+                max_age=entry.get("max_age", max_age),
+                return_key=True,
+            )
+            if entry.get("cache_key"):
+                write_url_sidecar(filepath, url, replace=True)
+        except Exception as e:
+            error = e
+        if on_done is not None:
+            on_done(url, error)
+        return error
+
+    with priority_scope(BACKGROUND):
+        errors = HostScheduler().map(warm_one, entries, max_workers=max_workers)
+    return dict(zip(entries, errors))
+
+
+class _ProgressLine:
+    """Writes progress to a stream: overwriting a single line on a terminal, a line
+    per update (at most every ``interval`` seconds) otherwise."""
+
+    def __init__(self, stream: TextIO, *, interval: float = 1.0):
+        self.stream = stream
+        self.interval = interval
+        self._is_tty = stream.isatty()
+        self._last = 0.0
+
+    def __call__(self, text: str, *, final: bool = False):
+        now = time.monotonic()
+        if self._is_tty:
+            self.stream.write(f"\r\033[K{text}" + ("\n" if final else ""))
+        elif final or now - self._last >= self.interval:
+            self.stream.write(text + "\n")
+        else:
+            return
+        self._last = now
+        self.stream.flush()
+
+
+def _fetch_command(args) -> int:
+    from graze.bulk import BulkDownload
+
+    urls = read_urls(_lines_of(args.urls))
+    report = _ProgressLine(sys.stderr) if not args.quiet else None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        journal = args.journal or os.path.join(tmpdir, "journal.sqlite")
+        with BulkDownload(
+            journal,
+            cache=args.cache,
+            refresh=args.refresh,
+            max_age=args.max_age,
+            max_workers=args.workers,
+            on_progress=report and (lambda progress: report(str(progress))),
+        ) as bulk:
+            bulk.add(urls)
+            progress = bulk.run()
+            if report:
+                report(str(progress), final=True)
+            for url, error in bulk.failures().items():
+                print(f"failed: {url}: {error}", file=sys.stderr)
+    return 1 if progress.failed else 0
+
+
+def _warm_command(args) -> int:
+    entries = read_manifest(_lines_of(args.manifest))
+    report = _ProgressLine(sys.stderr) if not args.quiet else None
+    n_done = n_failed = 0
+
+    def on_done(url, error):
+        nonlocal n_done, n_failed
+        n_done += 1
+        n_failed += error is not None
+        if report:
+            report(f"{n_done}/{len(entries)} urls warmed ({n_failed} failed)")
+
+    errors = warm(
+        entries,
+        args.cache,
+        max_age=args.max_age,
+        max_workers=args.workers,
+        on_done=on_done,
+    )
+    if report:
+        report(f"{n_done}/{len(entries)} urls warmed ({n_failed} failed)", final=True)
+    for url, error in errors.items():
+        if error is not None:
+            print(f"failed: {url}: {error}", file=sys.stderr)
+    return 1 if n_failed else 0
+
+
+def _stats_command(args) -> int:
+    stats = cache_stats(args.cache)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return 0
+    print(f"{stats['rootdir']}: {stats['files']} urls, {_human_size(stats['bytes'])}")
+    if stats["files"]:
+        print(f"oldest: {_timestamp(stats['oldest'])}")
+        print(f"newest: {_timestamp(stats['newest'])}")
+        for host, n_files in stats["hosts"].items():
+            print(f"  {n_files:>8}  {host}")
+    return 0
+
+
+def _evict_command(args) -> int:
+    if not (args.urls or args.match or args.older_than is not None):
+        print("Nothing to evict: give urls, --match or --older-than", file=sys.stderr)
+        return 2
+    evicted = evict(
+        args.cache,
+        args.urls,
+        match=args.match,
+        older_than=args.older_than,
+        dry_run=args.dry_run,
+    )
+    for url in evicted:
+        print(url)
+    verb = "would be evicted" if args.dry_run else "evicted"
+    print(f"{len(evicted)} urls {verb}", file=sys.stderr)
+    return 0
+
+
+def _verify_command(args) -> int:
+    problems = verify(args.cache, delete=args.delete, expect_kind=args.expect_kind)
+    for url, problem in problems.items():
+        print(f"{url}: {problem}")
+    if args.delete and problems:
+        print(f"{len(problems)} faulty files deleted", file=sys.stderr)
+    return 1 if problems and not args.delete else 0
+
+
+def _human_size(nbytes: float) -> str:
+    """
+    >>> _human_size(1536), _human_size(12)
+    ('1.5 KB', '12 B')
+    """
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if nbytes < 1024 or unit == "TB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def _timestamp(seconds: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seconds))
+
+
+# --------------------------------------------------------------------------------------
+# The command line
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """The parser of the ``graze`` command's arguments."""
+    parser = argparse.ArgumentParser(
+        prog="graze", description="Fill, inspect and clean up a graze cache."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_subparser(name, func, help):
+        subparser = subparsers.add_parser(name, help=help, description=help)
+        subparser.add_argument(
+            "--cache",
+            default=DFLT_GRAZE_DIR,
+            help="The cache folder (default: %(default)s)",
+        )
+        subparser.set_defaults(func=func)
+        return subparser
+
+    def add_fetch_options(subparser):
+        subparser.add_argument(
+            "-j",
+            "--workers",
+            type=int,
+            default=DFLT_MAX_WORKERS,
+            help="The number of urls fetched at once (default: %(default)s)",
+        )
+        subparser.add_argument(
+            "--max-age",
+            type=float,
+            default=None,
+            help="Fetch again urls cached more than this many seconds ago",
+        )
+        subparser.add_argument(
+            "-q", "--quiet", action="store_true", help="Don't show progress"
+        )
+
+    fetch_parser = add_subparser(
+        "fetch", _fetch_command, "Fetch (and cache) the urls listed in a file."
+    )
+    fetch_parser.add_argument(
+        "urls", help="The file of urls, one per line (- for stdin)"
+    )
+    add_fetch_options(fetch_parser)
+    fetch_parser.add_argument(
+        "--refresh", action="store_true", help="Fetch urls even if they're cached"
+    )
+    fetch_parser.add_argument(
+        "--journal",
+        help="A journal file, to be able to resume an interrupted fetch",
+    )
+
+    warm_parser = add_subparser(
+        "warm",
+        _warm_command,
+        "Cache the urls of a manifest, with their cache_key and max_age.",
+    )
+    warm_parser.add_argument("manifest", help="The manifest file (- for stdin)")
+    add_fetch_options(warm_parser)
+
+    stats_parser = add_subparser("stats", _stats_command, "Show what's in the cache.")
+    stats_parser.add_argument("--json", action="store_true", help="Output json")
+
+    evict_parser = add_subparser("evict", _evict_command, "Remove urls from the cache.")
+    evict_parser.add_argument("urls", nargs="*", help="The urls to remove")
+    evict_parser.add_argument(
+        "--match", help="Remove the urls matching this (fnmatch) pattern"
+    )
+    evict_parser.add_argument(
+        "--older-than",
+        type=float,
+        default=None,
+        help="Remove the urls cached more than this many seconds ago",
+    )
+    evict_parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="Only list what would be removed"
+    )
+
+    verify_parser = add_subparser(
+        "verify",
+        _verify_command,
+        "Find cached contents that can't be right (empty, or of the wrong kind).",
+    )
+    verify_parser.add_argument(
+        "--delete", action="store_true", help="Delete the faulty files"
+    )
+    verify_parser.add_argument(
+        "--expect-kind",
+        choices=["image", "video", "audio", "json"],
+        help="The kind all urls should be (default: the one of their extension)",
+    )
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Run the ``graze`` command (with argv, defaulting to ``sys.argv[1:]``), and
+    return its exit status."""
+    args = make_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
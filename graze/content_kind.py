@@ -41,11 +41,13 @@ This module is dependency-free and network-free, like :mod:`graze.share_links`.
 
 from __future__ import annotations
 
+from functools import partial
 from typing import Iterable, Iterator, Optional
 
 __all__ = [
     "ContentKindMismatch",
     "SNIFF_BYTES",
+    "ANY_KIND",
     "sniff_content_family",
     "assert_content_kind",
     "kind_checked",
@@ -53,7 +55,17 @@ __all__ = [
 
 
 class ContentKindMismatch(ValueError):
-    """The fetched bytes are not the kind of thing that was asked for."""
+    """The fetched bytes are not the kind of thing that was asked for.
+
+    ``family`` is what they sniffed as, and ``head`` the leading bytes that were sniffed
+    (so a caller that can make something of a refused stream -- the HTML of an
+    interstitial, say -- needn't fetch it again).
+    """
+
+    def __init__(self, *args, family: Optional[str] = None, head: bytes = b""):
+        super().__init__(*args)
+        self.family = family
+        self.head = head
 
 
 #: How many leading bytes are enough to classify a payload. Every signature this module
@@ -61,6 +73,10 @@ class ContentKindMismatch(ValueError):
 #: on a text-shaped payload.
 SNIFF_BYTES = 512
 
+#: The ``expect_kind`` of a payload whose kind isn't known (or doesn't matter): anything
+#: but an HTML page passes.
+ANY_KIND = "any"
+
 
 _MAGIC_PREFIXES: tuple[tuple[bytes, str], ...] = (
     (b"\x89PNG\r\n\x1a\n", "image"),
@@ -366,7 +382,9 @@ def assert_content_kind(
     - a recognised media family that **disagrees** with ``expect_kind`` is refused — the
       assertion is against what was asked for, not merely against "not a web page";
     - **except audio against video**, allowed both ways (see the module docstring);
-    - an **unrecognised** payload passes.
+    - an **unrecognised** payload passes;
+    - with ``expect_kind=ANY_KIND``, only HTML is refused (an archive, or any family, is
+      what was asked for).
 
     Args:
         head: The leading bytes of the payload (see :data:`SNIFF_BYTES`).
@@ -380,15 +398,19 @@ def assert_content_kind(
     Traceback (most recent call last):
         ...
     graze.content_kind.ContentKindMismatch: expected video bytes, got an archive...
+    >>> assert_content_kind(b'PK\\x03\\x04', expect_kind=ANY_KIND)  # passes
     """
     family = sniff_content_family(head)
     if family is None or family == expect_kind:
         return
     if family in _CONTAINER_AMBIGUOUS and expect_kind in _CONTAINER_AMBIGUOUS:
         return
+    if expect_kind == ANY_KIND and family != "html":
+        return
     where = f" from {url}" if url else ""
+    mismatch = partial(ContentKindMismatch, family=family, head=head)
     if family == "html":
-        raise ContentKindMismatch(
+        raise mismatch(
             f"expected {expect_kind} bytes{where}, got an HTML page. The server answered "
             f"with a web page (an error, login or preview page) rather than the media "
             f"itself — refusing to store it as a {expect_kind}. The usual cause is a "
@@ -396,12 +418,12 @@ def assert_content_kind(
             f"direct-download URL."
         )
     if family == "archive":
-        raise ContentKindMismatch(
+        raise mismatch(
             f"expected {expect_kind} bytes{where}, got an archive (ZIP/gzip). A folder "
             f"share link downloads as a single archive of many files — expand it into one "
             f"asset per member, or share the individual file instead."
         )
-    raise ContentKindMismatch(
+    raise mismatch(
         f"expected {expect_kind} bytes{where}, got {family} — refusing to store it under "
         f"the wrong kind."
     )
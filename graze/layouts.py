@@ -0,0 +1,263 @@
+"""Cache key layouts: where, under the cache's folder, the contents of a url go.
+
+The default layout, ``graze.base.url_to_localpath``, mirrors the url: readable, but
+as deep as the url, with as many entries in a folder as a host has urls under the
+same path. The *sharded* layout puts a url's contents at a fixed depth, under the
+(sha256) digest of the url, spread evenly over ``16 ** (width * depth)`` folders:
+
+>>> sharded_localpath('http://www.example.com/subdir/file.txt')
+'fa/0b/fa0bd0c1512ecc8982adfed54841d121b76c1a0e78382a4d471718f93e65c446'
+
+A digest can't be turned back into its url, so the url of a key whose file name is a
+digest (``is_digest_name``) is kept in a *sidecar*: a hidden file next to it.
+
+>>> url_sidecar_key('fa/0b/fa0bd0c1512ecc8982adfed54841d121b76c1a0e78382a4d471718f93e65c446')
+'fa/0b/.fa0bd0c1512ecc8982adfed54841d121b76c1a0e78382a4d471718f93e65c446.url'
+
+graze writes it along with the contents, and ``iter_folder_keys`` (which ``Graze``,
+``GrazeBase`` and the ``graze`` command iterate with) reads it to give the url back.
+So a sharded cache is a ``GrazeBase`` option:
+
+>>> from graze.base import GrazeBase
+>>> g = GrazeBase('~/graze_sharded', layout='sharded')  # doctest: +SKIP
+>>> list(g)  # doctest: +SKIP
+['http://www.example.com/subdir/file.txt', ...]
+
+``graze._migration_tools.migrate_layout`` moves the files of an existing cache to
+another layout.
+
+Digests are also the fallback of the nested layout, for urls it can't mirror: those
+with a component too long to be a file name (long query strings, typically), or one
+that's not a file name (like ``..``). Their key keeps the (safe) leading folders,
+and a readable prefix of the file name, before the digest:
+
+>>> from graze.base import url_to_localpath
+>>> url_to_localpath('http://a.com/q?x=' + 'y' * 300)  # doctest: +ELLIPSIS
+'http/a.com_f/q?x=yyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyyy~97c1249222c98e8d...'
+
+Graze writes their sidecar along with their contents too, so that ``Graze`` and
+``GrazeBase`` iterate over their true urls (and ``localpath_to_url`` gives it, given
+the cache's folder). So does ``graze warm``, for the keys of its manifest's choosing
+(a ``cache_key``, which needn't be a digest, and says nothing of its url either).
+"""
+
+import errno
+import hashlib
+import os
+import re
+from collections.abc import Iterator, Sequence
+from itertools import takewhile
+from typing import Optional
+
+#: The suffix of the (hidden) files holding the url of the file they're named after.
+URL_SIDECAR_SUFFIX = ".url"
+#: The separator of the readable part and the digest, in a digest file name.
+DIGEST_SEPARATOR = "~"
+#: The files, at the root of a cache folder, that aren't keys but graze's own (the
+#: exceptions file of ``graze.graze_exceptional``).
+NON_KEY_ROOT_NAMES = frozenset({"_exceptions.json"})
+
+#: The most bytes of a file name of a key: ``NAME_MAX``. (The names of the temporary
+#: files of downloads are shortened to fit it, and sidecars are only those of digest
+#: names, that are short.)
+MAX_NAME_BYTES = 255
+#: The most bytes of a key: ``PATH_MAX`` (4096), less its terminating NUL.
+MAX_KEY_BYTES = 4096 - 1
+#: The most bytes of the folders a digest key keeps (of the key it replaces): less
+#: than ``MAX_KEY_BYTES``, leaving room for the cache's folder.
+MAX_FALLBACK_FOLDERS_BYTES = 3072
+#: The most bytes of the readable prefix of a digest file name.
+READABLE_PREFIX_BYTES = 48
+
+_DIGEST_NAME = re.compile(rf"(?:^|{re.escape(DIGEST_SEPARATOR)})[0-9a-f]{{64}}$")
+
+
+def url_digest(url: str) -> str:
+    """The (hex, sha256) digest of url.
+
+    >>> url_digest('http://a.com/x')[:16]
+    '8dd9d9806db106ee'
+    """
+    return hashlib.sha256(url.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def sharded_localpath(url: str, *, depth: int = 2, width: int = 2) -> str:
+    """The path of url in the sharded layout: ``depth`` folders, named after the
+    first ``width`` characters of the url's digest each, and the digest.
+
+    >>> sharded_localpath('http://a.com/x', depth=1, width=3)  # doctest: +ELLIPSIS
+    '8dd/8dd9d9806db106ee...'
+    """
+    digest = url_digest(url)
+    shards = [digest[i * width : (i + 1) * width] for i in range(depth)]
+    return "/".join(shards + [digest])
+
+
+def _n_bytes(name: str) -> int:
+    return len(name.encode("utf-8", "surrogatepass"))
+
+
+def is_safe_name(name: str) -> bool:
+    """Whether name can be the name of a file (or folder) of a key.
+
+    >>> is_safe_name('file.txt'), is_safe_name('..'), is_safe_name('x' * 300)
+    (True, False, False)
+    """
+    return (
+        name not in ("", ".", "..")
+        and "\0" not in name
+        and _n_bytes(name) <= MAX_NAME_BYTES
+    )
+
+
+def digest_name(url: str, readable: str = "") -> str:
+    """The file name of url made of (a prefix of) readable, and the digest of url.
+
+    >>> digest_name('http://a.com/x', 'x')  # doctest: +ELLIPSIS
+    'x~8dd9d9806db106ee...'
+    """
+    prefix = readable.replace("\0", "").encode("utf-8", "surrogatepass")
+    prefix = prefix[:READABLE_PREFIX_BYTES].decode("utf-8", "ignore")
+    return f"{prefix}{DIGEST_SEPARATOR}{url_digest(url)}"
+
+
+def fallback_localpath(url: str, components: Sequence[str]) -> str:
+    """The key of url when the components of its key can't all be file names, or
+    make a key too long: the leading safe (folder) components, and a
+    ``digest_name`` of url, with a prefix of its last component (its url is then
+    kept in a sidecar).
+
+    >>> fallback_localpath('http://a.com/..', ['http', 'a.com_f', '..'])  # doctest: +ELLIPSIS
+    'http/a.com_f/..~...'
+    """
+    folders, n_bytes = [], 0
+    for folder in takewhile(is_safe_name, components[:-1]):
+        n_bytes += _n_bytes(folder) + 1
+        if n_bytes > MAX_FALLBACK_FOLDERS_BYTES:
+            break
+        folders.append(folder)
+    readable = components[-1] if components else ""
+    return "/".join(folders + [digest_name(url, readable)])
+
+
+def is_digest_name(name: str) -> bool:
+    """Whether name (a file name, or key) ends with a digest, so that its url is in
+    a sidecar.
+
+    >>> is_digest_name(sharded_localpath('http://a.com/x'))
+    True
+    >>> is_digest_name('report~' + url_digest('http://a.com/x'))
+    True
+    >>> is_digest_name('file.txt')
+    False
+    """
+    return isinstance(name, str) and bool(_DIGEST_NAME.search(os.path.basename(name)))
+
+
+def url_sidecar_key(key: str) -> str:
+    """The key (path) of the sidecar holding the url of key."""
+    dirname, name = os.path.split(key)
+    return os.path.join(dirname, f".{name}{URL_SIDECAR_SUFFIX}")
+
+
+def _is_url_sidecar_name(name: str) -> bool:
+    return (
+        name.startswith(".")
+        and name.endswith(URL_SIDECAR_SUFFIX)
+        and _DIGEST_NAME.search(name[1 : -len(URL_SIDECAR_SUFFIX)]) is not None
+    )
+
+
+def is_url_sidecar_key(key: str) -> bool:
+    """Whether key is that of a url sidecar.
+
+    >>> is_url_sidecar_key(url_sidecar_key(sharded_localpath('http://a.com/x')))
+    True
+    >>> is_url_sidecar_key('http/a.com_f/.hidden.url')
+    False
+    """
+    return isinstance(key, str) and _is_url_sidecar_name(os.path.basename(key))
+
+
+def _is_sidecar_of_one_of(name: str, names: set) -> bool:
+    # (the sidecar of a key that isn't a digest: one of names, next to it)
+    return (
+        name.startswith(".")
+        and name.endswith(URL_SIDECAR_SUFFIX)
+        and name[1 : -len(URL_SIDECAR_SUFFIX)] in names
+    )
+
+
+def _is_partial_download_name(name: str) -> bool:
+    # (the temporary files of graze.util.tee_chunks_to_file)
+    return name.startswith(".") and name.endswith(".part")
+
+
+def write_url_sidecar(filepath: str, url: str, *, replace: bool = False) -> bool:
+    """Write the url sidecar of (the file at) filepath, unless there's one already
+    (it's the same url: the name is its digest) -- or, with ``replace`` (for a name
+    that isn't a digest), over it. Returns whether it was written."""
+    sidecar = url_sidecar_key(filepath)
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if replace else os.O_EXCL)
+    try:
+        fd = os.open(sidecar, flags, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "wb") as f:
+        f.write(url.encode("utf-8", "surrogatepass"))
+    return True
+
+
+def read_url_sidecar(filepath: str) -> Optional[str]:
+    """The url in the sidecar of (the file at) filepath (None if there's none)."""
+    try:
+        with open(url_sidecar_key(filepath), "rb") as f:
+            return f.read().decode("utf-8", "surrogatepass")
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def remove_url_sidecar(filepath: str):
+    """Remove the url sidecar of (the file at) filepath, if there's one."""
+    try:
+        os.remove(url_sidecar_key(filepath))
+    except OSError as error:
+        if error.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+
+
+def iter_folder_keys(rootdir: str) -> Iterator[tuple[str, Optional[str]]]:
+    """Yield the ``(key, url)`` pairs of the files of the cache folder rootdir: the
+    key (path relative to rootdir) of each, and the url of its sidecar (None if it
+    has none, its url then being that of its key in the layout).
+
+    Sidecars (of digest names, and of any file next to them), the temporary files of
+    downloads under way, and graze's own files at the root (``NON_KEY_ROOT_NAMES``)
+    aren't keys.
+
+    >>> import tempfile
+    >>> rootdir = tempfile.mkdtemp()
+    >>> key = sharded_localpath('http://a.com/x')
+    >>> os.makedirs(os.path.join(rootdir, os.path.dirname(key)))
+    >>> _ = open(os.path.join(rootdir, key), 'wb').write(b'contents')
+    >>> write_url_sidecar(os.path.join(rootdir, key), 'http://a.com/x')
+    True
+    >>> [(k == key, url) for k, url in iter_folder_keys(rootdir)]
+    [(True, 'http://a.com/x')]
+    """
+    rootdir = os.path.expanduser(rootdir)
+    for root, dirs, files in os.walk(rootdir):
+        names = set(files)
+        at_root = root == rootdir
+        for name in files:
+            if _is_url_sidecar_name(name) or _is_partial_download_name(name):
+                continue
+            if _is_sidecar_of_one_of(name, names):
+                continue
+            if at_root and name in NON_KEY_ROOT_NAMES:
+                continue
+            filepath = os.path.join(root, name)
+            url = None
+            if f".{name}{URL_SIDECAR_SUFFIX}" in names:
+                url = read_url_sidecar(filepath)
+            yield os.path.relpath(filepath, rootdir), url
@@ -0,0 +1,244 @@
+"""Mirrors and hedged requests: get one asset from whichever of its copies is fastest.
+
+When an asset is available from several equivalent urls (mirrors), one slow mirror
+needn't set the pace. ``hedged_fetch`` asks the first mirror and, if it hasn't
+answered within ``hedge_after`` seconds (or failed), also asks the next one -- and so
+on. The first to deliver wins; the others are cancelled (they stop at their next
+chunk, closing their connection).
+
+>>> import time
+>>> def fetch_chunks(url):  # a stand-in for Internet().iter_chunks
+...     if 'slow' in url:
+...         time.sleep(0.5)
+...     yield f'contents from {url}'.encode()
+>>> hedged_fetch(
+...     fetch_chunks, ['http://slow.mirror/x', 'http://fast.mirror/x'], hedge_after=0.05
+... )
+b'contents from http://fast.mirror/x'
+
+The latency (and failures) of mirrors are remembered in ``MirrorStats``, per host,
+and used to ask the best mirror first next time:
+
+>>> stats = MirrorStats()
+>>> stats.record('http://slow.mirror/a', 2.0)
+>>> stats.record('http://fast.mirror/a', 0.1)
+>>> stats.rank(['http://slow.mirror/b', 'http://fast.mirror/b', 'http://new.mirror/b'])
+['http://new.mirror/b', 'http://fast.mirror/b', 'http://slow.mirror/b']
+
+(Mirrors never tried come first, so as to learn about them.)
+
+With ``graze``, or a ``GrazeBase``, give the ``mirrors`` of urls: a list of urls
+equivalent to the one asked for, or a function giving them. The contents are
+cached under the url asked for, whichever mirror they came from:
+
+>>> from graze import graze
+>>> contents = graze(
+...     'https://a.org/data.csv', mirrors=['https://b.org/data.csv']
+... )  # doctest: +SKIP
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Optional, Union
+
+from graze.rate_limit import host_of
+
+DFLT_HEDGE_AFTER = 1.0
+
+Mirrors = Union[Iterable[str], Callable[[str], Iterable[str]]]
+
+
+class MirrorStats:
+    """Per-host moving averages of the latency and failure rate of mirrors
+    (thread-safe).
+
+    Args:
+        smoothing: The weight of a new observation in the moving averages.
+        failure_penalty: The seconds of latency a failure rate of 1 is worth, when
+            ranking mirrors.
+    """
+
+    def __init__(self, *, smoothing: float = 0.3, failure_penalty: float = 10.0):
+        self.smoothing = smoothing
+        self.failure_penalty = failure_penalty
+        self._latency = {}
+        self._failure_rate = {}
+        self._lock = threading.Lock()
+
+    def _update(self, averages: dict, host: str, value: float):
+        previous = averages.get(host)
+        if previous is None:
+            averages[host] = value
+        else:
+            averages[host] = previous + self.smoothing * (value - previous)
+
+    def record(self, url: str, latency: Optional[float], *, failed: bool = False):
+        """Record the latency (if known) of a request to url, and whether it failed."""
+        host = host_of(url)
+        with self._lock:
+            if latency is not None:
+                self._update(self._latency, host, latency)
+            self._update(self._failure_rate, host, float(failed))
+
+    def score(self, url: str) -> float:
+        """The expected cost (in seconds) of asking url (0.0 if never asked)."""
+        host = host_of(url)
+        with self._lock:
+            latency = self._latency.get(host, 0.0)
+            failure_rate = self._failure_rate.get(host, 0.0)
+        return latency + failure_rate * self.failure_penalty
+
+    def rank(self, urls: Iterable[str]) -> list:
+        """The urls, best first (ties keep their order)."""
+        return sorted(urls, key=self.score)
+
+    def __repr__(self):
+        with self._lock:
+            latencies = {h: round(t, 3) for h, t in self._latency.items()}
+        return f"{type(self).__name__}(latencies={latencies})"
+
+
+#: The stats used when none are given, so that they build up over a session.
+DFLT_MIRROR_STATS = MirrorStats()
+
+
+def mirrors_of(url: str, mirrors: Mirrors) -> list:
+    """url, followed by its mirrors (without duplicates).
+
+    >>> mirrors_of('http://a/x', lambda url: [url.replace('a', 'b'), url])
+    ['http://a/x', 'http://b/x']
+    """
+    if callable(mirrors):
+        mirrors = mirrors(url)
+    return list(dict.fromkeys([url, *mirrors]))
+
+
+class _Cancelled(Exception):
+    """Raised (and caught) in a fetch that lost the race."""
+
+
+def hedged_fetch(
+    fetch_chunks: Callable[[str], Iterable[bytes]],
+    urls: Iterable[str],
+    *,
+    hedge_after: float = DFLT_HEDGE_AFTER,
+    stats: Optional[MirrorStats] = None,
+    clock: Callable[[], float] = time.monotonic,
+) -> bytes:
+    """Get the contents of the first of the (equivalent) urls to deliver them.
+
+    The urls are asked in order: the next one when the previous ones have been
+    running for ``hedge_after`` seconds without result, or have all failed. When one
+    completes, the others are cancelled. If they all fail, the last error is raised.
+
+    Args:
+        fetch_chunks: Gives the contents of a url, in chunks (the loser of a race is
+            stopped between chunks).
+        urls: The equivalent urls, in the order to ask them.
+        hedge_after: The seconds to wait for a result before asking the next url.
+        stats: Where to record the latencies and failures of the urls.
+        clock: The function giving the (monotonic) time.
+    """
+    urls = list(urls)
+    if not urls:
+        raise ValueError("No urls to fetch from")
+    outcomes = queue.Queue()
+    cancelled = threading.Event()
+
+    def fetch(url):
+        started = clock()
+        chunks = []
+        try:
+            chunk_iterator = iter(fetch_chunks(url))
+            try:
+                for chunk in chunk_iterator:
+                    if cancelled.is_set():
+                        raise _Cancelled()
+                    chunks.append(chunk)
+            finally:
+                if hasattr(chunk_iterator, "close"):
+                    chunk_iterator.close()  # (closing the connection, if any)
+        except _Cancelled:
+            if stats is not None:  # it was at least this slow
+                stats.record(url, clock() - started)
+        except Exception as error:
+            if stats is not None:
+                stats.record(url, None, failed=True)
+            outcomes.put((url, error, None))
+        else:
+            if stats is not None:
+                stats.record(url, clock() - started)
+            outcomes.put((url, None, b"".join(chunks)))
+
+    pending = iter(urls)
+    running = 0
+    error = None
+
+    def start_next():
+        url = next(pending, None)
+        if url is None:
+            return 0
+        run = contextvars.copy_context().run  # (carrying the timeout scope over)
+        threading.Thread(target=run, args=(fetch, url), daemon=True).start()
+        return 1
+
+    running += start_next()
+    while running:
+        try:
+            url, error_of_url, contents = outcomes.get(timeout=hedge_after)
+        except queue.Empty:
+            running += start_next()  # hedge
+            continue
+        running -= 1
+        if error_of_url is None:
+            cancelled.set()
+            return contents
+        error = error_of_url
+        running += start_next()  # a failure: don't wait for hedge_after
+    raise error
+
+
+class HedgedSource:
+    """A source getting urls from the best of their mirrors, hedging slow ones (see
+    ``hedged_fetch``).
+
+    Args:
+        source: The source to get the mirrors' contents from (chunk-wise if it has an
+            ``iter_chunks`` method, as ``Internet`` does). Defaults to ``Internet()``.
+        mirrors: The mirrors of a url: the same urls for all (for a one-url
+            source), or a function of the url.
+        hedge_after: The seconds to wait for a result before asking the next mirror.
+        stats: Where latencies are recorded, and mirrors ranked from. Defaults to
+            ``DFLT_MIRROR_STATS``.
+    """
+
+    def __init__(
+        self,
+        source=None,
+        mirrors: Mirrors = (),
+        *,
+        hedge_after: float = DFLT_HEDGE_AFTER,
+        stats: Optional[MirrorStats] = None,
+    ):
+        if source is None:
+            from graze.base import Internet
+
+            source = Internet()
+        self.source = source
+        self.mirrors = mirrors
+        self.hedge_after = hedge_after
+        self.stats = DFLT_MIRROR_STATS if stats is None else stats
+
+    def _iter_chunks(self, url: str) -> Iterator[bytes]:
+        from graze.base import DFLT_STREAM_CHK_SIZE, _iter_source_chunks
+
+        return _iter_source_chunks(self.source, url, DFLT_STREAM_CHK_SIZE)
+
+    def __getitem__(self, url: str) -> bytes:
+        urls = self.stats.rank(mirrors_of(url, self.mirrors))
+        return hedged_fetch(
+            self._iter_chunks, urls, hedge_after=self.hedge_after, stats=self.stats
+        )
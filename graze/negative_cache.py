@@ -0,0 +1,179 @@
+"""Remembering failed fetches, so that known-dead urls aren't re-fetched every time.
+
+A ``Graze`` remembers what it *got*. Without a negative cache, it forgets what it
+*didn't* get: a loop over a list of urls containing dead links hits the network for
+each of them, on every run. A ``NegativeCache`` records failures (status code,
+time, reason) and answers "is this url known to fail?" for a time-to-live that
+depends on the status:
+
+>>> now = [1000.0]
+>>> nc = NegativeCache(ttls={404: 60, '5xx': 10}, clock=lambda: now[0])
+>>> nc.record('http://a.com/gone', 404)
+>>> nc.record('http://a.com/down', 503)
+>>> nc.record('http://a.com/forbidden', 403)  # no ttl for 403: not remembered
+>>> sorted(nc)
+['http://a.com/down', 'http://a.com/gone']
+>>> nc['http://a.com/gone'].status_code
+404
+
+Entries expire after their ttl:
+
+>>> now[0] += 30
+>>> list(nc)
+['http://a.com/gone']
+
+...and the ttl backs off: each consecutive failure of a url doubles it (up to
+``max_ttl``), so a url that keeps failing is re-probed less and less often:
+
+>>> nc.record('http://a.com/gone', 404)
+>>> nc['http://a.com/gone'].failures, nc['http://a.com/gone'].ttl
+(2, 120)
+
+A success (``forget``), or ``clear``, removes entries:
+
+>>> nc.forget('http://a.com/gone')
+>>> len(nc)
+0
+
+To use it, give it to an ``Internet`` (which then raises ``KnownFailure``, a
+``KeyError``, for a url known to fail, without going to the network):
+
+>>> from graze import Graze, Internet
+>>> g = Graze(source=Internet(negative_cache=NegativeCache()))  # doctest: +SKIP
+
+By default, entries live in memory. To remember failures across runs, give it a
+persistent ``MutableMapping`` with string keys, for example a ``shelve``:
+
+>>> import shelve
+>>> nc = NegativeCache(shelve.open('/path/to/negative_cache'))  # doctest: +SKIP
+"""
+
+import time
+from collections.abc import Callable, Iterator, Mapping, MutableMapping
+from dataclasses import asdict, dataclass
+from typing import Optional, Union
+
+A_MINUTE = 60
+AN_HOUR = 60 * A_MINUTE
+A_DAY = 24 * AN_HOUR
+
+#: Status code (an int), or status class (like ``'5xx'``) -> seconds to remember a
+#: failure for. An exact code wins over its class; failures with neither aren't
+#: remembered. 429 (too many requests) and the auth errors (401, 403) are left out
+#: on purpose: they say more about the client than about the url.
+DFLT_NEGATIVE_TTLS = {
+    404: AN_HOUR,
+    410: A_DAY,
+    "5xx": 5 * A_MINUTE,
+}
+DFLT_MAX_NEGATIVE_TTL = 30 * A_DAY
+
+StatusKey = Union[int, str]
+
+
+class KnownFailure(KeyError):
+    """Raised instead of fetching a url that the negative cache knows to fail."""
+
+
+@dataclass(frozen=True)
+class NegativeEntry:
+    """A remembered failure of a url."""
+
+    status_code: Optional[int]
+    timestamp: float
+    ttl: float
+    failures: int = 1
+    reason: str = ""
+
+    @property
+    def expires_at(self) -> float:
+        return self.timestamp + self.ttl
+
+
+def status_class(status_code: Optional[int]) -> Optional[str]:
+    """The class of a status code.
+
+    >>> status_class(503), status_class(404), status_class(None)
+    ('5xx', '4xx', None)
+    """
+    if status_code is None:
+        return None
+    return f"{status_code // 100}xx"
+
+
+class NegativeCache(Mapping):
+    """The failures of urls, as a ``Mapping`` from url to (unexpired) ``NegativeEntry``.
+
+    Args:
+        store: Where the entries are kept (as dicts). Defaults to a ``dict``.
+        ttls: Status code or class -> seconds to remember a failure for (see
+            ``DFLT_NEGATIVE_TTLS``).
+        max_ttl: The cap of the ttl, which doubles with each consecutive failure.
+        clock: The function giving the current time.
+    """
+
+    def __init__(
+        self,
+        store: Optional[MutableMapping] = None,
+        *,
+        ttls: Mapping[StatusKey, float] = DFLT_NEGATIVE_TTLS,
+        max_ttl: float = DFLT_MAX_NEGATIVE_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = {} if store is None else store
+        self.ttls = dict(ttls)
+        self.max_ttl = max_ttl
+        self.clock = clock
+
+    def base_ttl(self, status_code: Optional[int]) -> Optional[float]:
+        """The ttl of a first failure with this status (None if not remembered)."""
+        if status_code in self.ttls:
+            return self.ttls[status_code]
+        return self.ttls.get(status_class(status_code))
+
+    def record(self, url: str, status_code: Optional[int], reason: str = "") -> None:
+        """Remember that fetching url failed with this status (if it has a ttl)."""
+        ttl = self.base_ttl(status_code)
+        if not ttl:
+            return
+        previous = self.store.get(url)
+        failures = previous["failures"] + 1 if previous is not None else 1
+        ttl = min(ttl * 2 ** (failures - 1), self.max_ttl)
+        entry = NegativeEntry(status_code, self.clock(), ttl, failures, reason)
+        self.store[url] = asdict(entry)
+
+    def forget(self, url: str) -> None:
+        """Forget any failure of url (e.g. because it was just fetched fine)."""
+        self.store.pop(url, None)
+
+    def check(self, url: str) -> None:
+        """Raise ``KnownFailure`` if url is known to fail."""
+        entry = self.get(url)
+        if entry is not None:
+            raise KnownFailure(
+                f"{url} is known to fail (status {entry.status_code}, "
+                f"{entry.failures} time(s), last at {time.ctime(entry.timestamp)}). "
+                f"Not trying again before {time.ctime(entry.expires_at)}."
+            )
+
+    def __getitem__(self, url: str) -> NegativeEntry:
+        entry = NegativeEntry(**self.store[url])
+        if entry.expires_at <= self.clock():
+            raise KeyError(url)  # expired (kept, for the backoff, until forgotten)
+        return entry
+
+    def __iter__(self) -> Iterator[str]:
+        now = self.clock()
+        for url, entry in list(self.store.items()):
+            if entry["timestamp"] + entry["ttl"] > now:
+                yield url
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def clear(self) -> None:
+        """Forget all failures."""
+        self.store.clear()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} known failures)"
@@ -0,0 +1,372 @@
+"""Download progress: bytes received, out of how many, how fast, and how long to go.
+
+A download reports its progress to the *reporter* of the current
+``progress_scope``: any callable taking a ``DownloadProgress``. The total is the
+``Content-Length`` of the response being downloaded (no extra ``HEAD`` request), so
+it's ``None`` when the server doesn't say (or compresses the transfer).
+
+>>> events = []
+>>> with progress_scope(events.append):
+...     chunks = list(reported([b'abc', b'defg'], 'http://a.com/x', total=7))
+>>> events[-1].received, events[-1].total, events[-1].done
+(7, 7, True)
+
+graze's download functions (``url_to_contents.requests_get``,
+``requests_iter_chunks``, ``chks_of_url_contents``, and so the share-link routes and
+the streaming writer of ``graze_chunks``) report through ``reported``. Give a
+reporter to ``graze``, a ``GrazeBase``, or an ``Internet`` (``progress=...``), or
+enter a ``progress_scope`` around anything that downloads -- batches included, since
+``HostScheduler.map``, ``DownloadScheduler`` and ``BulkDownload`` carry the scope
+over to their threads:
+
+>>> from graze import graze
+>>> contents = graze(url, progress=TerminalProgress())  # doctest: +SKIP
+>>> with progress_scope(TerminalProgress()):  # doctest: +SKIP
+...     scheduler.map(g.__getitem__, urls)
+
+Two reporters come with graze:
+
+- ``TerminalProgress`` writes a progress line (to stderr, by default): that of the
+  download, or the totals of the downloads under way, for a batch.
+- ``ProgressTracker`` keeps track of the downloads (thread-safely), and gives the
+  totals (a ``BatchProgress``) to an ``on_update`` callback -- e.g. to feed a
+  metrics system:
+
+>>> tracker = ProgressTracker()
+>>> with progress_scope(tracker):
+...     _ = list(reported([b'abc'], 'http://a.com/x', total=3))
+...     _ = list(reported([b'de', b'f'], 'http://a.com/y'))
+>>> snapshot = tracker.snapshot()
+>>> snapshot.done, snapshot.received, snapshot.active
+(2, 6, 0)
+"""
+
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional, TextIO
+
+#: The minimum number of seconds between two reports of a download (its first and
+#: last reports are always made).
+DFLT_REPORT_INTERVAL = 0.1
+
+Reporter = Callable[["DownloadProgress"], None]
+
+
+def _size_str(nbytes: float) -> str:
+    """
+    >>> _size_str(512), _size_str(1_234_567)
+    ('512 B', '1.2 MB')
+    """
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if nbytes < 1000 or unit == "TB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1000
+
+
+def _progress_str(received, total, rate, eta) -> str:
+    text = _size_str(received)
+    if total is not None:
+        text += f" / {_size_str(total)}"
+        if total:
+            text += f" ({received / total:.0%})"
+    text += f", {_size_str(rate)}/s"
+    if eta is not None:
+        text += f", eta {eta:.0f}s"
+    return text
+
+
+@dataclass(frozen=True)
+class DownloadProgress:
+    """Where a download of url is at.
+
+    Args:
+        url: The url being downloaded.
+        received: The number of bytes received so far.
+        total: The number of bytes to receive (None if unknown).
+        elapsed: The seconds since the download started.
+        done: Whether the download is over (completed, or failed).
+        error: The error the download failed with, if it did.
+    """
+
+    url: str
+    received: int
+    total: Optional[int]
+    elapsed: float
+    done: bool = False
+    error: Optional[BaseException] = None
+
+    @property
+    def rate(self) -> float:
+        """The bytes received per second."""
+        return self.received / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """The estimated seconds left (None if it can't be estimated)."""
+        if self.done:
+            return 0.0
+        if self.total is None or not self.rate:
+            return None
+        return max(0.0, (self.total - self.received) / self.rate)
+
+    def __str__(self):
+        status = " failed:" if self.error is not None else ""
+        progress = _progress_str(self.received, self.total, self.rate, self.eta)
+        return f"{self.url}:{status} {progress}"
+
+
+_reporter: ContextVar[Optional[Reporter]] = ContextVar(
+    "graze_progress_reporter", default=None
+)
+
+
+def current_reporter() -> Optional[Reporter]:
+    """The progress reporter of the current scope (None if there's none)."""
+    return _reporter.get()
+
+
+@contextmanager
+def progress_scope(reporter: Optional[Reporter] = None):
+    """A context in which downloads report their progress to reporter (if given, else
+    to that of the enclosing scope)."""
+    token = _reporter.set(reporter) if reporter is not None else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _reporter.reset(token)
+
+
+def iter_in_progress_scope(
+    chunks: Iterable, reporter: Optional[Reporter] = None
+) -> Iterator:
+    """Yield the items of chunks, each of them computed in a ``progress_scope`` (see
+    ``graze.timeouts.iter_in_timeout_scope`` for why)."""
+    iterator = iter(chunks)
+    while True:
+        with progress_scope(reporter):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def total_of(headers: Mapping, *, decoded: bool = True) -> Optional[int]:
+    """The number of bytes a response announces (by its headers), if it does.
+
+    With ``decoded`` (as ``requests`` does), a compressed response doesn't say, since
+    its ``Content-Length`` counts compressed bytes.
+
+    >>> total_of({'Content-Length': '1024'})
+    1024
+    >>> total_of({'Content-Length': '1024', 'Content-Encoding': 'gzip'}) is None
+    True
+    """
+    length = headers.get("Content-Length")
+    encoding = (headers.get("Content-Encoding") or "identity").lower()
+    if length is None or (decoded and encoding != "identity"):
+        return None
+    try:
+        return int(length)
+    except ValueError:
+        return None
+
+
+def reported(
+    chunks: Iterable[bytes],
+    url: str,
+    total: Optional[int] = None,
+    *,
+    interval: float = DFLT_REPORT_INTERVAL,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[bytes]:
+    """Yield the chunks (downloaded from url), reporting the progress to the reporter
+    of the current scope, if there's one (at most every ``interval`` seconds, and
+    when the download starts and ends). The reporter is that of when the iteration
+    starts."""
+    reporter = current_reporter()
+    if reporter is None:
+        yield from chunks
+        return
+    started = last_report = clock()
+    received = 0
+
+    def report(**kwargs):
+        reporter(DownloadProgress(url, received, total, clock() - started, **kwargs))
+
+    report()
+    error = None
+    try:
+        for chunk in chunks:
+            received += len(chunk)
+            now = clock()
+            if now - last_report >= interval:
+                last_report = now
+                report()
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:  # (also when the consumer stops iterating)
+        report(done=True, error=error)
+
+
+@dataclass(frozen=True)
+class BatchProgress:
+    """The totals of the downloads reported to a ``ProgressTracker``.
+
+    Args:
+        active: The number of downloads under way.
+        done: The number of downloads completed.
+        failed: The number of downloads that failed.
+        received: The bytes received (by all downloads).
+        total: The bytes to receive by the downloads under way or completed (None if
+            one of those didn't say).
+        elapsed: The seconds since the first download started.
+    """
+
+    active: int
+    done: int
+    failed: int
+    received: int
+    total: Optional[int]
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """The bytes received per second."""
+        return self.received / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """The estimated seconds left for the downloads under way (None if it can't be
+        estimated)."""
+        if not self.active:
+            return 0.0
+        if self.total is None or not self.rate:
+            return None
+        return max(0.0, (self.total - self.received) / self.rate)
+
+    def __str__(self):
+        progress = _progress_str(self.received, self.total, self.rate, self.eta)
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"{self.active} downloading, {self.done} done{failed}: {progress}"
+
+
+class ProgressTracker:
+    """A progress reporter keeping track of (concurrent) downloads, thread-safely.
+
+    Args:
+        on_update: Called with the totals (a ``BatchProgress``) after each report.
+        clock: The function giving the (monotonic) time.
+    """
+
+    def __init__(
+        self,
+        on_update: Optional[Callable[[BatchProgress], None]] = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.on_update = on_update
+        self.clock = clock
+        self.downloads = {}  # url -> the last DownloadProgress of the active ones
+        self._started = None
+        self._done = self._failed = 0
+        self._received_done = 0
+        self._total_done = 0  # (None once a done download had no total)
+        self._lock = threading.Lock()
+
+    def __call__(self, progress: DownloadProgress):
+        with self._lock:
+            if self._started is None:
+                self._started = self.clock()
+            if not progress.done:
+                self.downloads[progress.url] = progress
+            else:
+                self.downloads.pop(progress.url, None)
+                if progress.error is not None:
+                    self._failed += 1
+                else:
+                    self._done += 1
+                    self._received_done += progress.received
+                    if self._total_done is not None:
+                        self._total_done = (
+                            None
+                            if progress.total is None
+                            else self._total_done + progress.total
+                        )
+            snapshot = self._snapshot()
+        if self.on_update is not None:
+            self.on_update(snapshot)
+
+    def _snapshot(self) -> BatchProgress:
+        active = list(self.downloads.values())
+        received = self._received_done + sum(p.received for p in active)
+        total = self._total_done
+        if total is not None and all(p.total is not None for p in active):
+            total += sum(p.total for p in active)
+        else:
+            total = None
+        elapsed = 0.0 if self._started is None else self.clock() - self._started
+        return BatchProgress(
+            len(active), self._done, self._failed, received, total, elapsed
+        )
+
+    def snapshot(self) -> BatchProgress:
+        """The totals of the downloads reported so far."""
+        with self._lock:
+            return self._snapshot()
+
+
+class TerminalProgress(ProgressTracker):
+    """A progress reporter writing a progress line: that of the download under way
+    or, when there are several, their totals. On a terminal, the line is rewritten in
+    place; elsewhere (e.g. a log file), a line is written every ``interval`` seconds.
+
+    Args:
+        stream: Where to write (default: ``sys.stderr``).
+        interval: The minimum number of seconds between two writes.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        *,
+        interval: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(clock=clock)
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self._is_tty = getattr(self.stream, "isatty", lambda: False)()
+        self._last_write = None
+        self._write_lock = threading.Lock()
+
+    def __call__(self, progress: DownloadProgress):
+        super().__call__(progress)
+        with self._lock:
+            n_active = len(self.downloads)
+            batch = self._done + self._failed + n_active > 1
+            line = str(self._snapshot()) if batch else str(progress)
+        finished = progress.done and not n_active
+        self._write(line, force=finished or (progress.done and not batch))
+
+    def _write(self, line: str, *, force: bool):
+        now = self.clock()
+        with self._write_lock:
+            if not force and (
+                self._last_write is not None and now - self._last_write < self.interval
+            ):
+                return
+            self._last_write = now
+            if self._is_tty:
+                self.stream.write(f"\r\033[K{line}" + ("\n" if force else ""))
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
@@ -0,0 +1,293 @@
+"""Sparse caching of byte ranges of remote files.
+
+``graze`` caches *whole* urls. That's the wrong granularity when you only ever read
+small slices of a huge remote file -- the header of an archive, the footer of a
+Parquet file, a few row groups. This module caches such files block by block:
+
+>>> import tempfile
+>>> remote = bytes(range(256)) * 40  # a 10240 bytes "remote" file
+>>> fetched = []
+>>> def fetch_range(url, start, stop):  # stands in for an HTTP ``Range`` request
+...     fetched.append((start, stop))
+...     return start, remote[start:stop], len(remote)
+>>> rootdir = tempfile.mkdtemp()
+>>> read = lambda start, stop: read_range(
+...     'http://example.com/big.parquet', start, stop,
+...     rootdir=rootdir, block_size=1024, fetch_range=fetch_range,
+... )
+
+Reading the 8 bytes footer only fetches the block holding it (plus the first block,
+needed to learn the size of the file before a negative offset means anything):
+
+>>> read(-8, None) == remote[-8:]
+True
+>>> fetched
+[(0, 1024), (9216, 10240)]
+
+Ranges that are already there are served locally, and only the missing blocks of a
+range are fetched -- contiguous missing blocks in a single request:
+
+>>> read(500, 1500) == remote[500:1500]
+True
+>>> read(1000, 4000) == remote[1000:4000]
+True
+>>> fetched
+[(0, 1024), (9216, 10240), (1024, 2048), (2048, 4096)]
+
+Locally, the blocks live in a sparse file (holes don't take disk space on the usual
+filesystems), next to a ``.blocks`` sidecar holding the size of the remote file and
+the bitmap of the blocks that are present.
+"""
+
+import base64
+import json
+import os
+import re
+from collections.abc import Callable, Iterable
+from typing import Optional, Union
+
+import requests
+
+from graze.base import DFLT_GRAZE_DIR, RequestFailure, url_to_localpath
+from graze.util import _ensure_dirs_of_file_exists
+from graze.timeouts import requests_timeout
+
+#: Separate from ``DFLT_GRAZE_DIR`` on purpose: a partially present file must never
+#: look like a (whole) cached url to a ``Graze`` reading that folder.
+DFLT_RANGES_DIR = DFLT_GRAZE_DIR + "_ranges"
+DFLT_BLOCK_SIZE = 1024 * 1024
+BLOCKS_SUFFIX = ".blocks"
+
+#: A ``(url, start, stop) -> (offset, data, total_size)`` function. ``offset`` is where
+#: ``data`` starts in the remote file (a server may ignore the range and answer with
+#: the whole file, in which case it's 0). ``data`` is bytes, or an iterable of bytes
+#: chunks (written as they come: the whole file needn't fit in memory).
+RangeFetcher = Callable[
+    [str, int, int], tuple[int, Union[bytes, Iterable[bytes]], Optional[int]]
+]
+
+_content_range_re = re.compile(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)")
+
+
+def _parse_content_range(content_range: str) -> tuple[Optional[int], Optional[int]]:
+    """The (start, total size) of a ``Content-Range`` header (None where unknown).
+
+    >>> _parse_content_range('bytes 100-199/5000')
+    (100, 5000)
+    >>> _parse_content_range('bytes */5000')
+    (None, 5000)
+    >>> _parse_content_range('bytes 0-9/*')
+    (0, None)
+    """
+    match = _content_range_re.match(content_range or "")
+    if match is None:
+        return None, None
+    start, total = match.groups()
+    return (
+        int(start) if start is not None else None,
+        int(total) if total != "*" else None,
+    )
+
+
+def _closing_chunks(resp: requests.Response, chk_size: int):
+    with resp:
+        yield from resp.iter_content(chk_size)
+
+
+def requests_get_range(url: str, start: int, stop: int, **request_kwargs):
+    """Get bytes ``[start, stop)`` of url with an HTTP ``Range`` request.
+
+    Returns ``(offset, data, total_size)`` (see ``RangeFetcher``). The range is of
+    the bytes as stored (``Accept-Encoding: identity``: a range of gzipped bytes is
+    no range of the file). If the server ignores the range, the whole file it sends
+    instead is streamed, its ``Content-Length`` being the total size.
+    """
+    headers = dict(request_kwargs.pop("headers", None) or {})
+    headers["Range"] = f"bytes={start}-{stop - 1}"
+    headers["Accept-Encoding"] = "identity"
+    request_kwargs.setdefault("timeout", requests_timeout())
+    resp = requests.request(
+        "get", url=url, headers=headers, stream=True, **request_kwargs
+    )
+    if resp.status_code == 200:
+        # The server ignored the range, and is sending the whole thing
+        content_length = resp.headers.get("Content-Length")
+        total_size = int(content_length) if content_length is not None else None
+        return 0, _closing_chunks(resp, DFLT_BLOCK_SIZE), total_size
+    with resp:
+        if resp.status_code == 206:
+            content_range = resp.headers.get("Content-Range")
+            offset, total_size = _parse_content_range(content_range)
+            return (start if offset is None else offset), resp.content, total_size
+        if resp.status_code == 416:
+            # Range not satisfiable (we asked past the end): the header has the size
+            _, total_size = _parse_content_range(resp.headers.get("Content-Range"))
+            return start, b"", total_size
+        raise RequestFailure(
+            f"Response code was {resp.status_code}.\n"
+            f"The first 500 characters of the content were: "
+            f"{next(resp.iter_content(500), b'')}",
+            status_code=resp.status_code,
+            headers=resp.headers,
+        )
+
+
+class SparseBlockFile:
+    """A local file holding some of the blocks of a remote file.
+
+    The data file is written in place (at the offsets the blocks have remotely), and
+    a ``.blocks`` sidecar keeps the size of the remote file and a bitmap of the
+    blocks present. A block is only marked present once it's complete (the last
+    block of the file is complete when it reaches the end of the file).
+
+    >>> import tempfile
+    >>> f = SparseBlockFile(os.path.join(tempfile.mkdtemp(), 'x'), block_size=4)
+    >>> f.write(0, b'abcdefghij', total_size=10)
+    >>> f.missing_blocks(0, 10)
+    []
+    >>> f.read(3, 7)
+    b'defg'
+    """
+
+    def __init__(self, filepath: str, *, block_size: int = DFLT_BLOCK_SIZE):
+        self.filepath = filepath
+        self.blocks_filepath = filepath + BLOCKS_SUFFIX
+        self.block_size = block_size
+        self.size: Optional[int] = None
+        self._bitmap = bytearray()
+        if os.path.exists(self.blocks_filepath):
+            with open(self.blocks_filepath) as f:
+                meta = json.load(f)
+            if meta["block_size"] == block_size:
+                self.size = meta["size"]
+                self._bitmap = bytearray(base64.b64decode(meta["bitmap"]))
+            # else: blocks of another size -- start over (the data is refetched)
+
+    def has_block(self, i: int) -> bool:
+        return i >> 3 < len(self._bitmap) and bool(
+            self._bitmap[i >> 3] & (1 << (i & 7))
+        )
+
+    def _mark_block(self, i: int):
+        if i >> 3 >= len(self._bitmap):
+            self._bitmap.extend(bytes((i >> 3) + 1 - len(self._bitmap)))
+        self._bitmap[i >> 3] |= 1 << (i & 7)
+
+    def missing_blocks(self, start: int, stop: int) -> list[int]:
+        """The indices of the blocks overlapping ``[start, stop)`` that aren't here."""
+        if stop <= start:
+            return []
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        return [i for i in range(first, last + 1) if not self.has_block(i)]
+
+    def write(
+        self,
+        offset: int,
+        data: Union[bytes, Iterable[bytes]],
+        *,
+        total_size: Optional[int] = None,
+    ):
+        """Write ``data`` (bytes, or bytes chunks) at ``offset``, and mark the blocks
+        it completes (once it's all written)."""
+        if total_size is not None:
+            self.size = total_size
+        chunks = (data,) if isinstance(data, (bytes, bytearray)) else data
+        _ensure_dirs_of_file_exists(self.filepath)
+        mode = "r+b" if os.path.exists(self.filepath) else "w+b"
+        with open(self.filepath, mode) as f:
+            f.seek(offset)
+            for chunk in chunks:
+                f.write(chunk)
+            end = f.tell()
+        first = -(-offset // self.block_size)  # first block starting in the data
+        for i in range(first, end // self.block_size + 1):
+            block_end = (i + 1) * self.block_size
+            if self.size is not None:
+                block_end = min(block_end, self.size)
+            if i * self.block_size < block_end <= end:
+                self._mark_block(i)
+        self._save_blocks()
+
+    def read(self, start: int, stop: int) -> bytes:
+        """Read ``[start, stop)`` from the local file (present blocks are assumed)."""
+        if stop <= start:
+            return b""
+        with open(self.filepath, "rb") as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def _save_blocks(self):
+        meta = {
+            "size": self.size,
+            "block_size": self.block_size,
+            "bitmap": base64.b64encode(bytes(self._bitmap)).decode(),
+        }
+        tmp_filepath = self.blocks_filepath + ".tmp"
+        with open(tmp_filepath, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_filepath, self.blocks_filepath)
+
+
+def _runs(block_indices: list[int]) -> list[tuple[int, int]]:
+    """Group sorted block indices into ``(first, last)`` runs of consecutive ones.
+
+    >>> _runs([0, 1, 2, 5, 7, 8])
+    [(0, 2), (5, 5), (7, 8)]
+    """
+    runs = []
+    for i in block_indices:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+
+def _fetch_blocks(
+    sparse: SparseBlockFile, url: str, first: int, last: int, fetch_range: RangeFetcher
+):
+    start, stop = first * sparse.block_size, (last + 1) * sparse.block_size
+    if sparse.size is not None:
+        stop = min(stop, sparse.size)
+    offset, data, total_size = fetch_range(url, start, stop)
+    sparse.write(offset, data, total_size=total_size)
+
+
+def read_range(
+    url: str,
+    start: Optional[int] = 0,
+    stop: Optional[int] = None,
+    *,
+    rootdir: str = DFLT_RANGES_DIR,
+    block_size: int = DFLT_BLOCK_SIZE,
+    url_to_path: Callable[[str], str] = url_to_localpath,
+    fetch_range: RangeFetcher = requests_get_range,
+) -> bytes:
+    """Get bytes ``[start:stop]`` of the contents of url, fetching only missing blocks.
+
+    ``start`` and ``stop`` follow slice semantics (negative values count from the end,
+    ``None`` means "from the beginning"/"to the end"), so ``read_range(url, -8)`` is
+    the last 8 bytes of the file.
+
+    Args:
+        url: The url of the (remote) file.
+        start: Where the range starts.
+        stop: Where the range stops (excluded).
+        rootdir: Where to keep the sparse local copies.
+        block_size: The unit of fetching (and of bookkeeping).
+        url_to_path: The function mapping a url to a path under ``rootdir``.
+        fetch_range: The function fetching ranges (see ``RangeFetcher``).
+    """
+    sparse = SparseBlockFile(
+        os.path.join(os.path.expanduser(rootdir), url_to_path(url)),
+        block_size=block_size,
+    )
+    if sparse.size is None:
+        # The size is what gives negative (and None) offsets their meaning
+        _fetch_blocks(sparse, url, 0, 0, fetch_range)
+        if sparse.size is None:
+            raise RequestFailure(f"The server didn't tell the size of {url}")
+    start, stop, _ = slice(start, stop).indices(sparse.size or 0)
+    for first, last in _runs(sparse.missing_blocks(start, stop)):
+        _fetch_blocks(sparse, url, first, last, fetch_range)
+    return sparse.read(start, stop)
@@ -0,0 +1,387 @@
+"""Per-host rate limits and concurrency caps, so grazing many urls stays polite.
+
+Nothing stops a loop over urls -- let alone a thread pool -- from hammering a single
+host, and getting throttled (429s) or banned for it. A ``HostScheduler`` sits in front
+of the fetches and, per host, enforces
+
+- a rate: a token bucket of ``burst`` tokens, refilled at ``rate`` tokens per second
+  (each request takes a token, waiting for one if there's none), and
+- a concurrency cap: at most ``max_in_flight`` requests to the host at a time.
+
+Limits are given per host pattern (``fnmatch`` style, first match wins), with a
+``default`` for the hosts no pattern matches:
+
+>>> scheduler = HostScheduler(
+...     {
+...         'api.github.com': HostLimits(rate=5, burst=5),
+...         '*.example.com': HostLimits(max_in_flight=2),
+...     },
+...     default=HostLimits(rate=10),
+... )
+>>> scheduler.limits_of('http://api.github.com/repos')
+HostLimits(rate=5, burst=5, max_in_flight=None)
+>>> scheduler.limits_of('https://cdn.example.com/data.csv')
+HostLimits(rate=None, burst=1, max_in_flight=2)
+>>> scheduler.limits_of('https://elsewhere.org/')
+HostLimits(rate=10, burst=1, max_in_flight=None)
+
+A request takes a ``slot`` of its host (``aslot`` in async code) for as long as it
+runs:
+
+>>> with scheduler.slot('https://cdn.example.com/data.csv'):
+...     scheduler.in_flight('cdn.example.com')
+1
+>>> scheduler.in_flight('cdn.example.com')
+0
+
+Give the scheduler to an ``Internet`` and all its fetches go through it:
+
+>>> from graze import Graze, Internet
+>>> g = Graze(source=Internet(host_scheduler=scheduler))  # doctest: +SKIP
+
+For batches, ``map`` (and ``amap``, its async version) fetch many urls in parallel
+while keeping to the limits: urls are dispatched round-robin over their hosts, and a
+host never has more of them running than its limits allow, so a slow (or heavily
+limited) host doesn't tie up the workers that other hosts could be using:
+
+>>> contents = scheduler.map(g.__getitem__, urls, max_workers=8)  # doctest: +SKIP
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Optional
+from urllib.parse import urlsplit
+
+DFLT_MAX_WORKERS = 8
+
+
+def host_of(url: str) -> str:
+    """The (lower case) host of a url, or the url itself if it has none.
+
+    >>> host_of('https://Data.Example.com:8080/a/b?c=d')
+    'data.example.com'
+    """
+    return urlsplit(url).hostname or url
+
+
+@dataclass(frozen=True)
+class HostLimits:
+    """The limits of requests to a host.
+
+    Args:
+        rate: The sustained number of requests per second (None for no rate limit).
+        burst: The number of requests that can be made at once, after a quiet spell
+            (the capacity of the token bucket).
+        max_in_flight: The maximum number of concurrent requests (None for no cap).
+
+    Limits no request could ever get through are refused:
+
+    >>> HostLimits(max_in_flight=0)
+    Traceback (most recent call last):
+        ...
+    ValueError: max_in_flight must be at least 1 (or None, for no cap): 0
+    """
+
+    rate: Optional[float] = None
+    burst: int = 1
+    max_in_flight: Optional[int] = None
+
+    def __post_init__(self):
+        if self.rate is not None and not self.rate > 0:
+            raise ValueError(
+                f"rate must be positive (or None, for no rate limit): {self.rate}"
+            )
+        if self.burst < 1:
+            raise ValueError(f"burst must be at least 1: {self.burst}")
+        if self.max_in_flight is not None and self.max_in_flight < 1:
+            raise ValueError(
+                "max_in_flight must be at least 1 (or None, for no cap): "
+                f"{self.max_in_flight}"
+            )
+
+
+NO_LIMITS = HostLimits()
+
+
+class TokenBucket:
+    """A token bucket: ``capacity`` tokens, refilled at ``rate`` tokens per second.
+
+    >>> now = [0.0]
+    >>> bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    >>> bucket.take(), bucket.take(), bucket.take()
+    (0.0, 0.0, 0.5)
+    >>> now[0] += 0.5
+    >>> bucket.take()
+    0.0
+    """
+
+    def __init__(
+        self, rate: float, capacity: int = 1, *, clock: Callable = time.monotonic
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = float(capacity)
+        self._last = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0.0 if one is)."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self) -> float:
+        """Take a token if there's one (returning 0.0), else return the seconds to
+        wait for one (without taking it)."""
+        wait_time = self.wait_time()
+        if wait_time == 0:
+            self._tokens -= 1
+        return wait_time
+
+
+class HostScheduler:
+    """Enforces per-host rate limits and concurrency caps (thread-safe).
+
+    Args:
+        limits: Host pattern (``fnmatch`` style, e.g. ``'*.example.com'``) ->
+            ``HostLimits``. The first matching pattern wins.
+        default: The limits of hosts that no pattern matches.
+        clock: The function giving the (monotonic) time.
+    """
+
+    def __init__(
+        self,
+        limits: Mapping[str, HostLimits] = (),
+        *,
+        default: HostLimits = NO_LIMITS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = dict(limits)
+        self.default = default
+        self.clock = clock
+        self._limits_of_host = {}
+        self._buckets = {}
+        self._in_flight = Counter()
+        self._condition = threading.Condition()
+
+    def host_limits(self, host: str) -> HostLimits:
+        """The limits of host."""
+        limits = self._limits_of_host.get(host)
+        if limits is None:
+            limits = next(
+                (
+                    host_limits
+                    for pattern, host_limits in self.limits.items()
+                    if fnmatchcase(host, pattern.lower())
+                ),
+                self.default,
+            )
+            self._limits_of_host[host] = limits
+        return limits
+
+    def limits_of(self, url: str) -> HostLimits:
+        """The limits of the host of url."""
+        return self.host_limits(host_of(url))
+
+    def in_flight(self, host: str) -> int:
+        """The number of requests to host currently holding a slot."""
+        return self._in_flight[host]
+
+    def concurrency_of(self, host: str, max_workers: int = DFLT_MAX_WORKERS) -> int:
+        """How many of a batch's requests to host are worth running at once: its
+        ``max_in_flight`` if it has one, else its ``burst`` if it's rate limited
+        (more would just wait for tokens), else ``max_workers``."""
+        limits = self.host_limits(host)
+        if limits.max_in_flight is not None:
+            return min(limits.max_in_flight, max_workers)
+        if limits.rate is not None:
+            return min(max(limits.burst, 1), max_workers)
+        return max_workers
+
+    def _try_acquire(self, host: str) -> float:
+        """Take a slot of host (returning 0.0) or return how long to wait for one
+        (``math.inf`` if it's a matter of another request finishing). Call with the
+        condition's lock held."""
+        limits = self.host_limits(host)
+        if (
+            limits.max_in_flight is not None
+            and self._in_flight[host] >= limits.max_in_flight
+        ):
+            return math.inf
+        if limits.rate is not None:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(limits.rate, limits.burst, clock=self.clock)
+                self._buckets[host] = bucket
+            wait_time = bucket.take()
+            if wait_time:
+                return wait_time
+        self._in_flight[host] += 1
+        return 0.0
+
+    def acquire(self, url: str) -> None:
+        """Wait for, and take, a slot of the host of url."""
+        host = host_of(url)
+        with self._condition:
+            while wait_time := self._try_acquire(host):
+                self._condition.wait(None if wait_time == math.inf else wait_time)
+
+    def release(self, url: str) -> None:
+        """Give back a slot of the host of url."""
+        host = host_of(url)
+        with self._condition:
+            self._in_flight[host] -= 1
+            if self._in_flight[host] <= 0:
+                del self._in_flight[host]
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, url: str):
+        """Hold a slot of the host of url for the duration of the context."""
+        self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    @asynccontextmanager
+    async def aslot(self, url: str, *, poll_interval: float = 0.05):
+        """Like ``slot``, but waiting without blocking the event loop."""
+        host = host_of(url)
+        while True:
+            with self._condition:
+                wait_time = self._try_acquire(host)
+            if not wait_time:
+                break
+            await asyncio.sleep(min(wait_time, poll_interval))
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    def call(self, func: Callable, url: str, *args, **kwargs):
+        """Call ``func(url, *args, **kwargs)`` holding a slot of the host of url."""
+        with self.slot(url):
+            return func(url, *args, **kwargs)
+
+    def map(
+        self,
+        func: Callable[[str], object],
+        urls: Iterable[str],
+        *,
+        max_workers: int = DFLT_MAX_WORKERS,
+        return_exceptions: bool = False,
+    ) -> list:
+        """Return ``[func(url) for url in urls]``, computed by ``max_workers`` threads
+        taking the urls round-robin over their hosts, and never running more of a
+        host's urls at once than ``concurrency_of`` the host.
+
+        ``func`` is what takes the slots (e.g. the ``__getitem__`` of a ``Graze``
+        whose ``Internet`` has this scheduler), so cache hits don't cost any.
+        With ``return_exceptions``, a failing url's exception is its result, else
+        it's raised (once the running calls are done).
+        """
+        urls = list(urls)
+        queue = _HostRoundRobin(urls, lambda h: self.concurrency_of(h, max_workers))
+        results = [None] * len(urls)
+        with ThreadPoolExecutor(max_workers) as executor:
+            running = {}
+            while queue or running:
+                while len(running) < max_workers and (item := queue.pop()):
+                    index, url = item
+                    # (in a copy of the context, for the timeout scope to carry over)
+                    run = contextvars.copy_context().run
+                    running[executor.submit(run, func, url)] = item
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, url = running.pop(future)
+                    queue.done(url)
+                    error = future.exception()
+                    if error is not None and not return_exceptions:
+                        queue.clear()
+                        for other in running:
+                            other.cancel()
+                        raise error
+                    results[index] = future.result() if error is None else error
+        return results
+
+    async def amap(
+        self,
+        func: Callable[[str], object],
+        urls: Iterable[str],
+        *,
+        max_workers: int = DFLT_MAX_WORKERS,
+        return_exceptions: bool = False,
+    ) -> list:
+        """The async version of ``map``: the (blocking) ``func`` calls run in threads
+        (``asyncio.to_thread``), dispatched the same way."""
+        urls = list(urls)
+        queue = _HostRoundRobin(urls, lambda h: self.concurrency_of(h, max_workers))
+        results = [None] * len(urls)
+        running = {}
+        try:
+            while queue or running:
+                while len(running) < max_workers and (item := queue.pop()):
+                    index, url = item
+                    task = asyncio.ensure_future(asyncio.to_thread(func, url))
+                    running[task] = item
+                done, _ = await asyncio.wait(running, return_when=FIRST_COMPLETED)
+                for task in done:
+                    index, url = running.pop(task)
+                    queue.done(url)
+                    error = task.exception()
+                    if error is not None and not return_exceptions:
+                        raise error
+                    results[index] = task.result() if error is None else error
+        finally:
+            for task in running:
+                task.cancel()
+        return results
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.limits!r}, default={self.default!r})"
+
+
+class _HostRoundRobin:
+    """The pending ``(index, url)`` items of a batch, per host, handed out
+    round-robin over the hosts that are below their concurrency."""
+
+    def __init__(self, urls, concurrency_of):
+        self._pending = OrderedDict()
+        for index, url in enumerate(urls):
+            self._pending.setdefault(host_of(url), deque()).append((index, url))
+        self._running = Counter()
+        self._concurrency_of = concurrency_of
+
+    def pop(self):
+        for host in list(self._pending):
+            if self._running[host] < self._concurrency_of(host):
+                items = self._pending.pop(host)
+                item = items.popleft()
+                if items:
+                    self._pending[host] = items  # (back of the line)
+                self._running[host] += 1
+                return item
+        return None
+
+    def done(self, url):
+        self._running[host_of(url)] -= 1
+
+    def clear(self):
+        self._pending.clear()
+
+    def __bool__(self):
+        return bool(self._pending)
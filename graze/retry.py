@@ -0,0 +1,244 @@
+"""Retrying failed fetches: exponential backoff, jitter, ``Retry-After`` and a deadline.
+
+A fetch that fails with a 503, a 429 or a connection reset will often work a moment
+later. A ``RetryPolicy`` says which failures are worth retrying, how many times, and
+how long to wait in between:
+
+>>> attempts = []
+>>> policy = RetryPolicy(
+...     max_attempts=4, backoff_base=1, jitter=0,
+...     sleep=lambda seconds: None,  # (don't actually wait, in this example)
+...     hooks=[attempts.append],
+... )
+>>> responses = iter([ConnectionResetError('reset'), TimeoutError('slow'), b'data'])
+>>> def fetch(url):
+...     response = next(responses)
+...     if isinstance(response, Exception):
+...         raise response
+...     return response
+>>> policy.call(fetch, 'http://example.com')
+b'data'
+
+Every attempt is reported to the ``hooks`` -- which is where to plug logging, or
+metrics:
+
+>>> [(a.number, a.outcome, a.delay) for a in attempts]
+[(1, 'retry', 1.0), (2, 'retry', 2.0), (3, 'success', 0.0)]
+
+A failure that isn't retryable (a 404, say) is raised right away, and so is the last
+failure once ``max_attempts`` (or the ``deadline``) is reached.
+
+The delay before attempt ``n + 1`` is ``backoff_base * backoff_factor ** (n - 1)``,
+capped at ``backoff_max``, of which a random ``jitter`` fraction is taken off (so
+that many clients failing together don't all come back together). If the server
+said when to come back (a ``Retry-After`` header), that's what's waited instead --
+up to ``max_retry_after`` (a server asking for an hour doesn't get to block the
+caller for an hour).
+
+``Internet(retry=...)`` and the download functions of ``graze.util`` take a policy:
+
+>>> from graze import Graze, Internet
+>>> g = Graze(source=Internet(retry=RetryPolicy()))  # doctest: +SKIP
+"""
+
+import random
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from http.client import IncompleteRead
+from typing import Optional
+from urllib.error import URLError
+
+import requests
+
+from graze.timeouts import DeadlineExceeded, remaining
+
+#: Statuses that say "not now" rather than "no".
+DFLT_RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+#: Errors that say the transport, rather than the resource, failed. (``ConnectionError``
+#: covers resets, refusals and aborts; ``URLError`` is how ``urllib`` wraps them.)
+DFLT_RETRY_EXCEPTIONS = (
+    ConnectionError,
+    TimeoutError,
+    IncompleteRead,
+    URLError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    """The HTTP status code of a failed request's error, if it has one."""
+    # graze's RequestFailure has a status_code, urllib's HTTPError has a code
+    return getattr(error, "status_code", None) or getattr(error, "code", None)
+
+
+def retry_after_of(error: BaseException, *, now: Callable = time.time):
+    """The number of seconds a ``Retry-After`` header of error asks to wait, if any.
+
+    >>> from graze.base import RequestFailure
+    >>> retry_after_of(RequestFailure(status_code=503, headers={'Retry-After': '7'}))
+    7.0
+    >>> when = 'Wed, 21 Oct 2015 07:28:10 GMT'
+    >>> retry_after_of(
+    ...     RequestFailure(headers={'Retry-After': when}), now=lambda: 1445412480
+    ... )
+    10.0
+    >>> retry_after_of(ValueError()) is None
+    True
+    """
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - now(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class Attempt:
+    """What happened on one attempt of a ``RetryPolicy`` call.
+
+    ``outcome`` is ``'success'``, ``'retry'`` (failed, and will be retried after
+    ``delay`` seconds) or ``'give_up'`` (failed, and ``error`` is being raised).
+    """
+
+    number: int
+    outcome: str
+    args: tuple = ()
+    error: Optional[BaseException] = None
+    delay: float = 0.0
+    elapsed: float = 0.0
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """When, and how, to retry a failed fetch.
+
+    Args:
+        max_attempts: The maximum number of attempts (1 means no retries).
+        retry_statuses: The HTTP status codes worth retrying.
+        retry_exceptions: The (status-less) errors worth retrying.
+        backoff_base: The delay after the first failed attempt, in seconds.
+        backoff_factor: What the delay is multiplied by after each failed attempt.
+        backoff_max: The cap of the delay.
+        jitter: The fraction (0 to 1) of the delay that is randomized away.
+        respect_retry_after: Whether to wait what a ``Retry-After`` header says.
+        max_retry_after: The cap of the wait a ``Retry-After`` header asks for.
+        deadline: If given, the number of seconds after which no attempt is started
+            (a wait that would end past the deadline isn't waited). The deadline of
+            the current ``graze.timeouts.timeout_scope`` is respected in any case.
+        hooks: Functions called with the ``Attempt`` of every attempt.
+    """
+
+    max_attempts: int = 3
+    retry_statuses: frozenset = DFLT_RETRY_STATUSES
+    retry_exceptions: tuple = DFLT_RETRY_EXCEPTIONS
+    backoff_base: float = 0.5
+    backoff_factor: float = 2.0
+    backoff_max: float = 30.0
+    jitter: float = 1.0
+    respect_retry_after: bool = True
+    max_retry_after: float = 120.0
+    deadline: Optional[float] = None
+    hooks: Iterable[Callable[[Attempt], None]] = ()
+    sleep: Callable[[float], None] = field(default=time.sleep, repr=False)
+    clock: Callable[[], float] = field(default=time.monotonic, repr=False)
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """Whether error is worth another attempt."""
+        if isinstance(error, DeadlineExceeded):
+            return False
+        status_code = status_code_of(error)
+        if status_code is not None:
+            return status_code in self.retry_statuses
+        return isinstance(error, self.retry_exceptions)
+
+    def delay(self, attempt_number: int, error: Optional[BaseException] = None):
+        """How long to wait after failed attempt number ``attempt_number``."""
+        if self.respect_retry_after and error is not None:
+            retry_after = retry_after_of(error)
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        delay = min(
+            self.backoff_base * self.backoff_factor ** (attempt_number - 1),
+            self.backoff_max,
+        )
+        return delay * (1 - self.jitter * random.random())
+
+    def _next_delay(self, number: int, error: BaseException, started: float):
+        """The delay before the next attempt, or None to give up."""
+        if number >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = self.delay(number, error)
+        if self.deadline is not None:
+            if self.clock() + delay - started > self.deadline:
+                return None
+        left = remaining()  # (the deadline of the call, if it has one)
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    def _report(self, number, outcome, args, error=None, delay=0.0, started=0.0):
+        attempt = Attempt(number, outcome, args, error, delay, self.clock() - started)
+        for hook in self.hooks:
+            hook(attempt)
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call ``func(*args, **kwargs)``, retrying according to the policy."""
+        started = self.clock()
+        number = 1
+        while True:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                delay = self._next_delay(number, error, started)
+                if delay is None:
+                    self._report(number, "give_up", args, error, started=started)
+                    raise
+                self._report(number, "retry", args, error, delay, started)
+                self.sleep(delay)
+                number += 1
+            else:
+                self._report(number, "success", args, started=started)
+                return result
+
+    def iter_call(self, func: Callable[..., Iterable], *args, **kwargs) -> Iterator:
+        """Yield from ``func(*args, **kwargs)``, retrying according to the policy, as
+        long as nothing has been yielded yet (retrying after that would repeat items).
+        """
+        started = self.clock()
+        number = 1
+        while True:
+            yielded = False
+            try:
+                for item in func(*args, **kwargs):
+                    yielded = True
+                    yield item
+            except Exception as error:
+                delay = None if yielded else self._next_delay(number, error, started)
+                if delay is None:
+                    self._report(number, "give_up", args, error, started=started)
+                    raise
+                self._report(number, "retry", args, error, delay, started)
+                self.sleep(delay)
+                number += 1
+            else:
+                self._report(number, "success", args, started=started)
+                return
+
+
+def retrying(retry: Optional[RetryPolicy], func: Callable, *args, **kwargs):
+    """Call ``func(*args, **kwargs)``, through ``retry`` if it's not None."""
+    if retry is None:
+        return func(*args, **kwargs)
+    return retry.call(func, *args, **kwargs)
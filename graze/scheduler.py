@@ -0,0 +1,366 @@
+"""A priority download scheduler: urgent fetches first, bounded concurrency, and
+cancellation.
+
+Without a scheduler, every fetch starts as soon as it's asked for: there's no way to
+say "this url is urgent, those 50k can wait", nor to take back a fetch that's no longer
+needed. A ``DownloadScheduler`` runs the fetches (jobs) submitted to it
+
+- by priority (``graze.bandwidth.INTERACTIVE`` before ``BACKGROUND``, and first come,
+  first served within a priority),
+- with at most ``max_workers`` of them running at once,
+- only once per key: a job submitted for a key that's already queued (or running) is
+  the job already there (whose priority is raised, if the new one is more urgent),
+- with backpressure: when ``max_queued`` jobs are queued, ``submit`` waits for room
+  (or raises ``QueueFull``, if told not to wait).
+
+>>> with DownloadScheduler(max_workers=2) as scheduler:
+...     job = scheduler.submit(str.upper, 'http://a.com/x')
+...     job.result()
+'HTTP://A.COM/X'
+
+Jobs can be cancelled: a queued job is just dropped, and a running fetch stops at its
+next chunk (it runs in a ``graze.timeouts.cancellation_scope``). The queue can be
+inspected (``queued``, ``running``, ``stats``).
+
+Route an ``Internet``'s fetches through a scheduler, and ``g[url]``, batches
+(``scheduler.map``) and async code (``await scheduler.asubmit(...)``) all share it --
+with the priority of the current ``graze.bandwidth.priority_scope``:
+
+>>> from graze import Graze, Internet, BACKGROUND, priority_scope
+>>> scheduler = DownloadScheduler(max_workers=8)
+>>> g = Graze(source=Internet(scheduler=scheduler))  # doctest: +SKIP
+>>> with priority_scope(BACKGROUND):  # doctest: +SKIP
+...     jobs = [scheduler.submit(g.__getitem__, url) for url in urls_to_warm_up]
+>>> g[urgent_url]  # doctest: +SKIP
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+from collections.abc import Callable, Hashable, Iterable
+from concurrent.futures import CancelledError, Future
+from typing import Optional
+
+from graze.bandwidth import bandwidth_scope, current_priority
+from graze.timeouts import cancellation_scope
+
+DFLT_MAX_WORKERS = 8
+DFLT_MAX_QUEUED = 10_000
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = (
+    "queued",
+    "running",
+    "done",
+    "failed",
+    "cancelled",
+)
+
+
+class QueueFull(RuntimeError):
+    """Raised when a job can't be queued because the queue is (and stays) full."""
+
+
+class Job:
+    """A call submitted to a ``DownloadScheduler``.
+
+    ``result`` waits for (and returns) the result of the call, or raises its error
+    (``concurrent.futures.CancelledError`` if the job was cancelled).
+    """
+
+    def __init__(self, key: Hashable, func: Callable, args, kwargs, priority: int):
+        self.key = key
+        self.priority = priority
+        self.future = Future()
+        self._call = (func, args, kwargs)
+        self._context = contextvars.copy_context()
+        self._cancel_event = threading.Event()
+        self._scheduler = None
+
+    @property
+    def state(self) -> str:
+        if self.future.cancelled() or self._cancel_event.is_set():
+            return CANCELLED
+        if self.future.done():
+            return FAILED if self.future.exception() is not None else DONE
+        if self.future.running():
+            return RUNNING
+        return QUEUED
+
+    def result(self, timeout: Optional[float] = None):
+        return self.future.result(timeout)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancel(self) -> bool:
+        """Cancel the job. Returns False if it was already done."""
+        if self.future.done():
+            return False
+        self._cancel_event.set()
+        if self._scheduler is not None:
+            self._scheduler._cancelled(self)
+        return True
+
+    def __repr__(self):
+        return f"Job({self.key!r}, priority={self.priority}, state={self.state!r})"
+
+
+class DownloadScheduler:
+    """Runs submitted jobs by priority, with bounded concurrency (see module doc).
+
+    Args:
+        max_workers: The maximum number of jobs running at once.
+        max_queued: The maximum number of jobs waiting to run.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DFLT_MAX_WORKERS,
+        *,
+        max_queued: int = DFLT_MAX_QUEUED,
+    ):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._heap = []  # (priority, sequence number, job) entries (some stale)
+        self._sequence = itertools.count()
+        self._jobs = {}  # key -> queued or running job
+        self._n_queued = 0
+        self._workers = []
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._worker_of = threading.local()
+        self._counts = {DONE: 0, FAILED: 0, CANCELLED: 0}
+
+    # ---------------------------------------------------------------------------------
+    # Submitting
+
+    def submit(
+        self,
+        func: Callable,
+        key: Hashable,
+        *args,
+        priority: Optional[int] = None,
+        block: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Job:
+        """Queue ``func(key, *args, **kwargs)`` (unless a job for key already is).
+
+        ``priority`` defaults to that of the current ``priority_scope``. If the queue
+        is full, wait for room (at most ``timeout`` seconds, if given), or raise
+        ``QueueFull`` right away if ``block`` is False.
+        """
+        if priority is None:
+            priority = current_priority()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit to a scheduler that was shut down")
+            job = self._jobs.get(key)
+            if job is not None:
+                if priority < job.priority and job.state == QUEUED:
+                    job.priority = priority
+                    self._push(job)
+                return job
+            if not self._condition.wait_for(
+                lambda: self._n_queued < self.max_queued,
+                timeout=timeout if block else 0,
+            ):
+                raise QueueFull(
+                    f"{self._n_queued} jobs are queued (max_queued={self.max_queued})"
+                )
+            job = Job(key, func, args, kwargs, priority)
+            job._scheduler = self
+            self._jobs[key] = job
+            self._n_queued += 1
+            self._push(job)
+            self._ensure_workers()
+            self._condition.notify_all()
+        return job
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+
+    def run(self, func: Callable, key: Hashable, *args, **kwargs):
+        """Submit ``func(key, *args, **kwargs)``, and wait for its result.
+
+        Called from a job of this scheduler (e.g. a ``g[url]`` made by a job), the
+        call is made right away instead (waiting for a worker from a worker could
+        wait forever).
+        """
+        if getattr(self._worker_of, "scheduler", None) is self:
+            return func(key, *args, **kwargs)
+        job = self.submit(func, key, *args, **kwargs)
+        try:
+            return job.result()
+        except BaseException:
+            if not job.done():  # (e.g. a KeyboardInterrupt while waiting)
+                job.cancel()
+            raise
+
+    async def asubmit(self, func: Callable, key: Hashable, *args, **kwargs):
+        """Submit ``func(key, *args, **kwargs)``, and await its result (waiting for
+        room in the queue without blocking the event loop)."""
+        while True:
+            try:
+                job = self.submit(func, key, *args, block=False, **kwargs)
+                break
+            except QueueFull:
+                await asyncio.sleep(0.05)
+        return await asyncio.wrap_future(job.future)
+
+    def map(
+        self,
+        func: Callable,
+        keys: Iterable[Hashable],
+        *,
+        priority: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> list:
+        """Return ``[func(key) for key in keys]``, computed by the scheduler (the
+        submissions waiting for room in the queue as needed)."""
+        jobs = [self.submit(func, key, priority=priority) for key in keys]
+        results = []
+        for job in jobs:
+            try:
+                results.append(job.result())
+            except Exception as error:
+                if not return_exceptions:
+                    raise
+                results.append(error)
+        return results
+
+    # ---------------------------------------------------------------------------------
+    # Running
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Optional[Job]:
+        """The next job to run (None when shutting down). Call with the lock held."""
+        while True:
+            while self._heap:
+                priority, _, job = heapq.heappop(self._heap)
+                if priority == job.priority and job.state == QUEUED:
+                    return job  # (else, a stale entry, or a cancelled job)
+            if self._shutdown:
+                return None
+            self._condition.wait()
+
+    def _work(self):
+        self._worker_of.scheduler = self
+        while True:
+            with self._condition:
+                job = self._next_job()
+                if job is None:
+                    return
+                self._n_queued -= 1
+                job.future.set_running_or_notify_cancel()
+                self._condition.notify_all()  # (there's room in the queue)
+            self._run(job)
+
+    def _run(self, job: Job):
+        func, args, kwargs = job._call
+
+        def call():
+            with cancellation_scope(job._cancel_event):
+                with bandwidth_scope(priority=job.priority):
+                    return func(job.key, *args, **kwargs)
+
+        try:
+            result = job._context.run(call)
+        except BaseException as error:
+            self._finish(job, FAILED)
+            if job._cancel_event.is_set():
+                job.future.set_exception(CancelledError(str(job.key)))
+            else:
+                job.future.set_exception(error)
+        else:
+            self._finish(job, DONE)
+            job.future.set_result(result)
+
+    def _finish(self, job: Job, state: str):
+        if state == FAILED and job._cancel_event.is_set():
+            state = CANCELLED
+        with self._condition:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            self._counts[state] += 1
+
+    def _cancelled(self, job: Job):
+        with self._condition:
+            # (a running job stops by itself, but is no job of its key anymore: a new
+            # submission of the key mustn't be deduped onto it)
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            if job.future.cancel():  # it was still queued
+                self._n_queued -= 1
+                self._counts[CANCELLED] += 1
+                self._condition.notify_all()
+
+    # ---------------------------------------------------------------------------------
+    # Inspecting
+
+    def queued(self) -> list:
+        """The queued jobs, in the order they'll run."""
+        with self._condition:
+            entries = sorted(self._heap)
+        return [
+            job
+            for priority, _, job in entries
+            if priority == job.priority and job.state == QUEUED
+        ]
+
+    def running(self) -> list:
+        """The running jobs."""
+        with self._condition:
+            return [job for job in self._jobs.values() if job.state == RUNNING]
+
+    def get(self, key: Hashable) -> Optional[Job]:
+        """The queued or running job of key, if any."""
+        return self._jobs.get(key)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel the queued or running job of key (False if there's none)."""
+        job = self._jobs.get(key)
+        return job.cancel() if job is not None else False
+
+    def stats(self) -> dict:
+        """The number of jobs queued, running, and done (failed, cancelled) so far."""
+        with self._condition:
+            running = sum(job.state == RUNNING for job in self._jobs.values())
+            return {QUEUED: self._n_queued, RUNNING: running, **self._counts}
+
+    def __len__(self):
+        """The number of queued jobs."""
+        return self._n_queued
+
+    # ---------------------------------------------------------------------------------
+    # Shutting down
+
+    def shutdown(self, wait: bool = True, *, cancel_queued: bool = False):
+        """Stop the workers once the queue is empty (or, with ``cancel_queued``,
+        right after their current jobs)."""
+        if cancel_queued:
+            for job in self.queued():
+                job.cancel()
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(max_workers={self.max_workers}, {self.stats()})"
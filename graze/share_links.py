@@ -71,8 +71,9 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum
-from typing import Callable, Optional
+from typing import Callable, Iterable, Optional
 from urllib.parse import urlsplit, urlunsplit, unquote
 
 
@@ -517,27 +518,174 @@ def resolve_onedrive(url: str) -> Optional[ResolvedShareLink]:
 
 # --------------------------------------------------------------------------------------
 # The registry
+#
+# Resolution is pure, so it's memoized: a url is resolved once (per change of the
+# registry), and a plain url costs a dict lookup after that -- which matters, since
+# every url graze fetches is resolved, to know whether it needs a special route. And
+# a url is only shown to the adapters of its host (those whose ``hosts`` match it),
+# plus those that didn't say which hosts they're for.
+
+#: The number of (default registry) resolutions memoized.
+DFLT_RESOLUTION_CACHE_SIZE = 4096
+#: The number of hosts whose adapters (``resolvers_of_host``) are memoized.
+DFLT_HOST_CACHE_SIZE = 1024
+
+
+class _RegistryDict(dict):
+    """A ``dict`` of the registry, that forgets the memoized resolutions (and the
+    index of adapters by host) whenever it's changed."""
+
+    def _changed(self):
+        _forget_resolutions()
+
+    def __setitem__(self, provider, resolver):
+        super().__setitem__(provider, resolver)
+        self._changed()
+
+    def __delitem__(self, provider):
+        super().__delitem__(provider)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, provider, resolver=None):
+        if provider in self:
+            return self[provider]
+        self[provider] = resolver
+        return resolver
+
+    def pop(self, *args):
+        try:
+            return super().pop(*args)
+        finally:
+            self._changed()
+
+    def popitem(self):
+        try:
+            return super().popitem()
+        finally:
+            self._changed()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
+class ShareLinkResolvers(_RegistryDict):
+    """The registry of provider adapters: ``provider -> resolver``, tried in order.
+
+    A ``dict``, that forgets the memoized resolutions (and its index of adapters by
+    host) whenever it's changed.
+    """
+
+
+class ShareLinkResolverHosts(_RegistryDict):
+    """The hosts of the adapters of the registry: ``provider -> host patterns``.
+
+    A ``dict``, that forgets the memoized resolutions (and the index of adapters by
+    host) whenever it's changed.
+    """
 
 
 #: Provider adapters, tried in order; the first non-``None`` result wins. Open-closed:
 #: extend it with :func:`add_share_link_resolver` instead of editing this module.
-share_link_resolvers: dict[str, ShareLinkResolver] = {
-    "dropbox": resolve_dropbox,
-    "google_drive": resolve_google_drive,
-    "onedrive": resolve_onedrive,
-}
+share_link_resolvers: dict[str, ShareLinkResolver] = ShareLinkResolvers(
+    {
+        "dropbox": resolve_dropbox,
+        "google_drive": resolve_google_drive,
+        "onedrive": resolve_onedrive,
+    }
+)
+
+#: The hosts (exact, or ``'*.<domain>'`` for the subdomains of one) whose urls the
+#: adapter of a provider resolves. An adapter without them is shown every url.
+share_link_resolver_hosts: dict[str, tuple[str, ...]] = ShareLinkResolverHosts(
+    {
+        "dropbox": DROPBOX_HOSTS,
+        "google_drive": GOOGLE_DRIVE_HOSTS + (GOOGLE_WORKSPACE_HOST,),
+        "onedrive": ONEDRIVE_HOSTS + ("*" + _SHAREPOINT_HOST_SUFFIX,),
+    }
+)
 
 
-def add_share_link_resolver(provider: str, resolver: ShareLinkResolver) -> None:
+def add_share_link_resolver(
+    provider: str,
+    resolver: ShareLinkResolver,
+    *,
+    hosts: Optional[Iterable[str]] = None,
+) -> None:
     """Register (or replace) a provider adapter.
 
     ``resolver`` takes a URL and returns a :class:`ResolvedShareLink`, or ``None``
     to mean "not mine, try the next one". Replacing an existing provider keeps its
     position in the try-order; a new one is appended (so it is tried last).
+
+    ``hosts`` (exact, or ``'*.<domain>'``) are those of the urls the adapter
+    resolves: it's then only shown urls of those hosts. Without them, it's shown
+    every url.
     """
+    if hosts is None:
+        share_link_resolver_hosts.pop(provider, None)
+    else:
+        share_link_resolver_hosts[provider] = tuple(host.lower() for host in hosts)
     share_link_resolvers[provider] = resolver
 
 
+def _host_matches(host: str, pattern: str) -> bool:
+    if pattern.startswith("*."):
+        return host.endswith(pattern[1:])
+    return host == pattern
+
+
+def resolvers_of_host(host: str) -> tuple[ShareLinkResolver, ...]:
+    """The adapters (of :data:`share_link_resolvers`, in order) a url of host is
+    shown: those whose hosts match it, and those that didn't say.
+
+    >>> resolvers_of_host('www.dropbox.com') == (resolve_dropbox,)
+    True
+    >>> resolvers_of_host('example.com')
+    ()
+    """
+    return _resolvers_of_host(host)
+
+
+@lru_cache(maxsize=DFLT_HOST_CACHE_SIZE)
+def _resolvers_of_host(host: str) -> tuple[ShareLinkResolver, ...]:
+    return tuple(
+        resolver
+        for provider, resolver in share_link_resolvers.items()
+        if (hosts := share_link_resolver_hosts.get(provider)) is None
+        or any(_host_matches(host, pattern) for pattern in hosts)
+    )
+
+
+def _resolved_with(resolvers: Iterable[ShareLinkResolver], url: str):
+    """The resolution of the first of the resolvers that resolves url (or that of a
+    plain url)"""
+    for resolve in resolvers:
+        resolved = resolve(url)
+        if resolved is not None:
+            return resolved
+    return _resolve_plain_url(url)
+
+
+@lru_cache(maxsize=DFLT_RESOLUTION_CACHE_SIZE)
+def _resolved_by_registry(url: str) -> ResolvedShareLink:
+    return _resolved_with(resolvers_of_host(_host_of(url)), url)
+
+
+def _forget_resolutions():
+    """Forget the memoized resolutions (to call when the registry changes)."""
+    _resolved_by_registry.cache_clear()
+    _resolvers_of_host.cache_clear()
+
+
 #: Schemes a plain URL may pass through with. Anything else is refused: this module
 #: describes *fetchable web resources*, and unknown schemes are not that.
 PASSTHROUGH_SCHEMES = ("http", "https")
@@ -580,7 +728,9 @@ def resolve_share_url(
     Args:
         url: The URL as a user pasted it. Surrounding whitespace is stripped.
         resolvers: Adapters to try, in order. Defaults to
-            :data:`share_link_resolvers`; pass your own to test in isolation.
+            :data:`share_link_resolvers` (whose resolutions are memoized, and only
+            asked of the adapters of the url's host); pass your own to test in
+            isolation.
 
     Returns:
         A :class:`ResolvedShareLink`. Never raises for an unresolvable link --
@@ -594,21 +744,138 @@ def resolve_share_url(
     >>> resolve_share_url('ftp://example.com/a.mp4').resolved
     False
     """
-    if resolvers is None:
-        resolvers = share_link_resolvers
     url = url.strip()
-    for resolve in resolvers.values():
-        resolved = resolve(url)
-        if resolved is not None:
-            return resolved
-    return _resolve_plain_url(url)
+    if resolvers is None or resolvers is share_link_resolvers:
+        return _resolved_by_registry(url)
+    return _resolved_with(resolvers.values(), url)
+
+
+# --------------------------------------------------------------------------------------
+# Bulk resolution
+
+
+#: An http(s) url whose host is a plain name (no IPv6 literal, nothing to unquote): its
+#: host, without parsing the url.
+_plain_http_url_re = re.compile(
+    r"^https?://(?:[^@/?#\s]*@)?([A-Za-z0-9.-]+)(?::\d*)?(?:[/?#]|$)", re.IGNORECASE
+)
+
+
+def _plain_host_of(url: str) -> str:
+    """The host of an http(s) url with a plain host name, else ``''`` (for the urls
+    to resolve the general way).
+
+    >>> _plain_host_of('https://Example.com:8080/a?b=c'), _plain_host_of('ftp://x/y')
+    ('example.com', '')
+    """
+    match = _plain_http_url_re.match(url)
+    return match.group(1).lower() if match else ""
+
+
+@dataclass(frozen=True)
+class ShareLinkResolutions:
+    """The resolutions of a batch of urls (see :func:`resolve_share_urls`).
+
+    Args:
+        resolutions: The resolution of each url, in the order of the urls.
+        stats: Provider -> the number of its ``urls``, of the ``unique`` ones, and
+            of the ``unresolved`` ones (those without a ``direct_url``; repeats
+            counted, as in ``urls``).
+    """
+
+    resolutions: tuple[ResolvedShareLink, ...]
+    stats: dict[str, dict[str, int]]
+
+    def __iter__(self):
+        return iter(self.resolutions)
+
+    def __len__(self):
+        return len(self.resolutions)
+
+    def __getitem__(self, i):
+        return self.resolutions[i]
+
+    @property
+    def direct_urls(self) -> list[Optional[str]]:
+        """The ``direct_url`` of each url (None for the unresolved ones)."""
+        return [resolved.direct_url for resolved in self.resolutions]
+
+
+def resolve_share_urls(
+    urls: Iterable[str], *, resolvers: Optional[dict[str, ShareLinkResolver]] = None
+) -> ShareLinkResolutions:
+    """Resolve many urls (like :func:`resolve_share_url` each): every distinct url
+    once, and those of a host with the adapters of the host, looked up once.
+
+    The resolutions are in the order of the urls, with per-provider counts:
+
+    >>> resolutions = resolve_share_urls([
+    ...     'https://www.dropbox.com/s/a1/x.csv?dl=0',
+    ...     'https://example.com/a.mp4',
+    ...     'https://www.dropbox.com/s/a1/x.csv?dl=0',
+    ...     'https://drive.google.com/drive/folders/1FoLd',
+    ... ])
+    >>> resolutions.direct_urls  # doctest: +NORMALIZE_WHITESPACE
+    ['https://www.dropbox.com/s/a1/x.csv?dl=1', 'https://example.com/a.mp4',
+     'https://www.dropbox.com/s/a1/x.csv?dl=1', None]
+    >>> resolutions.stats['dropbox']
+    {'urls': 2, 'unique': 1, 'unresolved': 0}
+    >>> resolutions.stats['google_drive']
+    {'urls': 1, 'unique': 1, 'unresolved': 1}
+
+    The resolutions aren't memoized (a batch would just evict the urls of the
+    memo that are used over and over).
+    """
+    urls = [url.strip() for url in urls]
+    urls_of_host: dict[str, list[str]] = {}
+    for url in dict.fromkeys(urls):
+        urls_of_host.setdefault(_plain_host_of(url), []).append(url)
+
+    default_registry = resolvers is None or resolvers is share_link_resolvers
+    resolution_of_url: dict[str, ResolvedShareLink] = {}
+    for host, host_urls in urls_of_host.items():
+        if not default_registry:
+            host_resolvers = tuple(resolvers.values())
+        elif host:
+            host_resolvers = resolvers_of_host(host)
+        else:  # (urls that need parsing, to tell their host)
+            for url in host_urls:
+                resolvers_of_url = resolvers_of_host(_host_of(url))
+                resolution_of_url[url] = _resolved_with(resolvers_of_url, url)
+            continue
+        if not host_resolvers and host:  # (plain http(s) urls: nothing to parse)
+            for url in host_urls:
+                resolution_of_url[url] = ResolvedShareLink(
+                    url=url, provider="http", kind=ShareLinkKind.FILE, direct_url=url
+                )
+            continue
+        for url in host_urls:
+            resolution_of_url[url] = _resolved_with(host_resolvers, url)
+
+    stats: dict[str, dict[str, int]] = {}
+    for resolved in resolution_of_url.values():
+        provider_stats = stats.setdefault(
+            resolved.provider, {"urls": 0, "unique": 0, "unresolved": 0}
+        )
+        provider_stats["unique"] += 1
+    resolutions = tuple(map(resolution_of_url.__getitem__, urls))
+    for resolved in resolutions:
+        provider_stats = stats[resolved.provider]
+        provider_stats["urls"] += 1
+        provider_stats["unresolved"] += not resolved.resolved
+    return ShareLinkResolutions(resolutions, stats)
 
 
 def direct_download_url(
-    url: str, *, resolvers: Optional[dict[str, ShareLinkResolver]] = None
+    url: str | ResolvedShareLink,
+    *,
+    resolvers: Optional[dict[str, ShareLinkResolver]] = None,
 ) -> str:
     """The URL to actually fetch, or raise :class:`ShareLinkResolutionError`.
 
+    ``url`` can also be its resolution (a :class:`ResolvedShareLink`), if it's at
+    hand already.
+
     >>> direct_download_url('https://drive.google.com/file/d/1AbC/view')
     'https://drive.google.com/uc?export=download&id=1AbC'
     >>> direct_download_url('https://1drv.ms/u/s!AbCd')
@@ -616,7 +883,10 @@ def direct_download_url(
         ...
     graze.share_links.ShareLinkResolutionError: Cannot resolve this onedrive link...
     """
-    resolved = resolve_share_url(url, resolvers=resolvers)
+    if isinstance(url, ResolvedShareLink):
+        resolved = url
+    else:
+        resolved = resolve_share_url(url, resolvers=resolvers)
     if resolved.direct_url is None:
         raise ShareLinkResolutionError(
             f"Cannot resolve this {resolved.provider} link to a direct-download URL "
@@ -0,0 +1,261 @@
+"""In-memory caches that spill oversized contents to disk.
+
+With a ``dict`` (or any non-file ``MutableMapping``) as cache, ``graze`` keeps whole
+payloads in memory: one unexpectedly huge url can take the process down. A
+``SpillingCache`` keeps contents of up to ``max_in_memory`` bytes in memory (in its
+``store``, a ``dict`` by default), and *spills* bigger ones to temporary files. A
+spilled entry is a ``SpilledContents``: a handle on its file, to ``open`` (file-like)
+or ``mmap``, so that the contents needn't ever be in memory all at once.
+
+>>> cache = SpillingCache(max_in_memory=10)
+>>> cache['small'] = b'tiny'
+>>> cache['big'] = b'more than ten bytes'
+>>> cache['small']
+b'tiny'
+>>> spilled = cache['big']
+>>> spilled  # doctest: +ELLIPSIS
+SpilledContents('...', size=19)
+>>> with spilled.open() as f:
+...     f.read(9)
+b'more than'
+>>> spilled.mmap()[-5:]
+b'bytes'
+
+What's in memory and what's spilled is accounted separately:
+
+>>> cache.stats()
+{'in_memory': 1, 'in_memory_bytes': 4, 'spilled': 1, 'spilled_bytes': 19}
+
+Given a spilling cache, ``graze`` streams downloads (from sources that can, like
+``Internet``) into it, so a huge download is spilled as it comes in, rather than
+first received in memory -- memory stays bounded, whatever the internet sends back:
+
+>>> from graze import graze
+>>> contents = graze(url, cache=SpillingCache(max_in_memory=2**26))  # doctest: +SKIP
+
+A spilled file is removed when its entry is deleted (or replaced), and when its
+handle is garbage collected.
+"""
+
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+from collections.abc import Iterator, MutableMapping
+from typing import BinaryIO, Optional, Union
+
+DFLT_MAX_IN_MEMORY = 64 * 1024 * 1024
+DFLT_CHK_SIZE = 1024 * 1024
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SpilledContents:
+    """The contents of a cache entry, spilled to a (temporary) file.
+
+    Args:
+        path: The file holding the contents.
+        size: The number of bytes of the contents.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._finalizer = weakref.finalize(self, _remove_quietly, path)
+
+    def __len__(self):
+        return self.size
+
+    def open(self) -> BinaryIO:
+        """A (binary, read-only) file object of the contents."""
+        return open(self.path, "rb")
+
+    def mmap(self) -> Union[mmap.mmap, bytes]:
+        """A (read-only) memory map of the contents (``b''`` if they're empty, which
+        can't be mapped)."""
+        if not self.size:
+            return b""
+        with self.open() as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_chunks(self, chk_size: int = DFLT_CHK_SIZE) -> Iterator[bytes]:
+        """Yield the contents in chunks."""
+        with self.open() as f:
+            while chk := f.read(chk_size):
+                yield chk
+
+    def read(self) -> bytes:
+        """The contents (all of them, in memory)."""
+        with self.open() as f:
+            return f.read()
+
+    def discard(self):
+        """Remove the file."""
+        self._finalizer()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r}, size={self.size})"
+
+
+class Spool:
+    """Receives contents (``write``) in memory, up to ``max_in_memory`` bytes, and in
+    a temporary file (in ``dir``) beyond that.
+
+    >>> spool = Spool(max_in_memory=4)
+    >>> spool.write(b'abc')
+    >>> spool.contents()
+    b'abc'
+    >>> spool.write(b'def')
+    >>> spool.contents()  # doctest: +ELLIPSIS
+    SpilledContents('...', size=6)
+    """
+
+    def __init__(
+        self, max_in_memory: int = DFLT_MAX_IN_MEMORY, *, dir: Optional[str] = None
+    ):
+        self.max_in_memory = max_in_memory
+        self.dir = dir
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._contents = None
+
+    def write(self, chk: bytes):
+        self.size += len(chk)
+        if self._file is None and self.size > self.max_in_memory:
+            fd, path = tempfile.mkstemp(dir=self.dir, prefix="graze-", suffix=".spill")
+            self._file = os.fdopen(fd, "wb")
+            self._contents = SpilledContents(path, 0)
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is None:
+            self._buffer += chk
+        else:
+            self._file.write(chk)
+
+    def contents(self) -> Union[bytes, SpilledContents]:
+        """What was written: bytes, or the ``SpilledContents`` they were spilled to."""
+        if self._file is None:
+            return bytes(self._buffer)
+        if not self._file.closed:
+            self._file.flush()
+        self._contents.size = self.size
+        return self._contents
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def discard(self):
+        """Drop what was written (removing the spill file, if any)."""
+        self.close()
+        if self._contents is not None:
+            self._contents.discard()
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+class SpillingCache(MutableMapping):
+    """A cache keeping contents of up to ``max_in_memory`` bytes in memory, and
+    spilling bigger ones to temporary files (as ``SpilledContents``).
+
+    Args:
+        store: Where the entries (the contents kept in memory, and the handles of
+            the spilled ones) are kept. Defaults to a new ``dict``.
+        max_in_memory: The size, in bytes, above which contents are spilled.
+        spill_dir: The folder of the spill files (default: the system's temporary
+            folder).
+    """
+
+    def __init__(
+        self,
+        store: Optional[MutableMapping] = None,
+        *,
+        max_in_memory: int = DFLT_MAX_IN_MEMORY,
+        spill_dir: Optional[str] = None,
+    ):
+        self.store = {} if store is None else store
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._sizes = {"in_memory": 0, "spilled": 0}  # key kind -> bytes
+        self._counts = {"in_memory": 0, "spilled": 0}
+        for v in self.store.values():
+            self._account(v, +1)
+
+    def spool(self) -> Spool:
+        """A ``Spool`` to receive contents in, before setting them (so that contents
+        too big for memory never are all in it)."""
+        return Spool(self.max_in_memory, dir=self.spill_dir)
+
+    def __setitem__(self, k, v):
+        if not isinstance(v, SpilledContents) and len(v) > self.max_in_memory:
+            with self.spool() as spool:
+                spool.write(v)
+            v = spool.contents()
+        with self._lock:
+            if self.store.get(k) is v:
+                return
+            self._forget(k)
+            self.store[k] = v
+            self._account(v, +1)
+
+    def __getitem__(self, k):
+        return self.store[k]
+
+    def __delitem__(self, k):
+        with self._lock:
+            if k not in self.store:
+                raise KeyError(k)
+            self._forget(k)
+
+    def _forget(self, k):
+        """Remove the entry of k (if any), and its spill file. Call with the lock."""
+        v = self.store.pop(k, None)
+        if v is not None:
+            self._account(v, -1)
+            if isinstance(v, SpilledContents):
+                v.discard()
+
+    def _account(self, v, sign: int):
+        kind = "spilled" if isinstance(v, SpilledContents) else "in_memory"
+        self._counts[kind] += sign
+        self._sizes[kind] += sign * len(v)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, k):
+        return k in self.store
+
+    def stats(self) -> dict:
+        """The number of entries, and bytes, in memory and spilled."""
+        with self._lock:
+            return {
+                "in_memory": self._counts["in_memory"],
+                "in_memory_bytes": self._sizes["in_memory"],
+                "spilled": self._counts["spilled"],
+                "spilled_bytes": self._sizes["spilled"],
+            }
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(max_in_memory={self.max_in_memory}, {self.stats()})"
+        )
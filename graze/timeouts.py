@@ -0,0 +1,254 @@
+"""Timeouts and deadlines, so that a stalled host can't hang a fetch forever.
+
+A request without a timeout waits on a silent socket indefinitely. graze bounds every
+request with ``Timeouts``:
+
+- ``connect``: how long to wait for the connection to be established,
+- ``read``: how long the connection may stay idle (no bytes coming in),
+- ``total``: how long the whole transfer (of one request) may take.
+
+On top of that, a *deadline* bounds a whole call -- all of its retries, redirects and
+share-link hops included. Timeouts and deadline live in a ``timeout_scope``, which
+every fetch function of graze consults (so they reach the custom ``url_to_contents``
+functions of an ``Internet`` too, without these having to pass them around):
+
+>>> with timeout_scope(Timeouts(connect=5, read=10), deadline=60):
+...     current_timeouts()
+...     requests_timeout()  # the (connect, read) timeouts to give ``requests``
+Timeouts(connect=5, read=10, total=None)
+(5, 10)
+
+Scopes nest, and the earliest deadline wins. As the deadline gets closer, the
+timeouts of the requests made shrink accordingly:
+
+>>> with timeout_scope(deadline=60):
+...     with timeout_scope(deadline=3):
+...         connect, read = requests_timeout()
+>>> connect <= 3 and read <= 3
+True
+
+When the deadline has passed, ``check_deadline`` (which the fetch functions call
+between chunks) raises ``DeadlineExceeded``, a ``TimeoutError``:
+
+>>> with timeout_scope(deadline=0):
+...     check_deadline('http://slow.example.com')
+Traceback (most recent call last):
+  ...
+graze.timeouts.DeadlineExceeded: The deadline passed while fetching http://slow.example.com
+
+Give ``Internet`` its timeouts, and/or a deadline per fetch, and ``graze`` a deadline
+for the call:
+
+>>> from graze import Graze, Internet, graze
+>>> g = Graze(source=Internet(timeouts=Timeouts(connect=3, read=20)))  # doctest: +SKIP
+>>> contents = graze('https://example.com/big.csv', timeout=120)  # doctest: +SKIP
+
+Fetches can also be cancelled (by whatever set the ``threading.Event`` of their
+``cancellation_scope``, like ``graze.scheduler.DownloadScheduler`` does): they then
+stop at their next chunk, raising ``FetchCancelled``.
+"""
+
+import socket
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+clock = time.monotonic
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the deadline of a fetch (or the total timeout of a transfer) passed."""
+
+
+@dataclass(frozen=True)
+class Timeouts:
+    """The timeouts of a request, in seconds (None for no timeout).
+
+    Args:
+        connect: How long to wait for the connection to be established.
+        read: How long the connection may stay idle (no bytes coming in).
+        total: How long a whole transfer (one request) may take.
+    """
+
+    connect: Optional[float] = 30.0
+    read: Optional[float] = 60.0
+    total: Optional[float] = None
+
+
+DFLT_TIMEOUTS = Timeouts()
+
+_timeouts: ContextVar[Timeouts] = ContextVar("graze_timeouts", default=DFLT_TIMEOUTS)
+_deadline: ContextVar[Optional[float]] = ContextVar("graze_deadline", default=None)
+
+
+def _earliest(*times: Optional[float]) -> Optional[float]:
+    times = [t for t in times if t is not None]
+    return min(times) if times else None
+
+
+@contextmanager
+def _scope(timeouts: Optional[Timeouts], deadline_at: Optional[float]):
+    timeouts_token = _timeouts.set(timeouts) if timeouts is not None else None
+    deadline_token = _deadline.set(_earliest(_deadline.get(), deadline_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(deadline_token)
+        if timeouts_token is not None:
+            _timeouts.reset(timeouts_token)
+
+
+def _deadline_at(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else clock() + deadline
+
+
+def timeout_scope(
+    timeouts: Optional[Timeouts] = None, *, deadline: Optional[float] = None
+):
+    """A context in which fetches use ``timeouts`` (if given, else those of the
+    enclosing scope) and must be done within ``deadline`` seconds (if given, and
+    earlier than the deadline of the enclosing scope)."""
+    return _scope(timeouts, _deadline_at(deadline))
+
+
+def iter_in_timeout_scope(
+    chunks: Iterable, timeouts: Optional[Timeouts] = None, *, deadline=None
+) -> Iterator:
+    """Yield the items of chunks, each of them computed in a ``timeout_scope``
+    (the deadline counting from the first item being asked for).
+
+    This is how to give a timeout scope to a generator: setting one around the
+    iteration would leak it to the consumer between items.
+    """
+    deadline_at = _deadline_at(deadline)
+    iterator = iter(chunks)
+    while True:
+        with _scope(timeouts, deadline_at):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def current_timeouts() -> Timeouts:
+    """The timeouts of the current scope."""
+    return _timeouts.get()
+
+
+def remaining() -> Optional[float]:
+    """The seconds left before the deadline of the current scope (None if none)."""
+    deadline_at = _deadline.get()
+    return None if deadline_at is None else deadline_at - clock()
+
+
+def check_deadline(what: str = "") -> None:
+    """Raise ``DeadlineExceeded`` if the deadline of the current scope passed (and
+    ``FetchCancelled`` if its fetch was cancelled)."""
+    check_cancelled(what)
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"The deadline passed while fetching {what}".strip())
+
+
+def transfer_deadline() -> Optional[float]:
+    """The (monotonic) time by which a transfer starting now has to be done: the
+    earliest of the scope's deadline and the end of the ``total`` timeout."""
+    total = current_timeouts().total
+    return _earliest(_deadline.get(), _deadline_at(total))
+
+
+def _clipped(timeout: Optional[float], until: Optional[float]) -> Optional[float]:
+    if until is None:
+        return timeout
+    left = max(until - clock(), 0.001)
+    return left if timeout is None else min(timeout, left)
+
+
+def requests_timeout(until: Optional[float] = None) -> tuple:
+    """The ``(connect, read)`` timeout to give ``requests`` for a request that has to
+    be done by ``until`` (defaults to ``transfer_deadline()``)."""
+    timeouts = current_timeouts()
+    until = transfer_deadline() if until is None else until
+    return _clipped(timeouts.connect, until), _clipped(timeouts.read, until)
+
+
+def socket_timeout(until: Optional[float] = None):
+    """The timeout to give ``urllib`` (which has the same for connecting and reading:
+    the largest of the two) for a request that has to be done by ``until``."""
+    timeouts = current_timeouts()
+    until = transfer_deadline() if until is None else until
+    timeout = _largest(timeouts.connect, timeouts.read)
+    timeout = _clipped(timeout, until)
+    return socket._GLOBAL_DEFAULT_TIMEOUT if timeout is None else timeout
+
+
+def _largest(*timeouts):
+    """The largest timeout, or None (no timeout) if any is None."""
+    if any(t is None for t in timeouts):
+        return None
+    return max(timeouts)
+
+
+def within(chunks: Iterable[bytes], until: Optional[float], what: str = ""):
+    """Yield the chunks, raising ``DeadlineExceeded`` if ``until`` (a monotonic time)
+    passes before the last one is in (and ``FetchCancelled`` if the fetch is
+    cancelled)."""
+    cancel_event = _cancel_event.get()
+    for chunk in chunks:
+        if until is not None and clock() > until:
+            raise DeadlineExceeded(
+                f"The transfer took too long (deadline or total timeout) for {what}"
+            )
+        if cancel_event is not None and cancel_event.is_set():
+            raise FetchCancelled(f"The fetch of {what} was cancelled")
+        yield chunk
+
+
+# --------------------------------------------------------------------------------------
+# Cancellation: a deadline of "now", on demand
+
+
+class FetchCancelled(Exception):
+    """Raised in a fetch whose cancellation event was set."""
+
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar(
+    "graze_cancel_event", default=None
+)
+
+
+@contextmanager
+def cancellation_scope(event: threading.Event):
+    """A context in which fetches stop (raising ``FetchCancelled``, at their next
+    chunk) once event is set.
+
+    >>> event = threading.Event()
+    >>> with cancellation_scope(event):
+    ...     event.set()
+    ...     list(within([b'a', b'b'], None, 'http://a.com'))
+    Traceback (most recent call last):
+      ...
+    graze.timeouts.FetchCancelled: The fetch of http://a.com was cancelled
+    """
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+
+def is_cancellable() -> bool:
+    """Whether fetches of the current scope can be cancelled."""
+    return _cancel_event.get() is not None
+
+
+def check_cancelled(what: str = "") -> None:
+    """Raise ``FetchCancelled`` if the fetch of the current scope was cancelled."""
+    cancel_event = _cancel_event.get()
+    if cancel_event is not None and cancel_event.is_set():
+        raise FetchCancelled(f"The fetch of {what} was cancelled")
@@ -1,20 +1,34 @@
 """Utils"""
 
-from typing import Union
+from typing import Optional, TypeVar, Union
+from collections import OrderedDict
 from collections.abc import Callable
+from contextlib import contextmanager
 from functools import partial
 import os
+import errno
+import http.client
+import io
 import urllib
 import re
-from io import BytesIO
-
+import tempfile
+import threading
+
+from graze.retry import RetryPolicy
+from graze.bandwidth import throttled
+from graze.progress import reported, total_of
+from graze.timeouts import check_deadline, socket_timeout, transfer_deadline, within
+from graze.content_kind import ANY_KIND, ContentKindMismatch, kind_checked
+from graze.layouts import MAX_NAME_BYTES
 from graze.share_links import (
+    ResolvedShareLink,
     ShareLinkResolutionError,
     direct_download_url,
     resolve_share_url,
 )
 
 Filepath = str
+T = TypeVar("T")
 
 
 def last_element(iterable, *, default=None):
@@ -109,14 +123,197 @@ tiny_url.encode = tiny_url
 tiny_url.decode = original_url_of_tiny_url
 
 
+# The maximum number of directories ``known_dirs`` remembers.
+DFLT_MAX_KNOWN_DIRS = 2**16
+
+
+class KnownDirs:
+    """A (bounded, thread-safe) set of the directories known to exist, so that writes
+    to files in them needn't ``os.makedirs`` (a ``stat`` per path component) first.
+
+    A directory removed (by something else) after being remembered makes a write
+    fail with ``ENOENT``: ``write_in_dir`` then forgets it, makes it again, and
+    retries the write.
+
+    >>> import tempfile
+    >>> dirs = KnownDirs(maxsize=2)
+    >>> dirpath = os.path.join(tempfile.mkdtemp(), 'a', 'b')
+    >>> dirs.ensure(dirpath)
+    False
+    >>> os.path.isdir(dirpath), dirs.ensure(dirpath)
+    (True, True)
+
+    The least recently ensured directories are forgotten beyond ``maxsize``:
+
+    >>> _ = dirs.ensure(os.path.dirname(dirpath)), dirs.ensure(tempfile.gettempdir())
+    >>> dirpath in dirs
+    False
+    """
+
+    def __init__(self, maxsize: int = DFLT_MAX_KNOWN_DIRS):
+        self.maxsize = maxsize
+        self._dirs = OrderedDict()  # (used as an ordered set)
+        self._lock = threading.Lock()
+
+    def __contains__(self, dirpath: str):
+        return os.path.abspath(dirpath) in self._dirs
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def ensure(self, dirpath: str) -> bool:
+        """Make sure dirpath exists (making it, and its parents, if it isn't known to
+        exist). Returns whether it was known to exist."""
+        dirpath = os.path.abspath(dirpath)
+        with self._lock:
+            if dirpath in self._dirs:
+                self._dirs.move_to_end(dirpath)
+                return True
+        os.makedirs(dirpath, exist_ok=True)
+        with self._lock:
+            self._dirs[dirpath] = None
+            if len(self._dirs) > self.maxsize:
+                self._dirs.popitem(last=False)
+        return False
+
+    def forget(self, dirpath: str):
+        """Forget dirpath is known to exist (e.g. because it was removed)."""
+        with self._lock:
+            self._dirs.pop(os.path.abspath(dirpath), None)
+
+    def clear(self):
+        with self._lock:
+            self._dirs.clear()
+
+
+#: The directories (of this process) known to exist.
+known_dirs = KnownDirs()
+
+
 def _ensure_dirs_of_file_exists(filepath: str):
-    """Recursively ensure all dirs necessary for filepath exist.
-    Return filepath (useful for pipelines)"""
+    """Recursively ensure all dirs necessary for filepath exist (doing nothing if
+    they're ``known_dirs``). Return filepath (useful for pipelines)"""
     dirpath = os.path.dirname(filepath)
-    os.makedirs(dirpath, exist_ok=True)  # TODO: REALLY don't like this here.
+    if dirpath:
+        known_dirs.ensure(dirpath)
     return filepath
 
 
+def write_in_dir(write: Callable[[], T], filepath: str) -> T:
+    """Call write (which writes filepath, and returns what's to return), having made
+    sure the directory of filepath exists.
+
+    The directory is made (and remembered, in ``known_dirs``) if it isn't known to
+    exist. If it was, but the write fails because it doesn't anymore (``ENOENT``, or a
+    ``KeyError`` -- as ``dol`` stores raise -- with the directory gone), it's forgotten,
+    made again, and the write is retried.
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'a', 'b', 'file.txt')
+    >>> write_in_dir(lambda: open(filepath, 'w').write('hi'), filepath)
+    2
+    """
+    dirpath = os.path.dirname(filepath)
+    if not dirpath:
+        return write()
+    was_known = known_dirs.ensure(dirpath)
+    try:
+        return write()
+    except (OSError, KeyError) as error:
+        if not was_known or getattr(error, "errno", errno.ENOENT) != errno.ENOENT:
+            raise
+        if os.path.isdir(dirpath):
+            raise
+        known_dirs.forget(dirpath)
+        known_dirs.ensure(dirpath)
+        return write()
+
+
+def remove_empty_dirs(dirpath: str, rootdir: str):
+    """Remove dirpath, and its parents up to (but not including) rootdir, as long as
+    they're empty (forgetting them in ``known_dirs``).
+
+    >>> import tempfile
+    >>> rootdir = tempfile.mkdtemp()
+    >>> os.makedirs(os.path.join(rootdir, 'a', 'b'))
+    >>> remove_empty_dirs(os.path.join(rootdir, 'a', 'b'), rootdir)
+    >>> os.listdir(rootdir)
+    []
+    """
+    rootdir = os.path.abspath(os.path.expanduser(rootdir))
+    dirpath = os.path.abspath(dirpath)
+    while dirpath != rootdir and dirpath.startswith(rootdir):
+        try:
+            os.rmdir(dirpath)
+        except OSError:  # (not empty)
+            return
+        known_dirs.forget(dirpath)
+        dirpath = os.path.dirname(dirpath)
+
+
+class InsufficientSpace(OSError):
+    """Raised when there isn't enough free disk space for a file to be written."""
+
+
+# Files smaller than this aren't preallocated (they don't fragment, and the syscalls
+# would cost more than they save).
+DFLT_MIN_PREALLOCATE_SIZE = 1024 * 1024
+# The disk space (in bytes) to leave free when preallocating a file.
+DFLT_MIN_FREE_SPACE = 0
+
+
+def preallocate(
+    file,
+    nbytes: Optional[int],
+    *,
+    min_size: int = DFLT_MIN_PREALLOCATE_SIZE,
+    min_free: int = DFLT_MIN_FREE_SPACE,
+) -> bool:
+    """Reserve the disk space of the nbytes about to be written to (the file object)
+    file, from its current position, so that the file is written in one piece, and
+    a lack of space is found out before writing rather than after.
+
+    Raises ``InsufficientSpace`` (an ``OSError``, with ``errno.ENOSPC``) if nbytes
+    (plus ``min_free``) aren't available. Returns whether the space was reserved:
+    nothing is done for files under ``min_size`` bytes, for files that aren't
+    files on disk, or where the system can't (it's ``os.posix_fallocate``, where
+    there's one).
+
+    Note: The file's size becomes (at least) its position plus nbytes, so truncate it
+    if fewer bytes end up written.
+    """
+    if nbytes is None or nbytes < max(min_size, 1):
+        return False
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+    if hasattr(os, "fstatvfs"):
+        stat = os.fstatvfs(fd)
+        free = stat.f_bavail * stat.f_frsize
+        if nbytes + min_free > free:
+            raise InsufficientSpace(
+                errno.ENOSPC,
+                f"{nbytes} bytes are needed (and {min_free} to be left free), but "
+                f"only {free} are available",
+                getattr(file, "name", None),
+            )
+    if not hasattr(os, "posix_fallocate"):
+        return False
+    file.flush()
+    try:
+        os.posix_fallocate(fd, file.tell(), nbytes)
+    except OSError as error:
+        if error.errno == errno.ENOSPC:
+            raise InsufficientSpace(
+                errno.ENOSPC,
+                f"Could not reserve {nbytes} bytes",
+                getattr(file, "name", None),
+            ) from error
+        return False  # (the filesystem doesn't support it)
+    return True
+
+
 def clog(condition: bool, *args, log_func: Callable = print, **kwargs):
     """Conditional log
 
@@ -166,7 +363,7 @@ def handle_missing_dir(dirpath: str, prefix_msg="", ask_first=True, verbose=True
 def get_content_size(url: str, *, default=None):
     """Get the content size of a url, if available, without downloading the content."""
     request = urllib.request.Request(url, method="HEAD")
-    with urllib.request.urlopen(request) as response:
+    with urllib.request.urlopen(request, timeout=socket_timeout()) as response:
         content_length = response.getheader("Content-Length")
         if content_length is not None:
             return int(content_length)
@@ -240,12 +437,16 @@ def human_readable_bytes(
 
 DFLT_USER_AGENT = "Wget/1.16 (linux-gnu)"
 DFLT_CHK_SIZE = 1024
+# The size reads into a buffer grow to (doubling while they come back full)
+DFLT_MAX_CHK_SIZE = 1024 * 1024
+# Chunk size for streams handed to a caller (as opposed to copied into a buffer)
+DFLT_STREAM_CHK_SIZE = 64 * 1024
 
 
 def _first_bytes(src, n_bytes=None):
     """Get the first n_bytes of a src, which can be a bytes object or a file path."""
-    if isinstance(src, bytes):
-        return src[slice(0, n_bytes)]
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src[slice(0, n_bytes)])
     elif isinstance(src, str):
         with open(src, "rb") as file:
             return file.read(n_bytes)
@@ -253,49 +454,302 @@ def _first_bytes(src, n_bytes=None):
         file.read(n_bytes)
 
 
-def chks_of_url_contents(url, *, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT):
-    """Yield chunks of a url's contents."""
+def chunks_of_bytes(b: bytes, chk_size: int = DFLT_STREAM_CHK_SIZE):
+    """Yield successive chunks (of at most ``chk_size`` bytes) of ``b``.
+
+    >>> list(chunks_of_bytes(b'abcdefg', 3))
+    [b'abc', b'def', b'g']
+    >>> list(chunks_of_bytes(b'', 3))
+    []
+    """
+    view = memoryview(b)
+    for i in range(0, len(view), chk_size):
+        yield bytes(view[i : i + chk_size])
+
+
+def chunks_of_file(filepath: Filepath, chk_size: int = DFLT_STREAM_CHK_SIZE):
+    """Yield successive chunks (of at most ``chk_size`` bytes) of a file's contents."""
+    with open(filepath, "rb") as f:
+        while chk := f.read(chk_size):
+            yield chk
+
+
+def tee_chunks_to_file(
+    chunks, filepath: Filepath, *, size: Optional[Callable[[], Optional[int]]] = None
+):
+    """Yield ``chunks`` while writing them to ``filepath``, atomically.
+
+    The chunks go to a hidden temporary file in the same directory, which replaces
+    ``filepath`` only once ``chunks`` is exhausted. If the stream fails, or the
+    consumer stops iterating early, the temporary file is removed and ``filepath``
+    is left as it was: a partial download is never committed.
+
+    ``size``, if given, is called once the first chunk is in, and returns the total
+    number of bytes expected (or None, if unknown), to ``preallocate`` them.
+
+    >>> import tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'sub', 'file.bin')
+    >>> list(tee_chunks_to_file([b'ab', b'cd'], filepath))
+    [b'ab', b'cd']
+    >>> open(filepath, 'rb').read()
+    b'abcd'
+    """
+    with _replacing_file(filepath) as tmp_file:
+        preallocated = False
+        for chk in chunks:
+            if size is not None and not tmp_file.tell():
+                preallocated = preallocate(tmp_file, size())
+            tmp_file.write(chk)
+            yield chk
+        if preallocated:
+            tmp_file.truncate()  # (in case fewer bytes came than announced)
+
+
+@contextmanager
+def _replacing_file(filepath: Filepath):
+    """A (binary, writable) file object of a hidden temporary file next to filepath,
+    that replaces filepath if the ``with`` block completes, and is removed if not (so
+    filepath is either left as it was, or has everything written)."""
+    dirpath, filename = os.path.split(filepath)
+    mkstemp = partial(
+        tempfile.mkstemp,
+        dir=dirpath or ".",
+        prefix=f".{_shortened(filename, MAX_NAME_BYTES - len('..XXXXXXXX.part'))}.",
+        suffix=".part",
+    )
+    fd, tmp_filepath = write_in_dir(mkstemp, filepath)
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            yield tmp_file
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def _shortened(name: str, max_bytes: int) -> str:
+    """name, cut to (the characters fitting in) max_bytes bytes of utf-8.
+
+    >>> _shortened('café', 4), _shortened('café', 5)
+    ('caf', 'café')
+    """
+    encoded = name.encode("utf-8", "surrogatepass")
+    if len(encoded) <= max_bytes:
+        return name
+    return encoded[:max_bytes].decode("utf-8", "ignore")
+
+
+def _urlopen(url, user_agent=DFLT_USER_AGENT):
+    """Open url (with ``urllib``), within the deadline of the current timeout scope.
+    Returns the response and the time (if any) by which it must be read."""
     req = urllib.request.Request(url)
     req.add_header("user-agent", user_agent)
-    with urllib.request.urlopen(req) as response:
-        while True:
-            chk = response.read(chk_size)
-            if len(chk) > 0:
-                yield chk
-            else:
-                break
+    check_deadline(url)
+    until = transfer_deadline()
+    return urllib.request.urlopen(req, timeout=socket_timeout(until)), until
+
+
+def _received(chks, response, url, until):
+    """chks (read from the response of url), bounded by the deadline, throttled, and
+    reported."""
+    total = total_of(response.headers, decoded=False)
+    return reported(throttled(within(chks, until, url), url), url, total)
+
+
+def chks_of_url_contents(url, *, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT):
+    """Yield chunks of a url's contents."""
+    response, until = _urlopen(url, user_agent)
+    with response:
+        chks = iter(partial(response.read, chk_size), b"")
+        yield from _received(chks, response, url, until)
+
+
+def _reads_into(
+    buffer, read_into, *, chk_size=DFLT_CHK_SIZE, max_chk_size=DFLT_MAX_CHK_SIZE
+):
+    """Fill the buffer with ``read_into`` (a ``readinto`` method), yielding the
+    (memoryviews of the) parts of it filled by each read. The reads start at chk_size
+    bytes, and double (up to max_chk_size) while they come back full.
+
+    >>> from io import BytesIO
+    >>> buffer = bytearray(10)
+    >>> [bytes(part) for part in _reads_into(buffer, BytesIO(b'0123456789').readinto, chk_size=2)]
+    [b'01', b'2345', b'6789']
+    """
+    view = memoryview(buffer)
+    position, end = 0, len(view)
+    while position < end:
+        n = read_into(view[position : min(end, position + chk_size)])
+        if not n:
+            raise http.client.IncompleteRead(bytes(), end - position)
+        yield view[position : position + n]
+        position += n
+        if n == chk_size:
+            chk_size = min(2 * chk_size, max_chk_size)
+
+
+def _receive_url_contents(
+    url, *, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT
+) -> bytearray:
+    """The contents of url, received in a single buffer: when the response announces
+    its size (``Content-Length``), the buffer is allocated once, and filled by the
+    socket reads themselves (``readinto``), so no bytes are copied. Otherwise, reads
+    (of growing size) are appended to it."""
+    response, until = _urlopen(url, user_agent)
+    with response:
+        size = total_of(response.headers, decoded=False)
+        if size is not None:
+            buffer = bytearray(size)
+            reads = _reads_into(buffer, response.readinto, chk_size=chk_size)
+            for _ in _received(reads, response, url, until):
+                pass
+            return buffer
+        buffer = bytearray()
+        for chk in _received(_growing_reads(response, chk_size), response, url, until):
+            buffer += chk
+        return buffer
+
+
+def _growing_reads(response, chk_size=DFLT_CHK_SIZE, max_chk_size=DFLT_MAX_CHK_SIZE):
+    """Yield the reads of response, doubling their size while they come back full."""
+    while chk := response.read(chk_size):
+        yield chk
+        if len(chk) == chk_size:
+            chk_size = min(2 * chk_size, max_chk_size)
+
+
+def _copy_url_contents(
+    url,
+    file,
+    *,
+    chk_size=DFLT_CHK_SIZE,
+    user_agent=DFLT_USER_AGENT,
+    preallocate_file: bool = False,
+):
+    """Write the contents of url to (the file object) file, reading them (with reads
+    of growing size) into one reused buffer. With ``preallocate_file``, the disk
+    space of the contents is reserved first, if their size is known.
+
+    Fewer bytes than the response announced raise ``http.client.IncompleteRead``
+    (``readinto`` just stops, where ``read`` would raise)."""
+    response, until = _urlopen(url, user_agent)
+    with response:
+        size = total_of(response.headers, decoded=False)
+        if preallocate_file:
+            preallocate(file, size)
+        buffer = bytearray(DFLT_MAX_CHK_SIZE)
+        n_bytes = 0
+        for part in _received(
+            _reused_reads_into(buffer, response.readinto, chk_size),
+            response,
+            url,
+            until,
+        ):
+            file.write(part)
+            n_bytes += len(part)
+        if size is not None and n_bytes < size:
+            raise http.client.IncompleteRead(bytes(), size - n_bytes)
+
+
+def _reused_reads_into(buffer, read_into, chk_size=DFLT_CHK_SIZE):
+    """Yield the (memoryviews of the) reads of ``read_into`` into buffer, each read
+    overwriting the previous one. The reads start at chk_size bytes, and double (up
+    to the size of buffer) while they come back full."""
+    view = memoryview(buffer)
+    chk_size = min(chk_size, len(view))
+    while n := read_into(view[:chk_size]):
+        yield view[:n]
+        if n == chk_size:
+            chk_size = min(2 * chk_size, len(view))
 
 
 def download_url_contents(
-    url, file=None, *, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT
+    url,
+    file=None,
+    *,
+    chk_size=DFLT_CHK_SIZE,
+    user_agent=DFLT_USER_AGENT,
+    retry: Optional[RetryPolicy] = None,
 ):
     """
     Download url contents into a `file` object, or return bytes if `file` is None.
+
+    The bytes are received in place: when the response says how many there are,
+    they're read straight into a buffer of that size, which the `bytes` returned are
+    one copy of (so a download takes about twice the memory of its contents: see
+    `receive_url_contents` for the buffer itself). Reads start at `chk_size` bytes and
+    grow (up to `DFLT_MAX_CHK_SIZE`) while the data keeps coming.
+
+    If a `retry` policy (a `graze.retry.RetryPolicy`) is given, failed downloads are
+    retried according to it. When `file` is a file object, a retry starts by
+    rewinding it to where it was (so needs it to be seekable, else no retry).
     """
+    _download = partial(
+        _download_url_contents, url, chk_size=chk_size, user_agent=user_agent
+    )
+    return _retried_download(_download, file, retry)
+
+
+def receive_url_contents(
+    url,
+    *,
+    chk_size=DFLT_CHK_SIZE,
+    user_agent=DFLT_USER_AGENT,
+    retry: Optional[RetryPolicy] = None,
+) -> bytearray:
+    """
+    The contents of url in the (mutable) `bytearray` they were received in, rather
+    than the `bytes` copy of it that `download_url_contents` returns: a download then
+    takes about as much memory as its contents.
+
+    The buffer is the caller's alone: don't store it where changing it would change
+    what's stored (a cache), or give `bytes(buffer)` there.
+    """
+    _receive = partial(
+        _receive_url_contents, url, chk_size=chk_size, user_agent=user_agent
+    )
+    return _retried_download(lambda file: _receive(), None, retry)
 
-    def iter_content_and_copy_to(file):
-        for chk in chks_of_url_contents(url, chk_size=chk_size, user_agent=user_agent):
-            file.write(chk)
 
+def _retried_download(download: Callable, file, retry: Optional[RetryPolicy]):
+    """``download(file)``, retried according to retry (if not None). A file object is
+    rewound to where it was before each retry (so retries need it to be seekable)."""
+    if retry is None:
+        return download(file)
+    if file is None or isinstance(file, str):
+        return retry.call(download, file)
+    if not file.seekable():
+        return download(file)
+
+    position = file.tell()
+
+    def rewind_and_download(file):
+        file.seek(position)
+        file.truncate()
+        return download(file)
+
+    return retry.call(rewind_and_download, file)
+
+
+def _download_url_contents(url, file, *, chk_size, user_agent):
     if file is None:
-        # TODO: Might there be a way to avoid the double buffering?
-        #      (i.e. avoid the need to copy the bytes from the BytesIO to the file)
-        #      (maybe using itertools.chain?)
-        #      (maybe by using a memory-mapped file?)
-        #      (or maybe by using a file-like object that can be seeked and read from?)
-        # from itertools import chain
-        # return bytes(chain.from_iterable(chks_of_url_contents(url)))
-        with BytesIO() as file:
-            iter_content_and_copy_to(file)
-            file.seek(0)  # rewind
-            return file.read()  # read bytes from the beginning
+        return bytes(
+            _receive_url_contents(url, chk_size=chk_size, user_agent=user_agent)
+        )
     elif isinstance(file, str):
-        _ensure_dirs_of_file_exists(file)  # TODO: Make optional?
-        with open(file, "wb") as _target_file:
-            iter_content_and_copy_to(_target_file)
+        # (a failed download, or a lack of space, leaves the file as it was)
+        with _replacing_file(file) as _target_file:
+            _copy_url_contents(
+                url,
+                _target_file,
+                chk_size=chk_size,
+                user_agent=user_agent,
+                preallocate_file=True,
+            )
         return file
     else:
-        iter_content_and_copy_to(file)
+        _copy_url_contents(url, file, chk_size=chk_size, user_agent=user_agent)
         return file
 
 
@@ -330,9 +784,16 @@ def is_share_url_of(provider: str) -> Callable[[str], bool]:
 
 
 def download_from_share_link(
-    url: str, file=None, *, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT
+    url: str,
+    file=None,
+    *,
+    chk_size=DFLT_CHK_SIZE,
+    user_agent=DFLT_USER_AGENT,
+    retry: Optional[RetryPolicy] = None,
+    resolved: Optional[ResolvedShareLink] = None,
 ):
-    """Resolve a share link to its direct-download URL, then download that.
+    """Resolve a share link to its direct-download URL, then download that (the
+    resolution can be given as ``resolved``, if it's at hand already).
 
     Raises `ShareLinkResolutionError` (a `ValueError`) when the link cannot be
     resolved without a provider API -- deliberately, in preference to fetching the
@@ -345,7 +806,11 @@ def download_from_share_link(
     `dol.FilesOfZip`) rather than treating those bytes as one asset.
     """
     return download_url_contents(
-        direct_download_url(url), file, chk_size=chk_size, user_agent=user_agent
+        direct_download_url(url if resolved is None else resolved),
+        file,
+        chk_size=chk_size,
+        user_agent=user_agent,
+        retry=retry,
     )
 
 
@@ -367,8 +832,9 @@ is_dropbox_url = is_share_url_of("dropbox")
 is_google_drive_url = is_share_url_of("google_drive")
 
 
-def google_drive_download_url(url):
-    """Get the direct-download url of a Google Drive FILE url.
+def google_drive_download_url(url, *, resolved: Optional[ResolvedShareLink] = None):
+    """Get the direct-download url of a Google Drive FILE url (of its resolution,
+    ``resolved``, if given).
 
     Raises `ShareLinkResolutionError` for a *folder* URL (enumerating one needs the
     Drive API) and for a Google Workspace document (those must be exported, and the
@@ -378,7 +844,8 @@ def google_drive_download_url(url):
     >>> google_drive_download_url('https://drive.google.com/file/d/1Ab/view')
     'https://drive.google.com/uc?export=download&id=1Ab'
     """
-    resolved = resolve_share_url(url)
+    if resolved is None:
+        resolved = resolve_share_url(url)
     if resolved.provider != "google_drive":
         raise ValueError(f"Not a Google Drive url: {url}")
     if resolved.direct_url is None:
@@ -402,9 +869,12 @@ def download_from_google_drive(
     chk_size=DFLT_CHK_SIZE,
     user_agent=DFLT_USER_AGENT,
     skip_virus_scan_confirmation_page=False,
+    retry: Optional[RetryPolicy] = None,
+    resolved: Optional[ResolvedShareLink] = None,
 ):
     """
-    Download a file from a Google Drive URL.
+    Download a file from a Google Drive URL (whose resolution can be given as
+    `resolved`, if it's at hand already).
     Will write the downloaded contents bytes to `file`, which can be a local file path
     or file-like object.
     If `file=None`, returns the bytes of the contents of the url.
@@ -414,33 +884,91 @@ def download_from_google_drive(
     can be downloaded. A *folder* url, or a Google Workspace document (docs, sheets,
     slides, forms), raises `ShareLinkResolutionError` -- see
     `google_drive_download_url`.
+
+    Drive answers the download of a file too large for it to scan with an HTML page
+    (asking to confirm the download of a file that wasn't scanned for viruses). With
+    `skip_virus_scan_confirmation_page=True`, the head of the response is checked
+    (`graze.content_kind.kind_checked`) before anything is written: if it's that page,
+    its confirmation token is parsed, and the file is downloaded with it -- so the page
+    is never written to `file`, and the file is downloaded once.
     """
-    _download_kwargs = dict(chk_size=chk_size, user_agent=user_agent)
-    download_url = google_drive_download_url(url)
-    src = download_url_contents(download_url, file, **_download_kwargs)
-    if skip_virus_scan_confirmation_page:
-        html_prefix = b"<!DOCTYPE html>"
-        first_bytes = _first_bytes(src, len(html_prefix))
-        if first_bytes == html_prefix:
-            html_content = src.decode("utf-8")
-            url_with_token = url_with_virus_scan_confirmation_token(
-                download_url, html_content
-            )
-            src = download_url_contents(url_with_token, file, **_download_kwargs)
+    download_url = google_drive_download_url(url, resolved=resolved)
+    if not skip_virus_scan_confirmation_page:
+        return download_url_contents(
+            download_url, file, chk_size=chk_size, user_agent=user_agent, retry=retry
+        )
 
-    return src
+    def download(file):
+        chks = _chks_past_virus_scan_page(
+            download_url, chk_size=chk_size, user_agent=user_agent
+        )
+        return _write_chks(chks, file)
+
+    return _retried_download(download, file, retry)
+
+
+def _chks_past_virus_scan_page(download_url, *, chk_size, user_agent):
+    """Yield the chunks of the contents of (the direct-download url of a Drive file)
+    download_url, or, if Drive answers with its virus-scan confirmation page, of
+    download_url confirmed with the page's token. The head of the response is checked
+    before any chunk is yielded, so no chunk of the page ever is."""
+    chks = _growing_chks_of_url_contents(
+        download_url, chk_size=chk_size, user_agent=user_agent
+    )
+    try:
+        checked = kind_checked(chks, expect_kind=ANY_KIND, url=download_url)
+        head = next(checked, None)  # (the head is checked before it comes out)
+    except ContentKindMismatch as error:
+        page = error.head + b"".join(chks)  # (the rest of the page: it's small)
+        url_with_token = url_with_virus_scan_confirmation_token(
+            download_url, page.decode("utf-8", "replace")
+        )
+        chks = _growing_chks_of_url_contents(
+            url_with_token, chk_size=chk_size, user_agent=user_agent
+        )
+        checked = kind_checked(chks, expect_kind=ANY_KIND, url=url_with_token)
+        head = next(checked, None)  # (still a page: raises ContentKindMismatch)
+    if head is not None:
+        yield head
+    yield from checked
+
+
+def _growing_chks_of_url_contents(url, *, chk_size, user_agent):
+    """Yield the chunks of the contents of url, as read by reads of growing size."""
+    response, until = _urlopen(url, user_agent)
+    with response:
+        yield from _received(_growing_reads(response, chk_size), response, url, until)
+
+
+def _write_chks(chks, file):
+    """Write chks to file (a file path, written atomically, or a file object), or
+    return their bytes if file is None."""
+    if file is None:
+        return b"".join(chks)
+    elif isinstance(file, str):
+        for _ in tee_chunks_to_file(chks, file):
+            pass
+        return file
+    else:
+        for chk in chks:
+            file.write(chk)
+        return file
 
 
 def url_with_virus_scan_confirmation_token(url, page_html):
-    # Use regular expressions to find the confirmation token
-    confirm_token_match = re.search(r"confirm=([0-9A-Za-z_\-]+)&", page_html)
+    # Use regular expressions to find the confirmation token: in a link of the page,
+    # or in the (hidden) input of its download form
+    confirm_token_match = re.search(
+        r'confirm=([0-9A-Za-z_\-]+)&|name="confirm"\s+value="([0-9A-Za-z_\-]+)"',
+        page_html,
+    )
     if not confirm_token_match:
         raise ValueError(
             "Could not find the confirmation token for the virus scan page of url: "
             f" {url}."
         )
 
-    confirmation_token = confirm_token_match.group(1)
+    confirmation_token = confirm_token_match.group(1) or confirm_token_match.group(2)
 
     # Construct the URL with the confirmation token
     return url + "&confirm=" + confirmation_token
@@ -454,42 +982,85 @@ is_onedrive_url = is_share_url_of("onedrive")
 # --------------------- Special URLS ---------------------
 
 # Note: Add/edit default special url routes here.
-# The predicates come from the `graze.share_links` registry -- that module is the single
-# place a provider is described, so adding one there is enough to recognise it here.
+# Share links are routed by provider: a url is resolved once (`resolve_share_url`, which
+# is memoized, and only asks the adapters of the url's host), and its provider picks
+# the download function, which is given the resolution (`resolved`) so it needn't
+# resolve again. A plain url (provider "http") costs a memo and a dict lookup.
 # `download_from_share_link` covers every provider whose resolution is "rewrite the URL,
-# then GET it"; providers needing more (Google Drive's virus-scan interstitial) get their
-# own downloader. OneDrive is routed on purpose even though graze cannot resolve it: the
-# route raises a message saying so, where falling through to a plain GET would silently
-# store a login page as if it were the asset.
-special_url_routes = {
-    is_dropbox_url: download_from_share_link,
-    is_google_drive_url: download_from_google_drive,
-    is_onedrive_url: download_from_share_link,
+# then GET it" -- so it's the route of the providers registered with
+# `add_share_link_resolver` too; providers needing more (Google Drive's virus-scan
+# interstitial) get their own downloader. OneDrive is routed on purpose even though
+# graze cannot resolve it: the route raises a message saying so, where falling through
+# to a plain GET would silently store a login page as if it were the asset.
+share_link_routes = {
+    "dropbox": download_from_share_link,
+    "google_drive": download_from_google_drive,
+    "onedrive": download_from_share_link,
 }
 
+#: Providers of urls that aren't share links (so have no route).
+NOT_SHARE_LINK_PROVIDERS = ("http", "unknown")
+
+# Routes added by the user: condition -> download function. These are consulted
+# before the provider routes above (so `add_special_url_route(is_dropbox_url, func)`
+# overrides graze's Dropbox route); with none added, routing costs them nothing.
+special_url_routes = {}
+
 
 def add_special_url_route(condition, url_download_func):
     """
     Add a special url route, i.e. a function that downloads a url's contents
     for a specific condition on the url.
+
+    Routes added this way take precedence over graze's share-link routes.
     """
     special_url_routes.update({condition: url_download_func})
 
 
+def special_url_route(url: str) -> Optional[Callable]:
+    """The download function of url's special route (None if it has none), called
+    as ``download(url, file, **kwargs)``.
+
+    >>> special_url_route('https://www.dropbox.com/s/a1/x.csv?dl=0')  # doctest: +ELLIPSIS
+    functools.partial(<function download_from_share_link at ...>, resolved=...)
+    >>> special_url_route('https://example.com/x.csv') is None
+    True
+    """
+    for condition, download in special_url_routes.items():
+        if condition(url):
+            return download
+    resolved = resolve_share_url(url)
+    if resolved.provider not in NOT_SHARE_LINK_PROVIDERS:
+        download = share_link_routes.get(resolved.provider, download_from_share_link)
+        return partial(download, resolved=resolved)
+    return None
+
+
 def is_special_url(url: str):
     """Check if a url is a special url, i.e. if it has a special url route."""
-    for _is_special_url in special_url_routes:
-        if _is_special_url(url):
-            return True
-    return False
+    return special_url_route(url) is not None
 
 
 def download_from_special_url(
-    url: str, file=None, chk_size=DFLT_CHK_SIZE, user_agent=DFLT_USER_AGENT
+    url: str,
+    file=None,
+    chk_size=DFLT_CHK_SIZE,
+    user_agent=DFLT_USER_AGENT,
+    *,
+    retry: Optional[RetryPolicy] = None,
+    route: Optional[Callable] = None,
 ):
-    """Download a url's contents, using a special url route."""
+    """Download a url's contents, using a special url route (``route``, if it's at
+    hand already: see ``special_url_route``).
+
+    A `retry` policy, if given, is passed on to the route's download function (so
+    that function has to accept a `retry` argument, as graze's own routes do).
+    """
     kwargs = dict(chk_size=chk_size, user_agent=user_agent)
-    for is_special_url, download_func in special_url_routes.items():
-        if is_special_url(url):
-            return download_func(url, file, **kwargs)
-    raise ValueError(f"Unsupported url: {url}")
+    if retry is not None:
+        kwargs["retry"] = retry
+    if route is None:
+        route = special_url_route(url)
+    if route is None:
+        raise ValueError(f"Unsupported url: {url}")
+    return route(url, file, **kwargs)
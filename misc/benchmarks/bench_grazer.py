@@ -0,0 +1,52 @@
+"""Per-hit overhead of ``graze`` vs a (compiled) ``Grazer``.
+
+Times cache hits (the contents are cached first, so no fetch is timed), of a folder
+cache and of a ``dict`` cache, through ``graze(url, cache, source=...)`` and through
+a ``Grazer(cache, source=...)`` made once::
+
+    python misc/benchmarks/bench_grazer.py [--n 20000] [--urls 100]
+"""
+
+import argparse
+import tempfile
+import timeit
+
+from graze import Grazer, graze
+
+
+def source(url):
+    return b"contents of " + url.encode()
+
+
+def per_call_us(func, urls, n):
+    """The mean microseconds of a call of func, over n calls (cycling over urls)"""
+    calls = (urls * (n // len(urls) + 1))[:n]
+
+    def run():
+        for url in calls:
+            func(url)
+
+    return min(timeit.repeat(run, number=1, repeat=5)) / n * 1e6
+
+
+def main(n=20_000, n_urls=100):
+    urls = [f"http://example.com/data/{i}.json" for i in range(n_urls)]
+    with tempfile.TemporaryDirectory() as rootdir:
+        for name, cache in [("folder", rootdir), ("dict", {})]:
+            grazer = Grazer(cache, source=source)
+            for url in urls:  # (warm the cache: only hits are timed)
+                grazer(url)
+            plain = per_call_us(lambda url: graze(url, cache, source=source), urls, n)
+            compiled = per_call_us(grazer, urls, n)
+            print(
+                f"{name:>6} cache hit: graze {plain:7.2f} us, "
+                f"Grazer {compiled:7.2f} us ({plain / compiled:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20_000, help="calls timed")
+    parser.add_argument("--urls", type=int, default=100, help="distinct urls")
+    args = parser.parse_args()
+    main(args.n, args.urls)
@@ -0,0 +1,75 @@
+"""Directory operations of the nested (default) vs the sharded cache key layout.
+
+Writes n (empty) files, at the keys of n urls of a few hosts (as many under the same
+path as a crawl of a site gets), in each layout, and times the writes, lookups
+(``os.stat`` of the key) and a full iteration (``iter_folder_keys``, sidecars
+included), and reports the largest number of entries in a folder::
+
+    python misc/benchmarks/bench_layouts.py [--n 20000] [--hosts 10]
+
+Run with ``--n 10000000`` (and the disk space and inodes it takes) for the scale the
+sharded layout is meant for.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from graze.base import LAYOUTS
+from graze.layouts import is_digest_name, iter_folder_keys, write_url_sidecar
+
+
+def urls_of(n, n_hosts):
+    return [f"http://host{i % n_hosts}.com/data/{i}.json" for i in range(n)]
+
+
+def write_files(rootdir, keys, urls):
+    known = set()
+    for key, url in zip(keys, urls):
+        filepath = os.path.join(rootdir, key)
+        dirpath = os.path.dirname(filepath)
+        if dirpath not in known:
+            os.makedirs(dirpath, exist_ok=True)
+            known.add(dirpath)
+        os.close(os.open(filepath, os.O_WRONLY | os.O_CREAT, 0o644))
+        if is_digest_name(key):
+            write_url_sidecar(filepath, url)
+
+
+def max_fan_out(rootdir):
+    return max(len(dirs) + len(files) for _, dirs, files in os.walk(rootdir))
+
+
+def timed(func, *args):
+    tic = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - tic, result
+
+
+def main(n=20_000, n_hosts=10):
+    urls = urls_of(n, n_hosts)
+    lookups = random.Random(0).sample(urls, min(n, 10_000))
+    for name, (url_to_key, _) in LAYOUTS.items():
+        with tempfile.TemporaryDirectory() as rootdir:
+            keys = list(map(url_to_key, urls))
+            write_s, _ = timed(write_files, rootdir, keys, urls)
+            paths = [os.path.join(rootdir, url_to_key(url)) for url in lookups]
+            lookup_s, _ = timed(lambda: [os.stat(path) for path in paths])
+            iter_s, n_keys = timed(lambda: sum(1 for _ in iter_folder_keys(rootdir)))
+            assert n_keys == n
+            print(
+                f"{name:>8}: write {write_s / n * 1e6:7.1f} us/file, "
+                f"lookup {lookup_s / len(paths) * 1e6:6.2f} us, "
+                f"iterate {iter_s / n * 1e6:6.2f} us/key, "
+                f"largest folder {max_fan_out(rootdir):>9} entries"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20_000, help="cached urls")
+    parser.add_argument("--hosts", type=int, default=10, help="distinct hosts")
+    args = parser.parse_args()
+    main(args.n, args.hosts)
@@ -0,0 +1,74 @@
+"""Throughput (urls per second) of share-link resolution, one url at a time vs in
+bulk.
+
+Resolves a synthetic corpus of pasted urls -- Dropbox (file and folder links), Google
+Drive (files, folders and Workspace documents), OneDrive/SharePoint and plain urls,
+with a share of repeats -- with ``resolve_share_url`` on each url (its memo cleared
+first, as for a fresh corpus) and with ``resolve_share_urls``::
+
+    python misc/benchmarks/bench_share_links.py [--n 200000] [--repeats 0.3]
+"""
+
+import argparse
+import random
+import time
+
+from graze.share_links import (
+    _forget_resolutions,
+    resolve_share_url,
+    resolve_share_urls,
+)
+
+TEMPLATES = [
+    "https://www.dropbox.com/scl/fi/{id}/clip.mp4?rlkey=k{id}&dl=0",
+    "https://www.dropbox.com/scl/fo/{id}/folder?rlkey=k{id}&st=s1",
+    "https://www.dropbox.com/s/{id}/data.csv?dl=0",
+    "https://drive.google.com/file/d/1{id}/view?usp=sharing",
+    "https://drive.google.com/open?id=1{id}",
+    "https://drive.google.com/drive/folders/1{id}",
+    "https://docs.google.com/spreadsheets/d/1{id}/edit",
+    "https://1drv.ms/u/s!{id}",
+    "https://contoso-my.sharepoint.com/:f:/g/personal/a/{id}",
+    "https://example.com/data/{id}.json",
+    "https://cdn{host}.example.org/assets/{id}.png",
+    "https://raw.githubusercontent.com/org/repo/main/{id}.py",
+]
+
+
+def corpus(n, repeats=0.3, seed=0):
+    """n urls, a ``repeats`` share of which are repeats of earlier ones"""
+    rng = random.Random(seed)
+    urls = []
+    for i in range(n):
+        if urls and rng.random() < repeats:
+            urls.append(rng.choice(urls))
+        else:
+            template = rng.choice(TEMPLATES)
+            urls.append(template.format(id=f"a{i:07d}", host=i % 50))
+    return urls
+
+
+def timed(func, *args):
+    tic = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - tic, result
+
+
+def main(n=200_000, repeats=0.3):
+    urls = corpus(n, repeats)
+    _forget_resolutions()
+    one_by_one_s, _ = timed(lambda: [resolve_share_url(url) for url in urls])
+    bulk_s, resolutions = timed(resolve_share_urls, urls)
+    print(f"{n} urls ({len(set(urls))} distinct)")
+    print(f"  resolve_share_url, each: {n / one_by_one_s:12,.0f} urls/s")
+    print(f"  resolve_share_urls:      {n / bulk_s:12,.0f} urls/s")
+    for provider, stats in sorted(resolutions.stats.items()):
+        print(f"    {provider:>12}: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=200_000, help="urls resolved")
+    parser.add_argument("--repeats", type=float, default=0.3, help="share of repeats")
+    args = parser.parse_args()
+    main(args.n, args.repeats)
@@ -0,0 +1,47 @@
+"""Dispatch overhead of special urls: what ``Internet`` pays, per url, to know
+whether (and how) a url is routed, before fetching it.
+
+Times ``special_url_route`` (one resolution, memoized, and a dict lookup) over plain
+urls and share links, warm (each url seen before: the usual case of retries, refreshes
+and repeated gets) and cold (all urls new)::
+
+    python misc/benchmarks/bench_special_urls.py [--n 20000] [--urls 100]
+"""
+
+import argparse
+import timeit
+
+from graze.share_links import _forget_resolutions
+from graze.util import special_url_route
+
+
+def per_call_us(func, urls, n, *, cold=False):
+    """The mean microseconds of a call of func, over n calls (cycling over urls)"""
+    calls = (urls * (n // len(urls) + 1))[:n]
+
+    def run():
+        for url in calls:
+            if cold:
+                _forget_resolutions()
+            func(url)
+
+    return min(timeit.repeat(run, number=1, repeat=5)) / n * 1e6
+
+
+def main(n=20_000, n_urls=100):
+    plain = [f"https://example.com/data/{i}.csv" for i in range(n_urls)]
+    share = [
+        f"https://www.dropbox.com/scl/fi/a{i}/x.mp4?rlkey=z&dl=0" for i in range(n_urls)
+    ]
+    for name, urls in [("plain", plain), ("share link", share)]:
+        warm = per_call_us(special_url_route, urls, n)
+        cold = per_call_us(special_url_route, urls, n, cold=True)
+        print(f"{name:>10}: warm {warm:6.2f} us, cold {cold:6.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20_000, help="calls timed")
+    parser.add_argument("--urls", type=int, default=100, help="distinct urls")
+    args = parser.parse_args()
+    main(args.n, args.urls)
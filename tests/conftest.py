@@ -0,0 +1,89 @@
+"""Shared fixtures: a throwaway local HTTP server, so fetch paths test offline."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _Route:
+    """What the server answers on one path: a status, a body, and headers.
+
+    ``body`` may be a callable ``(handler) -> (status, body, headers)`` for routes
+    whose answer depends on the request (or on how many times it was asked).
+    """
+
+    def __init__(self, body=b"", status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        self.hits = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    routes: dict = {}
+
+    def log_message(self, *args):  # keep pytest output clean
+        pass
+
+    def _answer(self, *, send_body: bool):
+        route = self.routes.get(self.path)
+        if route is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        route.hits += 1
+        if callable(route.body):
+            status, body, headers = route.body(self)
+        else:
+            status, body, headers = route.status, route.body, route.headers
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._answer(send_body=True)
+
+    def do_HEAD(self):
+        self._answer(send_body=False)
+
+
+class LocalServer:
+    """A local HTTP server. ``server.route('/x', b'...')`` returns the url of ``/x``."""
+
+    def __init__(self):
+        self.routes = {}
+        handler = type("Handler", (_Handler,), {"routes": self.routes})
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+
+    def route(self, path, body=b"", status=200, headers=None):
+        self.routes[path] = _Route(body, status, headers)
+        return self.base_url + path
+
+    def hits(self, path):
+        return self.routes[path].hits
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = LocalServer()
+    yield s
+    s.close()
@@ -0,0 +1,81 @@
+"""Tests for :mod:`graze.bandwidth` and its use by the chunked download paths."""
+
+import doctest
+import threading
+import time
+
+from graze import bandwidth
+from graze.bandwidth import (
+    BACKGROUND,
+    INTERACTIVE,
+    BandwidthLimiter,
+    bandwidth_scope,
+    throttled,
+)
+from graze.base import GrazeBase, Internet
+from graze.util import chks_of_url_contents
+
+BODY = bytes(200_000)
+
+
+def elapsed(func, *args, **kwargs):
+    started = time.monotonic()
+    func(*args, **kwargs)
+    return time.monotonic() - started
+
+
+def test_internet_downloads_are_throttled(server, tmp_path):
+    url = server.route("/big", BODY)
+    limiter = BandwidthLimiter(1_000_000, burst=0.05)
+    internet = Internet(bandwidth=limiter)
+    assert elapsed(internet.__getitem__, url) >= 0.14  # 200KB at 1MB/s, 50KB burst
+
+    g = GrazeBase(str(tmp_path), source=internet)
+    assert elapsed(lambda: b"".join(g.iter_chunks(url))) >= 0.14
+    assert g[url] == BODY
+
+
+def test_chks_of_url_contents_is_throttled(server):
+    url = server.route("/big", BODY)
+    limiter = BandwidthLimiter(host_rates={"127.0.0.1": 1_000_000}, burst=0.05)
+    with bandwidth_scope(limiter):
+        assert elapsed(lambda: b"".join(chks_of_url_contents(url))) >= 0.14
+    assert elapsed(lambda: b"".join(chks_of_url_contents(url))) < 0.14
+
+
+def test_limits_can_change_at_runtime():
+    limiter = BandwidthLimiter(10_000, burst=0.1)
+    limiter.consume("http://a.com/x", 10_000)  # in debt for a second
+    limiter.set_rate(None)
+    assert elapsed(limiter.consume, "http://a.com/x", 10_000) < 0.1
+
+
+def test_interactive_downloads_go_first():
+    limiter = BandwidthLimiter(100_000, burst=0.01)
+    chunks = [b"x" * 1000] * 1000
+    stop = threading.Event()
+
+    def background():
+        with bandwidth_scope(limiter, priority=BACKGROUND):
+            for _ in throttled(chunks, "http://a.com/batch"):
+                if stop.is_set():
+                    return
+
+    threads = [threading.Thread(target=background) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    with bandwidth_scope(limiter, priority=INTERACTIVE):
+        # 10KB at 100KB/s: ~0.1s if served first, ~0.5s if shared with 4 others
+        took = elapsed(lambda: list(throttled(chunks[:10], "http://a.com/urgent")))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert took < 0.3
+
+
+def test_bandwidth_doctests():
+    results = doctest.testmod(
+        bandwidth, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -0,0 +1,112 @@
+"""Tests for :mod:`graze.bulk`."""
+
+import doctest
+import os
+
+from graze import bulk as bulk_module
+from graze.base import Internet
+from graze.bulk import BulkDownload
+from graze.retry import RetryPolicy
+
+
+def make_bulk(tmp_path, **kwargs):
+    kwargs.setdefault("cache", str(tmp_path / "cache"))
+    kwargs.setdefault("sleep", lambda seconds: None)
+    return BulkDownload(str(tmp_path / "journal.sqlite"), **kwargs)
+
+
+def test_a_bulk_download(server, tmp_path):
+    urls = [server.route(f"/{i}", f"contents {i}".encode()) for i in range(10)]
+    progress_reports = []
+    bulk = make_bulk(tmp_path, source=Internet(), on_progress=progress_reports.append)
+    assert bulk.add(urls) == 10
+    assert bulk.add(urls[:3]) == 0  # already there
+
+    progress = bulk.run()
+    assert (progress.done, progress.failed, progress.pending) == (10, 0, 0)
+    assert progress.nbytes == sum(len(f"contents {i}") for i in range(10))
+    assert len(progress_reports) == 10
+    assert os.path.isdir(tmp_path / "cache")
+
+
+def test_the_bytes_of_a_mapping_cache_are_counted(server, tmp_path):
+    urls = [server.route(f"/{i}", f"contents {i}".encode()) for i in range(3)]
+    cache = {}
+    bulk = make_bulk(tmp_path, cache=cache, source=Internet())
+    bulk.add(urls)
+    progress = bulk.run()
+    assert progress.done == 3 and len(cache) == 3
+    assert progress.nbytes == sum(len(f"contents {i}") for i in range(3))
+
+
+def test_resuming_after_a_crash(tmp_path):
+    fetched = []
+
+    def source(url):
+        fetched.append(url)
+        return b"x"
+
+    urls = [f"http://a.com/{i}" for i in range(6)]
+    bulk = make_bulk(tmp_path, source=source, max_workers=1)
+    bulk.add(urls)
+    bulk.run(max_urls=2)
+    # a crash, with a url in flight
+    bulk._execute("UPDATE urls SET state = 'in_flight' WHERE url = ?", (urls[2],))
+    bulk.close()
+
+    bulk = make_bulk(tmp_path, source=source, max_workers=1)
+    assert bulk.urls("in_flight") == [urls[2]]
+    progress = bulk.run()
+    assert progress.done == 6 and progress.done_this_run == 4
+    assert fetched == urls  # each fetched once, in order
+
+
+def test_failures_are_retried_according_to_the_policy(server, tmp_path):
+    flaky = server.route("/flaky", status=503)
+    dead = server.route("/dead", status=404)
+    bulk = make_bulk(tmp_path, source=Internet(), retry=RetryPolicy(max_attempts=3))
+    bulk.add([flaky, dead])
+    progress = bulk.run()
+    assert progress.failed == 2
+    assert server.hits("/flaky") == 3  # retryable: 3 attempts
+    assert server.hits("/dead") == 1  # not retryable
+    assert bulk.failures()[dead][0] == 404
+
+    server.route("/flaky", b"back up")
+    assert bulk.retry_failed() == 2
+    progress = bulk.run()
+    assert (progress.done, progress.failed) == (1, 1)
+    assert bulk.state(flaky) == "done"
+
+
+def test_progress_is_counted_without_scanning_the_journal(server, tmp_path):
+    ok = [server.route(f"/{i}", b"x" * i) for i in range(5)]
+    dead = server.route("/dead", status=404)
+    reports = []
+    bulk = make_bulk(tmp_path, source=Internet(), on_progress=reports.append)
+    bulk.add(ok + [dead])
+    bulk.run()
+    assert [report.total for report in reports] == [6] * 6
+    counts = lambda p: (p.pending, p.in_flight, p.done, p.failed, p.nbytes)
+    assert counts(bulk.progress()) == counts(make_bulk(tmp_path).progress())
+    assert counts(bulk.progress()) == (0, 0, 5, 1, 10)
+    bulk.retry_failed()
+    assert (bulk.progress().pending, bulk.progress().failed) == (1, 0)
+
+
+def test_claims_walk_an_index_in_order(tmp_path):
+    bulk = make_bulk(tmp_path)
+    plan = bulk._execute(
+        "EXPLAIN QUERY PLAN SELECT seq, url FROM urls "
+        "INDEXED BY urls_by_state_and_seq "
+        "WHERE state = ? AND not_before <= ? ORDER BY seq LIMIT 1",
+        ("pending", 0),
+    )
+    assert not any("TEMP B-TREE" in detail for *_, detail in plan)
+
+
+def test_bulk_doctests():
+    results = doctest.testmod(
+        bulk_module, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -0,0 +1,121 @@
+"""Tests for the cache hit path: one open, fstat and read per hit of a file."""
+
+import os
+import time
+
+import pytest
+
+from graze.base import (
+    Graze,
+    GrazeWithDataRefresh,
+    _read_file_if_fresh,
+    graze,
+    url_to_localpath,
+)
+
+URL = "http://a.com/data.json"
+
+
+@pytest.fixture
+def fs_calls(monkeypatch):
+    """The names of the (counted) filesystem calls made."""
+    calls = []
+
+    def counted(name, func):
+        def spy(*args, **kwargs):
+            calls.append(name)
+            return func(*args, **kwargs)
+
+        return spy
+
+    for name in ("exists", "isfile"):
+        monkeypatch.setattr(os.path, name, counted(name, getattr(os.path, name)))
+    for name in ("open", "stat", "fstat", "read"):
+        monkeypatch.setattr(os, name, counted(name, getattr(os, name)))
+    return calls
+
+
+def _age(filepath, seconds):
+    then = time.time() - seconds
+    os.utime(filepath, (then, then))
+
+
+def test_a_folder_cache_hit_opens_fstats_and_reads_once(tmp_path, fs_calls):
+    graze(URL, str(tmp_path), source=lambda url: b"contents")
+    fs_calls.clear()
+    assert graze(URL, str(tmp_path), source=lambda url: b"other") == b"contents"
+    assert fs_calls == ["open", "fstat", "read"]
+
+    fs_calls.clear()
+    assert graze(URL, str(tmp_path), max_age=60) == b"contents"
+    assert fs_calls == ["open", "fstat", "read"]  # (the age is that of the fstat)
+
+
+def test_max_age_is_the_age_of_the_file_in_the_cache(tmp_path):
+    calls = []
+
+    def source(url):
+        calls.append(url)
+        return b"contents"
+
+    graze(URL, str(tmp_path), source=source)
+    filepath = os.path.join(str(tmp_path), url_to_localpath(URL))
+    graze(URL, str(tmp_path), source=source, max_age=60)
+    assert len(calls) == 1
+    _age(filepath, 120)
+    graze(URL, str(tmp_path), source=source, max_age=60)
+    assert len(calls) == 2
+
+
+def test_empty_files_and_folders(tmp_path):
+    graze(URL, str(tmp_path), source=lambda url: b"")
+    assert graze(URL, str(tmp_path), source=lambda url: b"other") == b""
+    assert _read_file_if_fresh(str(tmp_path / "http")) == (None, None)  # (a folder)
+
+
+def test_data_refresh_hits_and_refreshes(tmp_path, fs_calls):
+    calls = []
+
+    def source(url):
+        calls.append(url)
+        return f"contents {len(calls)}".encode()
+
+    g = GrazeWithDataRefresh(str(tmp_path), source=source, time_to_live=60)
+    assert g[URL] == b"contents 1"
+    fs_calls.clear()
+    assert g[URL] == b"contents 1"
+    assert fs_calls == ["open", "fstat", "read"]
+
+    filepath = Graze(str(tmp_path)).filepath_of(URL)
+    _age(filepath, 120)
+    assert g[URL] == b"contents 2"
+
+    g = GrazeWithDataRefresh(
+        str(tmp_path), source=source, time_to_live=60, return_filepaths=True
+    )
+    fs_calls.clear()
+    assert g[URL] == filepath
+    assert fs_calls == ["stat"]
+
+
+def test_data_refresh_falls_back_to_stale_data(tmp_path):
+    def failing(url):
+        raise ConnectionError("offline")
+
+    Graze(str(tmp_path), source=lambda url: b"old")[URL]
+    _age(Graze(str(tmp_path)).filepath_of(URL), 120)
+
+    g = GrazeWithDataRefresh(str(tmp_path), source=failing, time_to_live=60)
+    assert g[URL] == b"old"
+    g = GrazeWithDataRefresh(
+        str(tmp_path), source=failing, time_to_live=60, on_error="warn"
+    )
+    with pytest.warns(UserWarning, match="seconds old"):
+        assert g[URL] == b"old"
+    g = GrazeWithDataRefresh(
+        str(tmp_path), source=failing, time_to_live=60, on_error="raise"
+    )
+    with pytest.raises(ConnectionError):
+        g[URL]
+    with pytest.raises(ConnectionError):
+        g["http://a.com/never-cached"]
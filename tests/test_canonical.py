@@ -0,0 +1,113 @@
+"""Tests for :mod:`graze.canonical` (and the ``canonicalize`` option of graze)."""
+
+import doctest
+
+import pytest
+
+from graze import canonical
+from graze.base import GrazeBase, Grazer, graze
+from graze.canonical import UrlCanonicalizer, canonical_url
+
+SAME_URLS = [
+    "http://Host.com/a?b=1&a=2",
+    "http://host.com:80/a?a=2&b=1",
+    "HTTP://host.com/a?a=2&b=1#section",
+    "http://host.com/a?a=2&utm_source=news&b=1&fbclid=xyz",
+]
+
+
+def test_the_ways_of_writing_a_url_have_one_canonical_form():
+    assert {canonical_url(url) for url in SAME_URLS} == {"http://host.com/a?a=2&b=1"}
+    assert canonical_url("https://a.com") == "https://a.com/"
+    assert canonical_url("https://a.com:8443/x") == "https://a.com:8443/x"
+    assert canonical_url("http://User:Pw@A.com/x") == "http://User:Pw@a.com/x"
+    assert canonical_url("http://[::1]:80/x") == "http://[::1]/x"
+
+
+def test_what_canonicalization_keeps():
+    # the order of repeated parameters, and the (encoded) values, as written
+    url = "http://a.com/x?tag=b&tag=a&q=caf%C3%A9+au+lait&rlkey=Z_-9%2F"
+    assert canonical_url(url) == (
+        "http://a.com/x?q=caf%C3%A9+au+lait&rlkey=Z_-9%2F&tag=b&tag=a"
+    )
+    # the path's case, and what isn't an http(s) url
+    assert canonical_url("http://a.com/Data.CSV") == "http://a.com/Data.CSV"
+    for url in ["file:///tmp/x", "www.example.com/x", "http://a.com:nope/x"]:
+        assert canonical_url(url) == url
+
+
+def test_share_links_collapse_to_their_direct_url():
+    direct = "https://drive.google.com/uc?export=download&id=1AbC"
+    for url in [
+        "https://drive.google.com/file/d/1AbC/view?usp=sharing",
+        "https://drive.google.com/open?id=1AbC",
+        direct,
+    ]:
+        assert canonical_url(url) == direct
+    assert canonical_url("https://www.dropbox.com/s/a1/x.csv?dl=0") == canonical_url(
+        "https://www.dropbox.com/s/a1/x.csv?dl=1"
+    )
+    # refused links are left as they are (but for the usual normalization)
+    folder = "https://drive.google.com/drive/folders/1FoLd"
+    assert canonical_url(folder) == folder
+    keep = UrlCanonicalizer(resolve_share_links=False)
+    assert keep("https://drive.google.com/open?id=1AbC") == (
+        "https://drive.google.com/open?id=1AbC"
+    )
+
+
+def test_ignored_params_per_host():
+    canonicalize = UrlCanonicalizer(
+        {"*": ["utm_*"], "*.shop.com": ["session", "ref"], "shop.com": ["session"]}
+    )
+    assert canonicalize.ignored_params_of("www.shop.com") == ("utm_*", "session", "ref")
+    assert canonicalize("http://www.shop.com/i?ref=a&id=1&session=2") == (
+        "http://www.shop.com/i?id=1"
+    )
+    assert canonicalize("http://other.com/i?ref=a&id=1&session=2") == (
+        "http://other.com/i?id=1&ref=a&session=2"
+    )
+
+
+def _counting_source():
+    calls = []
+
+    def source(url):
+        calls.append(url)
+        return b"contents"
+
+    return source, calls
+
+
+def test_graze_grazer_and_graze_base_can_canonicalize(tmp_path):
+    for get in [
+        lambda cache, source: lambda url: graze(
+            url, cache, source=source, canonicalize=True
+        ),
+        lambda cache, source: Grazer(cache, source=source, canonicalize=True),
+        lambda cache, source: GrazeBase(
+            cache, source=source, canonicalize=True
+        ).__getitem__,
+    ]:
+        source, calls = _counting_source()
+        cache = {}
+        for url in SAME_URLS:
+            assert get(cache, source)(url) == b"contents"
+        assert calls == SAME_URLS[:1]  # (fetched as asked, once)
+        assert list(cache) == ["http/host.com_f/a?a=2&b=1"]
+
+    source, calls = _counting_source()
+    g = GrazeBase(str(tmp_path), source=source)  # (not canonicalizing: the default)
+    for url in SAME_URLS:
+        g[url]
+    assert calls == SAME_URLS
+
+    with pytest.raises(TypeError, match="canonicalize"):
+        graze(SAME_URLS[0], {}, source=source, canonicalize="yes")
+
+
+def test_doctests():
+    results = doctest.testmod(
+        canonical, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
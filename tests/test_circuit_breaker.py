@@ -0,0 +1,138 @@
+"""Tests for :mod:`graze.circuit_breaker` and its use by ``Internet``."""
+
+import doctest
+import os
+import threading
+import time
+
+import pytest
+
+import graze.circuit_breaker
+from graze.base import GrazeWithDataRefresh, Internet, RequestFailure
+from graze.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def fake_clock():
+    now = [0.0]
+    return now, lambda: now[0]
+
+
+def test_opens_on_failure_rate():
+    now, clock = fake_clock()
+    breaker = CircuitBreaker(failure_threshold=0.5, min_requests=4, clock=clock)
+    for failed in [False, True, False]:
+        breaker._record("http://a.com/x", failed)
+    assert breaker.state("a.com") == "closed"  # not enough requests yet
+    breaker.record_failure("http://a.com/x")
+    assert breaker.state("a.com") == "open"
+
+
+def test_old_outcomes_are_forgotten():
+    now, clock = fake_clock()
+    breaker = CircuitBreaker(min_requests=2, window=10, clock=clock)
+    breaker.record_failure("http://a.com/x")
+    now[0] += 11
+    breaker.record_success("http://a.com/x")
+    breaker.record_success("http://a.com/x")
+    assert breaker.state("a.com") == "closed"
+
+
+def test_half_open_probe_failure_reopens():
+    now, clock = fake_clock()
+    breaker = CircuitBreaker(min_requests=1, cooldown=5, clock=clock)
+    breaker.record_failure("http://a.com/x")
+    now[0] += 5
+    probe = breaker.check("http://a.com/x")
+    with pytest.raises(CircuitOpenError):
+        breaker.check("http://a.com/x")  # only one probe at a time
+    breaker.record_failure("http://a.com/x", probe=probe)
+    assert breaker.state("a.com") == "open"
+    now[0] += 5
+    assert breaker.state("a.com") == "half_open"
+
+
+def test_stragglers_dont_move_an_open_circuit():
+    """Outcomes of requests started before the circuit opened aren't the probe's."""
+    now, clock = fake_clock()
+    breaker = CircuitBreaker(min_requests=2, cooldown=5, clock=clock)
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_success(url):
+        started.set()
+        finish.wait(5)
+
+    straggler = threading.Thread(
+        target=breaker.call, args=(slow_success, "http://a.com/x")
+    )
+    straggler.start()
+    started.wait(5)
+    breaker.record_failure("http://a.com/x")
+    breaker.record_failure("http://a.com/x")
+    assert breaker.state("a.com") == "open"
+    finish.set()
+    straggler.join(5)
+    assert breaker.state("a.com") == "open"  # the straggler's success didn't close it
+
+    now[0] += 4
+    breaker.record_failure("http://a.com/y")  # nor does a straggling failure re-open it
+    now[0] += 1
+    assert breaker.state("a.com") == "half_open"
+
+    probe = breaker.check("http://a.com/x")
+    breaker.record_success("http://a.com/y")  # a straggler, while the probe is out
+    assert breaker.state("a.com") == "half_open"
+    breaker.record_success("http://a.com/x", probe=probe)
+    assert breaker.state("a.com") == "closed"
+
+
+def test_url_level_errors_dont_count():
+    breaker = CircuitBreaker(min_requests=1)
+
+    def not_found(url):
+        raise RequestFailure("nope", status_code=404)
+
+    with pytest.raises(RequestFailure):
+        breaker.call(not_found, "http://a.com/x")
+    assert breaker.state("a.com") == "closed"
+
+
+def test_internet_fails_fast_when_open(server):
+    url = server.route("/down", status=503)
+    breaker = CircuitBreaker(min_requests=2)
+    internet = Internet(circuit_breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            internet[url]
+    with pytest.raises(CircuitOpenError) as error:
+        internet[url]
+    assert error.value.host == "127.0.0.1"
+    assert server.hits("/down") == 2
+
+    with pytest.raises(CircuitOpenError):
+        list(internet.iter_chunks(url))
+    assert server.hits("/down") == 2
+
+
+def test_data_refresh_falls_back_on_open_circuit(server, tmp_path):
+    url = server.route("/data", b"v1")
+    breaker = CircuitBreaker(min_requests=1)
+    g = GrazeWithDataRefresh(
+        str(tmp_path), source=Internet(circuit_breaker=breaker), time_to_live=0
+    )
+    assert g[url] == b"v1"
+    filepath = g.filepath_of(url)
+    os.utime(filepath, (time.time() - 10, time.time() - 10))
+
+    server.route("/data", status=503)
+    assert g[url] == b"v1"  # the refresh failed, and opened the circuit...
+    assert breaker.state("127.0.0.1") == "open"
+    assert g[url] == b"v1"  # ...so this one doesn't even try
+    assert server.hits("/data") == 1
+
+
+def test_circuit_breaker_doctests():
+    results = doctest.testmod(
+        graze.circuit_breaker,
+        optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE,
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
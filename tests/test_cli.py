@@ -0,0 +1,159 @@
+"""Tests for :mod:`graze.cli`."""
+
+import doctest
+import io
+import json
+import os
+
+from graze import cli
+from graze.base import Graze, url_to_localpath
+from graze.cli import main
+
+
+def test_fetch_from_a_file_and_stdin(server, tmp_path, monkeypatch):
+    urls = [server.route(f"/{i}", f"contents {i}".encode()) for i in range(5)]
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text("# to warm\n" + "\n".join(urls[:3]) + "\n")
+    cache = str(tmp_path / "cache")
+
+    assert main(["fetch", str(urls_file), "--cache", cache, "-q"]) == 0
+    g = Graze(cache)
+    assert sorted(g) == sorted(urls[:3])
+    assert g[urls[1]] == b"contents 1"  # (the same layout as Graze)
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("\n".join(urls)))
+    assert main(["fetch", "-", "--cache", cache, "-q"]) == 0
+    assert sorted(g) == sorted(urls)
+    assert server.hits("/0") == 1  # (cached urls aren't fetched again)
+
+
+def test_fetch_reports_failures(server, tmp_path, capsys):
+    ok = server.route("/ok", b"fine")
+    missing = server.base_url + "/missing"
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text(f"{ok}\n{missing}\n")
+    journal = str(tmp_path / "journal.sqlite")
+
+    status = main(
+        ["fetch", str(urls_file), "--cache", str(tmp_path / "cache")]
+        + ["--journal", journal]
+    )
+    assert status == 1
+    err = capsys.readouterr().err
+    assert f"failed: {missing}" in err
+    assert "1/2 done, 1 failed" in err
+    assert os.path.exists(journal)
+
+
+def test_warm_with_cache_keys_and_max_age(server, tmp_path):
+    a = server.route("/a", b"aaa")
+    b = server.route("/b", b"bbb")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        json.dumps({"url": a, "cache_key": "custom/a.bin"})
+        + "\n"
+        + json.dumps({"url": b, "max_age": 0})
+        + "\n"
+    )
+    cache = tmp_path / "cache"
+
+    assert main(["warm", str(manifest), "--cache", str(cache), "-q"]) == 0
+    assert (cache / "custom" / "a.bin").read_bytes() == b"aaa"
+    assert (cache / url_to_localpath(b)).read_bytes() == b"bbb"
+
+    assert main(["warm", str(manifest), "--cache", str(cache), "-q"]) == 0
+    assert server.hits("/a") == 1  # cached, and fresh
+    assert server.hits("/b") == 2  # max_age=0: always stale
+
+
+def test_warmed_cache_keys_are_known_by_their_url(server, tmp_path, capsys):
+    a = server.route("/a", b"aaa")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(json.dumps({"url": a, "cache_key": "mine/data.csv"}) + "\n")
+    cache = str(tmp_path / "cache")
+    assert main(["warm", str(manifest), "--cache", cache, "-q"]) == 0
+
+    assert [url for url, _ in cli.cached_files(cache)] == [a]
+    assert main(["stats", "--cache", cache, "--json"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["files"] == 1 and stats["hosts"] == {"127.0.0.1": 1}
+
+    assert main(["evict", "--cache", cache, a]) == 0
+    assert list(cli.cached_files(cache)) == []
+    assert not os.path.exists(os.path.join(cache, "mine"))
+
+
+def test_read_manifest_formats():
+    expected = [
+        {"url": "http://a.com/x", "cache_key": "x", "max_age": 60},
+        {"url": "http://a.com/y"},
+    ]
+    as_json = json.dumps(
+        [{"url": "http://a.com/x", "cache_key": "x", "max_age": 60}, "http://a.com/y"]
+    )
+    assert cli.read_manifest([as_json]) == expected
+    as_csv = ["url,cache_key,max_age\n", "http://a.com/x,x,60\n", "http://a.com/y,,\n"]
+    assert cli.read_manifest(as_csv) == expected
+
+
+def test_stats_evict_and_verify(tmp_path, capsys):
+    cache = str(tmp_path / "cache")
+    g = Graze(cache)
+    g["http://a.com/photo.jpg"] = b"<!doctype html><html>Sign in</html>"
+    g["http://a.com/empty.csv"] = b""
+    g["http://b.com/data.csv"] = b"1,2,3"
+
+    assert main(["stats", "--cache", cache, "--json"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["files"] == 3
+    assert stats["bytes"] == len(b"<!doctype html><html>Sign in</html>") + 5
+    assert stats["hosts"] == {"a.com": 2, "b.com": 1}
+
+    assert main(["verify", "--cache", cache]) == 1
+    out = capsys.readouterr().out
+    assert "http://a.com/photo.jpg: expected image bytes" in out
+    assert "http://a.com/empty.csv: empty file" in out
+    assert "data.csv" not in out
+
+    assert main(["evict", "--cache", cache, "--match", "http://a.com/*", "-n"]) == 0
+    assert len(g) == 3  # (a dry run)
+    assert main(["evict", "--cache", cache, "--match", "http://a.com/*"]) == 0
+    assert list(g) == ["http://b.com/data.csv"]
+    assert not os.path.exists(os.path.join(cache, "http", "a.com_f"))
+
+    assert main(["evict", "--cache", cache]) == 2  # (nothing said to evict)
+    assert main(["evict", "--cache", cache, "--older-than", "3600"]) == 0
+    assert len(g) == 1
+    assert main(["evict", "--cache", cache, "http://b.com/data.csv"]) == 0
+    assert len(g) == 0
+
+
+def test_verify_can_delete_faulty_files(tmp_path):
+    cache = str(tmp_path / "cache")
+    g = Graze(cache)
+    g["http://a.com/clip.mp4"] = b"<html><body>preview</body></html>"
+    assert cli.verify(cache, delete=True)
+    assert len(g) == 0
+    assert cli.verify(cache) == {}
+
+
+def test_the_exceptions_file_is_not_a_cached_url(tmp_path):
+    from graze.graze_exceptional import add_exception
+
+    cache = str(tmp_path / "cache")
+    Graze(cache)["http://a.com/data.csv"] = b"1,2,3"
+    local = tmp_path / "local.csv"
+    local.write_bytes(b"4,5,6")
+    add_exception(cache, "http://b.com/data.csv", str(local))
+
+    assert [url for url, _ in cli.cached_files(cache)] == ["http://a.com/data.csv"]
+    assert cli.cache_stats(cache)["files"] == 1
+    assert cli.evict(cache, older_than=-1) == ["http://a.com/data.csv"]
+    assert os.path.isfile(os.path.join(cache, "_exceptions.json"))
+
+
+def test_doctests():
+    results = doctest.testmod(
+        cli, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -0,0 +1,300 @@
+"""Tests for the download (and file writing) functions of :mod:`graze.util`."""
+
+import errno
+import http.client
+import io
+import os
+import shutil
+import tracemalloc
+
+import pytest
+
+from graze import util
+from graze.base import Graze, GrazeBase, LocalFiles, graze, url_to_localpath
+from graze.content_kind import ContentKindMismatch
+from graze.share_links import ResolvedShareLink, ShareLinkKind
+from graze.util import (
+    InsufficientSpace,
+    download_from_google_drive,
+    download_url_contents,
+    preallocate,
+    receive_url_contents,
+    tee_chunks_to_file,
+)
+
+PAYLOAD = bytes(range(256)) * 8000  # 2 MB
+
+
+def test_contents_are_received_in_one_preallocated_buffer(server):
+    url = server.route("/big.bin", PAYLOAD)
+    contents = download_url_contents(url)
+    assert contents == PAYLOAD
+    assert type(contents) is bytes  # (immutable: safe to cache)
+    buffer = receive_url_contents(url)
+    assert buffer == PAYLOAD and isinstance(buffer, bytearray)
+
+
+def _peak_memory_of(func, *args):
+    func(*args)  # (warm up: imports, connection machinery)
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def test_a_download_takes_about_the_memory_of_its_contents(server):
+    url = server.route("/big.bin", PAYLOAD)
+    contents, peak = _peak_memory_of(receive_url_contents, url)
+    assert contents == PAYLOAD
+    assert peak < 1.5 * len(PAYLOAD)
+    contents, peak = _peak_memory_of(download_url_contents, url)  # (one copy)
+    assert contents == PAYLOAD
+    assert peak < 2.5 * len(PAYLOAD)
+
+
+def test_a_truncated_response_fails(server):
+    url = server.route("/short", PAYLOAD[:1000], headers={"Content-Length": "5000"})
+    with pytest.raises(http.client.IncompleteRead):
+        download_url_contents(url)
+
+
+def test_downloads_to_a_file(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    filepath = str(tmp_path / "sub" / "big.bin")
+    assert download_url_contents(url, filepath) == filepath
+    assert open(filepath, "rb").read() == PAYLOAD
+
+    file = io.BytesIO()
+    download_url_contents(url, file)
+    assert file.getvalue() == PAYLOAD
+
+
+def test_reads_grow_while_they_come_back_full():
+    sizes = []
+
+    def read_into(view):
+        sizes.append(len(view))
+        view[:] = bytes(len(view))
+        return len(view)
+
+    buffer = bytearray(10_000)
+    parts = list(util._reads_into(buffer, read_into, chk_size=1000, max_chk_size=4000))
+    assert sizes == [1000, 2000, 4000, 3000]
+    assert sum(len(part) for part in parts) == 10_000
+
+    reads = util._growing_reads(io.BytesIO(bytes(10_000)), 1000, max_chk_size=4000)
+    assert [len(chk) for chk in reads] == [1000, 2000, 4000, 3000]
+
+    buffer = bytearray(4000)
+    reads = util._reused_reads_into(buffer, io.BytesIO(bytes(10_000)).readinto, 1000)
+    assert [len(part) for part in reads] == [1000, 2000, 4000, 3000]
+
+
+# Preallocation ------------------------------------------------------------------------
+
+
+@pytest.fixture
+def fallocate_calls(monkeypatch):
+    """The (fd, offset, length) of the calls to ``os.posix_fallocate``."""
+    calls = []
+    posix_fallocate = getattr(os, "posix_fallocate", None)
+
+    def spy(fd, offset, length):
+        calls.append((fd, offset, length))
+        if posix_fallocate is not None:
+            posix_fallocate(fd, offset, length)
+
+    monkeypatch.setattr(os, "posix_fallocate", spy, raising=False)
+    return calls
+
+
+def _with_free_space(monkeypatch, free):
+    fake = type("statvfs", (), {"f_bavail": free, "f_frsize": 1})
+    monkeypatch.setattr(os, "fstatvfs", lambda fd: fake, raising=False)
+
+
+def test_large_cache_writes_are_preallocated(tmp_path, fallocate_calls):
+    graze("http://a.com/big.bin", str(tmp_path), source=lambda url: PAYLOAD)
+    graze("http://a.com/small.bin", str(tmp_path), source=lambda url: b"small")
+    assert [length for _, _, length in fallocate_calls] == [len(PAYLOAD)]
+    assert Graze(str(tmp_path))["http://a.com/big.bin"] == PAYLOAD
+
+
+def test_downloads_to_files_are_preallocated(server, tmp_path, fallocate_calls):
+    url = server.route("/big.bin", PAYLOAD)
+    download_url_contents(url, str(tmp_path / "big.bin"))
+    assert [length for _, _, length in fallocate_calls] == [len(PAYLOAD)]
+
+    fallocate_calls.clear()
+    g = GrazeBase(str(tmp_path / "cache"))
+    assert b"".join(g.iter_chunks(url)) == PAYLOAD  # (the streaming writer)
+    assert [length for _, _, length in fallocate_calls] == [len(PAYLOAD)]
+    assert g[url] == PAYLOAD
+
+
+def test_a_shorter_stream_than_announced_is_truncated(tmp_path, fallocate_calls):
+    filepath = str(tmp_path / "file.bin")
+    chunks = [PAYLOAD[:1000], PAYLOAD[1000:2000]]
+    assert list(tee_chunks_to_file(chunks, filepath, size=lambda: len(PAYLOAD)))
+    assert open(filepath, "rb").read() == PAYLOAD[:2000]
+
+
+def test_insufficient_space_fails_before_writing(server, tmp_path, monkeypatch):
+    _with_free_space(monkeypatch, len(PAYLOAD) - 1)
+    with pytest.raises(InsufficientSpace) as error:
+        graze("http://a.com/big.bin", str(tmp_path), source=lambda url: PAYLOAD)
+    assert error.value.errno == errno.ENOSPC
+    assert len(Graze(str(tmp_path))) == 0  # (no empty file left behind)
+
+    url = server.route("/big.bin", PAYLOAD)
+    with pytest.raises(InsufficientSpace):
+        b"".join(GrazeBase(str(tmp_path)).iter_chunks(url))
+    assert len(Graze(str(tmp_path))) == 0
+
+    assert preallocate(io.BytesIO(), len(PAYLOAD)) is False  # (not a file on disk)
+
+
+def test_failed_downloads_to_files_leave_them_as_they_were(
+    server, tmp_path, monkeypatch
+):
+    filepath = str(tmp_path / "big.bin")
+    url = server.route("/big.bin", PAYLOAD)
+    _with_free_space(monkeypatch, len(PAYLOAD) - 1)
+    with pytest.raises(InsufficientSpace):
+        download_url_contents(url, filepath)
+    assert os.listdir(tmp_path) == []  # (no empty file, no temporary file)
+
+    open(filepath, "wb").write(b"previous")
+    url = server.route("/short", PAYLOAD[:1000], headers={"Content-Length": "5000"})
+    with pytest.raises(http.client.IncompleteRead):
+        download_url_contents(url, filepath)
+    assert os.listdir(tmp_path) == ["big.bin"]
+    assert open(filepath, "rb").read() == b"previous"
+
+
+# Known directories --------------------------------------------------------------------
+
+
+@pytest.fixture
+def makedirs_calls(monkeypatch):
+    """The directories ``os.makedirs`` was called with (the known ones forgotten)."""
+    calls = []
+    makedirs = os.makedirs
+
+    def spy(name, *args, **kwargs):
+        calls.append(name)
+        return makedirs(name, *args, **kwargs)
+
+    monkeypatch.setattr(os, "makedirs", spy)
+    util.known_dirs.clear()
+    return calls
+
+
+def test_directories_are_only_made_once(tmp_path, makedirs_calls):
+    cache = str(tmp_path / "cache")
+    graze("http://a.com/data/0.json", cache, source=lambda url: b"x")
+    n_calls = len(makedirs_calls)  # (os.makedirs calls itself, for the parents)
+    for i in range(1, 5):
+        graze(f"http://a.com/data/{i}.json", cache, source=lambda url: b"x")
+    assert len(makedirs_calls) == n_calls
+
+    files = LocalFiles(str(tmp_path))
+    files["sub/0.bin"] = b"x"
+    n_calls = len(makedirs_calls)
+    for i in range(1, 5):
+        files[f"sub/{i}.bin"] = b"x"
+    assert len(makedirs_calls) == n_calls
+
+
+def test_writes_remake_directories_removed_since(tmp_path, makedirs_calls):
+    url = "http://a.com/data/0.json"
+    cache = str(tmp_path / "cache")
+    g = Graze(cache)
+    for write in [
+        lambda: graze(url, cache, source=lambda url: b"x", refresh=True),
+        lambda: g.__setitem__(url, b"x"),
+        lambda: LocalFiles(cache).__setitem__(url_to_localpath(url), b"x"),
+        lambda: list(tee_chunks_to_file([b"x"], g.filepath_of(url))),
+    ]:
+        write()
+        shutil.rmtree(os.path.join(cache, "http"))
+        write()
+        assert open(g.filepath_of(url), "rb").read() == b"x"
+
+
+def test_known_dirs_are_bounded(tmp_path):
+    known = util.KnownDirs(maxsize=3)
+    dirs = [str(tmp_path / str(i)) for i in range(5)]
+    for dirpath in dirs:
+        assert known.ensure(dirpath) is False
+    assert len(known) == 3 and dirs[0] not in known and dirs[-1] in known
+    assert known.ensure(dirs[-1]) is True
+
+    with pytest.raises(PermissionError):  # (other errors aren't retried)
+        util.write_in_dir(_raise(PermissionError(errno.EACCES, "no")), dirs[-1] + "/f")
+
+
+def _raise(error):
+    def write():
+        raise error
+
+    return write
+
+
+# Google Drive's virus-scan page ------------------------------------------------------
+
+VIRUS_SCAN_PAGE = (
+    b"<!DOCTYPE html><html><head><title>Google Drive - Virus scan warning</title>"
+    + b"<!-- padding -->" * 100  # (the token comes after the sniffed head)
+    + b'</head><body><form action="/uc"><input type="hidden" name="confirm" '
+    b'value="t0k-en"></form></body></html>'
+)
+
+
+def _drive_file(server, *, interstitial=True):
+    """The resolution of a Drive file served by server: behind the virus-scan page
+    (whose download, confirmed with its token, is the PAYLOAD), or not."""
+    url = server.route("/uc?export=download&id=1Ab", PAYLOAD)
+    if interstitial:
+        server.route("/uc?export=download&id=1Ab", VIRUS_SCAN_PAGE)
+        server.route("/uc?export=download&id=1Ab&confirm=t0k-en", PAYLOAD)
+    share_url = "https://drive.google.com/file/d/1Ab/view"
+    return ResolvedShareLink(share_url, "google_drive", ShareLinkKind.FILE, url)
+
+
+def test_the_virus_scan_page_is_skipped_without_being_written(server, tmp_path):
+    resolved = _drive_file(server)
+    skip = dict(skip_virus_scan_confirmation_page=True, resolved=resolved)
+    assert download_from_google_drive(resolved.url, **skip) == PAYLOAD
+
+    filepath = str(tmp_path / "file.bin")
+    assert download_from_google_drive(resolved.url, filepath, **skip) == filepath
+    assert open(filepath, "rb").read() == PAYLOAD
+
+    file = io.BytesIO()
+    file.write(b"before:")
+    download_from_google_drive(resolved.url, file, **skip)
+    assert file.getvalue() == b"before:" + PAYLOAD  # (no page in between)
+
+    assert server.hits("/uc?export=download&id=1Ab") == 3  # (one request each)
+    assert server.hits("/uc?export=download&id=1Ab&confirm=t0k-en") == 3
+
+    resolved = _drive_file(server, interstitial=False)
+    assert download_from_google_drive(resolved.url, **skip) == PAYLOAD
+
+
+def test_a_page_past_the_confirmation_is_refused(server, tmp_path):
+    resolved = _drive_file(server)
+    server.route("/uc?export=download&id=1Ab&confirm=t0k-en", VIRUS_SCAN_PAGE)
+    filepath = str(tmp_path / "file.bin")
+    with pytest.raises(ContentKindMismatch, match="HTML page"):
+        download_from_google_drive(
+            resolved.url,
+            filepath,
+            skip_virus_scan_confirmation_page=True,
+            resolved=resolved,
+        )
+    assert os.listdir(tmp_path) == []
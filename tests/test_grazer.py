@@ -0,0 +1,88 @@
+"""Tests for ``Grazer``: a ``graze`` with its settings resolved once."""
+
+import os
+
+import pytest
+
+from graze.base import Grazer, graze, url_to_localpath
+
+
+def _counting_source():
+    calls = []
+
+    def source(url):
+        calls.append(url)
+        return b"contents of " + url.encode()
+
+    return source, calls
+
+
+def test_a_grazer_gets_what_graze_gets(tmp_path):
+    source, calls = _counting_source()
+    grazer = Grazer(str(tmp_path), source=source)
+    url = "http://a.com/x.json"
+
+    assert grazer(url) == b"contents of http://a.com/x.json"
+    assert grazer(url) == b"contents of http://a.com/x.json"
+    assert calls == [url]  # (the second call was a hit)
+    assert graze(url, str(tmp_path), source=source) == grazer(url)
+    assert calls == [url]
+
+    filepath = Grazer(str(tmp_path), source=source, return_key=True)(url)
+    assert filepath == os.path.join(str(tmp_path), url_to_localpath(url))
+
+
+def test_cache_keys(tmp_path):
+    source, calls = _counting_source()
+    filepath = str(tmp_path / "sub" / "data.bin")
+    grazer = Grazer(cache_key=filepath, source=source, return_key=True)
+    assert grazer("http://a.com/x") == filepath
+    assert open(filepath, "rb").read() == b"contents of http://a.com/x"
+
+    cache = {}
+    grazer = Grazer(cache, cache_key=lambda url: url.rsplit("/", 1)[-1], source=source)
+    grazer("http://a.com/x")
+    assert list(cache) == ["x"]
+
+    # a cache_key function giving full filepaths: those are the cache
+    grazer = Grazer(cache_key=lambda url: str(tmp_path / url[-1]), source=source)
+    grazer("http://a.com/y")
+    assert (tmp_path / "y").read_bytes() == b"contents of http://a.com/y"
+    with pytest.raises(ValueError, match="ambiguous"):
+        Grazer({}, cache_key=lambda url: str(tmp_path / url[-1]), source=source)("x")
+
+    with pytest.raises(ValueError, match="ambiguous"):
+        Grazer({}, cache_key=filepath)
+
+
+def test_refresh_and_max_age(tmp_path):
+    source, calls = _counting_source()
+    cache = {}
+    Grazer(cache, source=source, refresh=True)("http://a.com/x")
+    Grazer(cache, source=source, refresh=True)("http://a.com/x")
+    assert len(calls) == 2
+
+    refreshes = []
+    grazer = Grazer(cache, source=source, refresh=lambda k, u: refreshes.append(k))
+    grazer("http://a.com/x")
+    assert refreshes == [url_to_localpath("http://a.com/x")] and len(calls) == 2
+
+    filepath = str(tmp_path / "data.bin")
+    grazer = Grazer(cache_key=filepath, source=source, max_age=3600)
+    grazer("http://a.com/x")
+    grazer("http://a.com/x")
+    assert len(calls) == 3
+    os.utime(filepath, (0, 0))  # (now older than max_age)
+    grazer("http://a.com/x")
+    assert len(calls) == 4
+
+    with pytest.raises(ValueError, match="refresh"):
+        Grazer(cache, refresh="yes")
+
+
+def test_a_grazer_is_immutable_and_makes_its_source_once():
+    grazer = Grazer({})
+    source = grazer._source
+    with pytest.raises(AttributeError):
+        grazer.source = None
+    assert grazer._source is source  # (the default Internet(), made when compiled)
@@ -0,0 +1,205 @@
+"""Tests for the cache key layouts of :mod:`graze.layouts` (and their url sidecars)."""
+
+import doctest
+import os
+
+import pytest
+
+from graze import layouts
+from graze._migration_tools import migrate_layout
+from graze.base import (
+    Graze,
+    GrazeBase,
+    graze,
+    graze_chunks,
+    localpath_to_url,
+    url_to_localpath,
+)
+from graze.cli import cache_stats, cached_files, evict
+from graze.layouts import sharded_localpath, url_sidecar_key
+
+URLS = ["http://a.com/x/1.json", "http://a.com/x/2.json", "http://b.com/y.csv"]
+
+
+def _sharded_cache(rootdir):
+    g = GrazeBase(rootdir, layout="sharded")
+    for url in URLS:
+        g[url] = url.encode()
+    return g
+
+
+def test_a_sharded_cache_iterates_over_its_urls(tmp_path):
+    g = _sharded_cache(str(tmp_path))
+    assert sorted(g) == sorted(URLS)
+    assert len(g) == 3 and g[URLS[0]] == URLS[0].encode()
+    key = sharded_localpath(URLS[0])
+    assert os.path.isfile(tmp_path / key) and os.path.isfile(
+        tmp_path / url_sidecar_key(key)
+    )
+
+    del g[URLS[0]]
+    assert sorted(g) == sorted(URLS[1:])
+    assert not os.path.exists(tmp_path / url_sidecar_key(key))
+
+    with pytest.raises(ValueError, match="layout"):
+        GrazeBase(str(tmp_path), layout="flat")
+    with pytest.raises(ValueError, match="layout"):
+        GrazeBase(str(tmp_path), layout="sharded", url_to_cache_key=str)
+
+
+def test_sidecars_of_mappings_and_streamed_downloads(tmp_path, server):
+    cache = {}
+    graze(URLS[0], cache, cache_key=sharded_localpath, source=lambda url: b"x")
+    assert set(cache) == {
+        sharded_localpath(URLS[0]),
+        url_sidecar_key(sharded_localpath(URLS[0])),
+    }
+    g = GrazeBase(cache, layout="sharded")
+    assert list(g) == [URLS[0]] and len(g) == 1
+
+    url = server.route("/streamed.bin", b"streamed")
+    rootdir = str(tmp_path)
+    assert b"".join(graze_chunks(url, rootdir, cache_key=sharded_localpath)) == (
+        b"streamed"
+    )
+    assert list(GrazeBase(rootdir, layout="sharded")) == [url]
+
+
+def test_iteration_skips_partial_downloads(tmp_path):
+    g = _sharded_cache(str(tmp_path))
+    dirpath = os.path.dirname(tmp_path / sharded_localpath(URLS[0]))
+    open(os.path.join(dirpath, ".tmpdownload.part"), "wb").close()
+    assert len(g) == 3 and sorted(g) == sorted(URLS)
+
+
+def test_the_cli_reports_and_evicts_urls_of_sharded_keys(tmp_path):
+    rootdir = str(tmp_path)
+    _sharded_cache(rootdir)
+    assert sorted(url for url, _ in cached_files(rootdir)) == sorted(URLS)
+    assert cache_stats(rootdir)["files"] == 3
+
+    assert evict(rootdir, match="http://b.com/*") == ["http://b.com/y.csv"]
+    assert sorted(url for url, _ in cached_files(rootdir)) == sorted(URLS[:2])
+    sidecars = [
+        name for *_, files in os.walk(rootdir) for name in files if ".url" in name
+    ]
+    assert len(sidecars) == 2  # (that of the evicted file went with it)
+
+
+def test_migrating_between_layouts(tmp_path):
+    rootdir = str(tmp_path / "cache")
+    g = GrazeBase(rootdir)
+    for url in URLS:
+        g[url] = url.encode()
+
+    assert migrate_layout(rootdir, to="sharded") == 3
+    assert migrate_layout(rootdir, to="sharded") == 0  # (already there)
+    assert not os.path.exists(os.path.join(rootdir, "http"))  # (emptied, removed)
+    g = GrazeBase(rootdir, layout="sharded")
+    assert sorted(g) == sorted(URLS) and g[URLS[2]] == URLS[2].encode()
+
+    dst_root = str(tmp_path / "nested")
+    assert migrate_layout(rootdir, to="nested", dst_root=dst_root) == 3
+    assert os.path.isfile(os.path.join(dst_root, url_to_localpath(URLS[0])))
+    assert sorted(GrazeBase(dst_root)) == sorted(URLS)
+    assert os.listdir(rootdir) == []
+
+
+def test_an_interrupted_migration_can_be_run_again(tmp_path, monkeypatch):
+    rootdir = str(tmp_path / "cache")
+    g = GrazeBase(rootdir)
+    for url in URLS:
+        g[url] = url.encode()
+
+    def interrupted(filepath):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(layouts, "remove_url_sidecar", interrupted)  # (right after a move)
+        with pytest.raises(KeyboardInterrupt):
+            migrate_layout(rootdir, to="sharded")
+    assert migrate_layout(rootdir, to="sharded") == 2
+    assert sorted(GrazeBase(rootdir, layout="sharded")) == sorted(URLS)
+
+
+def test_migrating_leaves_other_files_alone(tmp_path):
+    from graze.graze_exceptional import add_exception
+
+    rootdir = str(tmp_path / "cache")
+    GrazeBase(rootdir)[URLS[0]] = b"nested"
+    local = tmp_path / "local.csv"
+    local.write_bytes(b"local")
+    add_exception(rootdir, URLS[2], str(local))
+
+    sharded = os.path.join(rootdir, sharded_localpath(URLS[0]))
+    os.makedirs(os.path.dirname(sharded))
+    open(sharded, "wb").write(b"sharded")
+    layouts.write_url_sidecar(sharded, URLS[0])  # (the url cached in both layouts)
+    with pytest.raises(FileExistsError):
+        migrate_layout(rootdir, to="sharded")
+    assert open(sharded, "rb").read() == b"sharded"  # (not overwritten)
+    assert GrazeBase(rootdir)[URLS[0]] == b"nested"  # (nor moved)
+
+    os.remove(sharded)
+    layouts.remove_url_sidecar(sharded)
+    assert migrate_layout(rootdir, to="sharded") == 1
+    assert os.path.isfile(os.path.join(rootdir, "_exceptions.json"))
+
+
+LONG_URL = "http://a.com/api/search?q=" + "x" * 400 + "&page=2"
+
+
+def test_urls_too_long_for_paths_get_digest_keys(tmp_path, server):
+    rootdir = str(tmp_path)
+    key = url_to_localpath(LONG_URL)
+    assert key.startswith("http/a.com_f/api_f/search?q=xxx")
+    assert all(len(name) <= layouts.MAX_NAME_BYTES for name in key.split("/"))
+    assert url_to_localpath(LONG_URL) == key  # (deterministic)
+
+    assert graze(LONG_URL, rootdir, source=lambda url: b"results") == b"results"
+    assert list(Graze(rootdir)) == [LONG_URL] and len(Graze(rootdir)) == 1
+    assert Graze(rootdir)[LONG_URL] == b"results"
+    assert localpath_to_url(key, rootdir=rootdir) == LONG_URL
+    assert [url for url, _ in cached_files(rootdir)] == [LONG_URL]
+
+    url = server.route(
+        "/" + "y" * 300, b"streamed"
+    )  # (a temporary file is named after it)
+    assert b"".join(GrazeBase(rootdir).iter_chunks(url)) == b"streamed"
+    assert sorted(GrazeBase(rootdir)) == sorted([LONG_URL, url])
+
+    long_path_url = "http://a.com/" + "/".join(["d" * 200] * 25)
+    assert layouts.is_digest_name(url_to_localpath(long_path_url))
+    max_digest_name = layouts.READABLE_PREFIX_BYTES + 1 + 64
+    assert len(url_to_localpath(long_path_url)) <= (
+        layouts.MAX_FALLBACK_FOLDERS_BYTES + max_digest_name
+    )
+    graze(long_path_url, rootdir, source=lambda url: b"deep")
+    assert sorted(GrazeBase(rootdir)) == sorted([LONG_URL, url, long_path_url])
+
+
+def test_names_up_to_name_max_keep_their_key(tmp_path, server):
+    rootdir = str(tmp_path)
+    name = "z" * layouts.MAX_NAME_BYTES
+    url = server.route("/" + name, b"streamed")
+    key = url_to_localpath(url)
+    assert key.endswith("/" + name)  # (not a digest key)
+
+    assert b"".join(GrazeBase(rootdir).iter_chunks(url)) == b"streamed"
+    assert os.path.isfile(os.path.join(rootdir, key))  # (its temporary file fit)
+    assert list(GrazeBase(rootdir)) == [url]
+
+
+def test_keys_stay_in_the_cache_folder(tmp_path):
+    rootdir = str(tmp_path / "cache")
+    for url in ["http://a.com/..", "http://a.com/."]:
+        graze(url, rootdir, source=lambda url: b"x")
+    assert os.listdir(tmp_path) == ["cache"]
+    assert sorted(Graze(rootdir)) == ["http://a.com/.", "http://a.com/.."]
+
+
+def test_doctests():
+    results = doctest.testmod(
+        layouts, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
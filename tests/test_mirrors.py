@@ -0,0 +1,114 @@
+"""Tests for :mod:`graze.mirrors` and the ``mirrors`` of ``graze`` and ``GrazeBase``."""
+
+import doctest
+import threading
+import time
+
+import pytest
+
+from graze import mirrors
+from graze.base import GrazeBase, Internet, graze
+from graze.mirrors import HedgedSource, MirrorStats, hedged_fetch
+
+
+def slow(seconds, body):
+    def answer(handler):
+        time.sleep(seconds)
+        return 200, body, {}
+
+    return answer
+
+
+def test_a_slow_mirror_is_hedged(server, tmp_path):
+    release = threading.Event()
+
+    def stuck(handler):
+        release.wait(5)
+        return 200, b"slow data", {}
+
+    slow_url = server.route("/slow/data", stuck)
+    fast_url = server.route("/fast/data", b"fast data")
+    stats = MirrorStats()
+    try:
+        contents = graze(
+            slow_url,
+            str(tmp_path),
+            source=HedgedSource(Internet(), [fast_url], hedge_after=0.05, stats=stats),
+        )
+    finally:
+        release.set()
+    assert contents == b"fast data"  # (the slow one never answered in time)
+    assert server.hits("/fast/data") == 1
+    g = GrazeBase(str(tmp_path), source=Internet())
+    assert g[slow_url] == b"fast data"  # cached, under the url asked for
+
+
+def test_failures_move_on_right_away():
+    asked = []
+
+    def fetch_chunks(url):
+        asked.append(url)
+        if "dead" in url:
+            raise KeyError(url)
+        yield b"ok"
+
+    # (waiting for hedge_after, the second url would only be asked an hour later)
+    urls = ["http://dead/x", "http://up/x"]
+    assert hedged_fetch(fetch_chunks, urls, hedge_after=3600) == b"ok"
+    assert asked == urls
+
+    with pytest.raises(KeyError):
+        hedged_fetch(fetch_chunks, ["http://dead/x", "http://dead2/x"])
+
+
+def test_the_loser_is_cancelled():
+    go_on, closed = threading.Event(), threading.Event()
+    n_chunks = []
+
+    def fetch_chunks(url):
+        if "fast" in url:
+            yield b"fast"
+            return
+        try:
+            for i in range(100):
+                n_chunks.append(i)
+                yield b"."
+                go_on.wait(5)  # (stuck until the fast one has won)
+        finally:
+            closed.set()
+
+    urls = ["http://slow/x", "http://fast/x"]
+    assert hedged_fetch(fetch_chunks, urls, hedge_after=0.01) == b"fast"
+    go_on.set()
+    assert closed.wait(5)
+    assert len(n_chunks) <= 2  # (stopped at its next chunk, not run to the end)
+
+
+def test_stats_rank_the_mirrors(server, monkeypatch):
+    slow_url = server.route("/slow/data", slow(0.3, b"data"))
+    fast_url = server.route("/fast/data", b"data").replace("127.0.0.1", "localhost")
+    stats = MirrorStats()
+    g = GrazeBase(
+        {},
+        source=Internet(),
+        url_to_cache_key=lambda url: url,
+        mirrors=lambda url: [fast_url],
+        hedge_after=0.05,
+    )
+    monkeypatch.setattr(mirrors, "DFLT_MIRROR_STATS", stats)
+    assert g[slow_url] == b"data"
+    time.sleep(0.3)  # (letting the slow one be cancelled, and recorded)
+    assert stats.rank([slow_url, fast_url]) == [fast_url, slow_url]
+
+
+def test_graze_takes_mirrors(server, tmp_path):
+    dead_url = server.route("/dead/data", status=404)
+    up_url = server.route("/up/data", b"data")
+    assert graze(dead_url, str(tmp_path), mirrors=[up_url]) == b"data"
+
+
+def test_mirrors_doctests():
+    results = doctest.testmod(
+        mirrors, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
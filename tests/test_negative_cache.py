@@ -0,0 +1,107 @@
+"""Tests for :mod:`graze.negative_cache` and its use by ``Internet``."""
+
+import doctest
+import shelve
+
+import pytest
+
+import graze.negative_cache
+from graze.base import GrazeBase, Internet
+from graze.negative_cache import KnownFailure, NegativeCache
+
+
+def test_a_dead_url_is_only_fetched_once(server, tmp_path):
+    url = server.route("/dead", b"not here", status=404)
+    nc = NegativeCache()
+    g = GrazeBase(cache=str(tmp_path), source=Internet(negative_cache=nc))
+
+    with pytest.raises(KeyError):
+        g[url]
+    with pytest.raises(KnownFailure):
+        g[url]
+
+    assert server.hits("/dead") == 1
+    assert nc[url].status_code == 404
+
+
+def test_known_failures_are_key_errors(server):
+    url = server.route("/dead", status=410)
+    internet = Internet(negative_cache=NegativeCache())
+    with pytest.raises(KeyError):
+        internet[url]
+    with pytest.raises(KeyError):
+        internet[url]
+
+
+def test_untracked_statuses_are_refetched(server):
+    url = server.route("/forbidden", status=403)
+    nc = NegativeCache()
+    internet = Internet(negative_cache=nc)
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            internet[url]
+    assert server.hits("/forbidden") == 2
+    assert url not in nc
+
+
+def test_a_success_forgets_the_failure(server):
+    url = server.route("/flaky", status=503)
+    now = [0.0]
+    nc = NegativeCache(clock=lambda: now[0])
+    internet = Internet(negative_cache=nc)
+    with pytest.raises(KeyError):
+        internet[url]
+
+    now[0] += nc.ttls["5xx"] + 1  # expired: tried again...
+    server.route("/flaky", b"back up")
+    assert internet[url] == b"back up"
+    assert nc.store == {}  # ...and the backoff is reset
+
+
+def test_failures_persist_across_runs(server, tmp_path):
+    url = server.route("/dead", status=404)
+    with shelve.open(str(tmp_path / "negative")) as store:
+        with pytest.raises(KeyError):
+            Internet(negative_cache=NegativeCache(store))[url]
+
+    with shelve.open(str(tmp_path / "negative")) as store:
+        with pytest.raises(KnownFailure):
+            Internet(negative_cache=NegativeCache(store))[url]
+    assert server.hits("/dead") == 1
+
+
+def test_iter_chunks_records_failures_too(server):
+    url = server.route("/dead", status=404)
+    nc = NegativeCache()
+    with pytest.raises(KeyError):
+        list(Internet(negative_cache=nc).iter_chunks(url))
+    assert url in nc
+
+
+def test_subclasses_get_plain_urls_their_own_way(server):
+    url = server.route("/dead", b"not here", status=404)
+
+    class Offline(Internet):
+        def _get_contents_of_url(self, url, file=None):
+            return b"offline copy of " + url.encode()
+
+    nc = NegativeCache()
+    assert Offline(negative_cache=nc)[url] == b"offline copy of " + url.encode()
+    assert server.hits("/dead") == 0
+
+    class Failing(Internet):  # (failures of the hook are recorded too)
+        def _get_contents_of_url(self, url, file=None):
+            return super()._get_contents_of_url(url, file)
+
+    with pytest.raises(KeyError):
+        Failing(negative_cache=nc)[url]
+    with pytest.raises(KnownFailure):
+        Failing(negative_cache=nc)[url]
+
+
+def test_negative_cache_doctests():
+    results = doctest.testmod(
+        graze.negative_cache,
+        optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE,
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -0,0 +1,121 @@
+"""Tests for :mod:`graze.progress` and the reporting of the download paths."""
+
+import doctest
+import io
+
+import pytest
+
+from graze import progress
+from graze.base import GrazeBase, Internet, graze, graze_chunks
+from graze.progress import (
+    ProgressTracker,
+    TerminalProgress,
+    progress_scope,
+    reported,
+)
+from graze.rate_limit import HostScheduler
+from graze.util import chks_of_url_contents
+
+BODY = bytes(range(256)) * 1000
+
+
+def test_graze_reports_with_the_total_of_its_get(server, tmp_path):
+    url = server.route("/big", BODY)
+    events = []
+    contents = graze(url, str(tmp_path), progress=events.append)
+    assert contents == BODY
+    assert server.hits("/big") == 1  # (no HEAD request for the total)
+
+    first, last = events[0], events[-1]
+    assert (first.received, first.total, first.done) == (0, len(BODY), False)
+    assert (last.received, last.total, last.done) == (len(BODY), len(BODY), True)
+    assert last.error is None and last.eta == 0.0
+
+    events.clear()
+    graze(url, str(tmp_path), progress=events.append)
+    assert events == []  # (a cache hit downloads nothing)
+
+
+def test_streaming_and_urllib_downloads_report(server, tmp_path):
+    url = server.route("/big", BODY)
+    events = []
+    g = GrazeBase(str(tmp_path), progress=events.append)
+    assert b"".join(g.iter_chunks(url)) == BODY
+    assert events[-1].received == len(BODY) and events[-1].done
+
+    events.clear()
+    internet = Internet(progress=events.append)
+    assert b"".join(internet.iter_chunks(url)) == BODY
+    assert events[-1].total == len(BODY) and events[-1].done
+
+    events.clear()
+    with progress_scope(events.append):
+        assert b"".join(chks_of_url_contents(url)) == BODY
+    assert events[-1].received == events[-1].total == len(BODY)
+
+    events.clear()
+    assert list(graze_chunks(url, str(tmp_path / "other"))) and events == []
+
+
+def test_a_batch_is_tracked(server, tmp_path):
+    urls = [server.route(f"/{i}", bytes(1000 * (i + 1))) for i in range(5)]
+    updates = []
+    tracker = ProgressTracker(on_update=updates.append)
+    g = GrazeBase(str(tmp_path))
+    with progress_scope(tracker):
+        HostScheduler().map(g.__getitem__, urls, max_workers=3)
+
+    snapshot = tracker.snapshot()
+    assert (snapshot.active, snapshot.done, snapshot.failed) == (0, 5, 0)
+    assert snapshot.received == snapshot.total == 15_000
+    assert updates and updates[-1].done == 5
+    assert "0 downloading, 5 done" in str(snapshot)
+
+
+def test_failures_and_early_stops_are_reported():
+    def failing():
+        yield b"abc"
+        raise ConnectionError("boom")
+
+    tracker = ProgressTracker()
+    with progress_scope(tracker):
+        with pytest.raises(ConnectionError):
+            list(reported(failing(), "http://a.com/x", total=10))
+        chunks = reported([b"a", b"b", b"c"], "http://a.com/y", total=3)
+        next(chunks)
+        chunks.close()  # (the consumer stopped)
+
+    snapshot = tracker.snapshot()
+    assert (snapshot.active, snapshot.done, snapshot.failed) == (0, 1, 1)
+    assert tracker.downloads == {}
+
+
+def test_reports_are_rate_limited():
+    now = [0.0]
+    events = []
+    with progress_scope(events.append):
+        for _ in reported(
+            [b"x"] * 100, "http://a.com/x", interval=1.0, clock=lambda: now[0]
+        ):
+            now[0] += 0.1
+    assert 10 <= len(events) <= 12  # (about one per second, and the first and last)
+
+
+def test_terminal_progress():
+    stream = io.StringIO()
+    reporter = TerminalProgress(stream, interval=0)
+    with progress_scope(reporter):
+        list(reported([b"x" * 500, b"x" * 500], "http://a.com/x", total=1000))
+    lines = stream.getvalue().splitlines()
+    assert lines[-1].startswith("http://a.com/x: 1.0 KB / 1.0 KB (100%)")
+
+    with progress_scope(reporter):
+        list(reported([b"x" * 1000], "http://a.com/y"))
+    assert "0 downloading, 2 done" in stream.getvalue().splitlines()[-1]
+
+
+def test_doctests():
+    results = doctest.testmod(
+        progress, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -0,0 +1,118 @@
+"""Tests for :mod:`graze.ranges` (sparse caching of byte ranges)."""
+
+import doctest
+import re
+
+import pytest
+
+import graze.ranges
+from graze.base import GrazeBase, RequestFailure
+from graze.ranges import SparseBlockFile, read_range, requests_get_range
+
+REMOTE = bytes(range(256)) * 4096  # 1 MB
+
+
+def serve_ranges(body, requested):
+    """A route answering ``Range`` requests (and recording them) like a CDN would."""
+
+    def answer(handler):
+        header = handler.headers.get("Range")
+        if header is None:
+            return 200, body, {}
+        start, stop = map(int, re.match(r"bytes=(\d+)-(\d+)", header).groups())
+        requested.append((start, stop + 1))
+        if start >= len(body):
+            return 416, b"", {"Content-Range": f"bytes */{len(body)}"}
+        chunk = body[start : stop + 1]
+        content_range = f"bytes {start}-{start + len(chunk) - 1}/{len(body)}"
+        return 206, chunk, {"Content-Range": content_range}
+
+    return answer
+
+
+def test_footer_read_does_not_download_the_file(server, tmp_path):
+    requested = []
+    url = server.route("/big.parquet", serve_ranges(REMOTE, requested))
+
+    footer = read_range(url, -8, rootdir=str(tmp_path), block_size=64 * 1024)
+
+    assert footer == REMOTE[-8:]
+    assert sum(stop - start for start, stop in requested) == 2 * 64 * 1024
+
+
+def test_repeated_reads_are_served_locally(server, tmp_path):
+    requested = []
+    url = server.route("/big.parquet", serve_ranges(REMOTE, requested))
+    read = lambda *a: read_range(url, *a, rootdir=str(tmp_path), block_size=4096)
+
+    assert read(10_000, 20_000) == REMOTE[10_000:20_000]
+    n_requests = len(requested)
+    assert read(12_000, 19_000) == REMOTE[12_000:19_000]
+    assert read(-100, None) == REMOTE[-100:]
+    assert len(requested) == n_requests + 1  # only the tail was missing
+
+
+def test_blocks_survive_across_instances(tmp_path):
+    filepath = str(tmp_path / "x")
+    f = SparseBlockFile(filepath, block_size=4)
+    f.write(4, b"efgh", total_size=10)
+    f.write(8, b"ij")
+
+    g = SparseBlockFile(filepath, block_size=4)
+    assert g.size == 10
+    assert g.missing_blocks(0, 10) == [0]
+
+
+def test_a_server_ignoring_ranges_fills_every_block(server, tmp_path):
+    url = server.route("/small", b"0123456789")  # ignores the Range header
+    read = lambda *a: read_range(url, *a, rootdir=str(tmp_path), block_size=4)
+
+    assert read(2, 5) == b"234"
+    assert read(-3, None) == b"789"
+    assert server.hits("/small") == 1
+
+
+def test_ranges_are_of_the_stored_bytes_and_whole_files_are_streamed(server):
+    encodings = []
+
+    def answer(handler):
+        encodings.append(handler.headers.get("Accept-Encoding"))
+        return 200, b"0123456789", {}  # (ignoring the range)
+
+    url = server.route("/whole", answer)
+    offset, data, total_size = requests_get_range(url, 2, 5)
+    assert encodings == ["identity"]
+    assert (offset, total_size) == (0, 10)
+    assert not isinstance(data, bytes)  # (chunks, written as they come)
+    assert b"".join(data) == b"0123456789"
+
+
+def test_a_failed_range_request_has_its_status_code(server):
+    url = server.route("/busy", status=503, headers={"Retry-After": "3"})
+    with pytest.raises(RequestFailure) as error:
+        requests_get_range(url, 0, 10)
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "3"
+
+
+def test_graze_read_range_uses_a_whole_cached_file_if_there(server, tmp_path):
+    requested = []
+    url = server.route("/big.parquet", serve_ranges(REMOTE, requested))
+    g = GrazeBase(cache=str(tmp_path / "cache"))
+
+    assert g.read_range(url, -8) == REMOTE[-8:]
+    assert requested  # fetched (partially) ...
+    assert url not in g  # ... but not cached as a whole
+    assert g.ranges_rootdir == str(tmp_path / "cache") + "_ranges"
+
+    _ = g[url]
+    requested.clear()
+    assert g.read_range(url, 100, 200) == REMOTE[100:200]
+    assert requested == []
+
+
+def test_ranges_doctests():
+    results = doctest.testmod(
+        graze.ranges, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
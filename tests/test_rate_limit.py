@@ -0,0 +1,150 @@
+"""Tests for :mod:`graze.rate_limit` and its use by ``Internet``."""
+
+import asyncio
+import doctest
+import threading
+import time
+
+import pytest
+
+import graze.rate_limit
+from graze.base import GrazeBase, Internet
+from graze.rate_limit import HostLimits, HostScheduler
+
+
+def test_max_in_flight_caps_concurrent_requests():
+    scheduler = HostScheduler({"a.com": HostLimits(max_in_flight=2)})
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def fetch(url):
+        with scheduler.slot(url):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+        return url
+
+    urls = [f"http://a.com/{i}" for i in range(8)]
+    assert scheduler.map(fetch, urls, max_workers=8) == urls
+    assert peak[0] == 2
+
+
+def test_rate_limits_requests():
+    now = [0.0]
+    scheduler = HostScheduler(
+        {"a.com": HostLimits(rate=2, burst=1)}, clock=lambda: now[0]
+    )
+    with scheduler._condition:
+        assert scheduler._try_acquire("a.com") == 0
+        assert scheduler._try_acquire("a.com") == pytest.approx(0.5)
+        now[0] += 0.5
+        assert scheduler._try_acquire("a.com") == 0
+    assert scheduler.in_flight("a.com") == 2
+
+
+def test_waiting_for_a_token():
+    scheduler = HostScheduler(default=HostLimits(rate=20, burst=1))
+    started = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot("http://a.com/x"):
+            pass
+    assert time.monotonic() - started >= 0.09  # 2 waits of 1/20 second
+
+
+def test_hosts_are_limited_separately():
+    scheduler = HostScheduler(default=HostLimits(max_in_flight=1))
+    with scheduler.slot("http://a.com/x"):
+        with scheduler.slot("http://b.com/x"):
+            assert scheduler.in_flight("a.com") == scheduler.in_flight("b.com") == 1
+
+
+def test_map_is_fair_across_hosts():
+    scheduler = HostScheduler({"slow.com": HostLimits(max_in_flight=1)})
+    order = []
+
+    def fetch(url):
+        order.append(url)
+        time.sleep(0.05 if "slow" in url else 0)
+        return url
+
+    urls = [f"http://slow.com/{i}" for i in range(3)] + ["http://fast.com/0"]
+    scheduler.map(fetch, urls, max_workers=2)
+    assert order.index("http://fast.com/0") < order.index("http://slow.com/1")
+
+
+@pytest.mark.parametrize(
+    "limits",
+    [dict(max_in_flight=0), dict(max_in_flight=-1), dict(rate=0), dict(burst=0)],
+)
+def test_limits_that_would_block_forever_are_refused(limits):
+    with pytest.raises(ValueError):
+        HostLimits(**limits)
+
+
+def test_map_errors():
+    scheduler = HostScheduler()
+
+    def fetch(url):
+        if url.endswith("bad"):
+            raise KeyError(url)
+        return url
+
+    urls = ["http://a.com/ok", "http://a.com/bad"]
+    with pytest.raises(KeyError):
+        scheduler.map(fetch, urls)
+    ok, bad = scheduler.map(fetch, urls, return_exceptions=True)
+    assert ok == urls[0] and isinstance(bad, KeyError)
+
+
+def test_amap_and_aslot():
+    scheduler = HostScheduler(default=HostLimits(max_in_flight=1))
+    urls = [f"http://a.com/{i}" for i in range(4)]
+    assert asyncio.run(scheduler.amap(str.upper, urls)) == [u.upper() for u in urls]
+
+    async def hold_two():
+        async with scheduler.aslot(urls[0]):
+            second = asyncio.ensure_future(_hold(scheduler, urls[1]))
+            await asyncio.sleep(0.05)
+            assert not second.done()  # waiting for the first slot to be released
+        await second
+
+    asyncio.run(hold_two())
+    assert scheduler.in_flight("a.com") == 0
+
+
+async def _hold(scheduler, url):
+    async with scheduler.aslot(url):
+        pass
+
+
+def test_internet_fetches_through_the_scheduler(server, tmp_path):
+    urls = [server.route(f"/{i}", f"contents {i}".encode()) for i in range(6)]
+    seen = []
+
+    class Recording(HostScheduler):
+        def acquire(self, url):
+            seen.append(url)
+            super().acquire(url)
+
+    scheduler = Recording(default=HostLimits(max_in_flight=2))
+    g = GrazeBase(cache=str(tmp_path), source=Internet(host_scheduler=scheduler))
+    contents = scheduler.map(g.__getitem__, urls)
+    assert contents == [f"contents {i}".encode() for i in range(6)]
+    assert sorted(seen) == sorted(urls)
+
+    scheduler.map(g.__getitem__, urls)  # cache hits: no slots taken
+    assert len(seen) == 6
+
+    assert b"".join(Internet(host_scheduler=scheduler).iter_chunks(urls[0]))
+    assert len(seen) == 7
+    assert scheduler.in_flight("127.0.0.1") == 0
+
+
+def test_rate_limit_doctests():
+    results = doctest.testmod(
+        graze.rate_limit, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
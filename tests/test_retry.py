@@ -0,0 +1,134 @@
+"""Tests for :mod:`graze.retry` and its use by ``Internet`` and ``graze.util``."""
+
+import doctest
+import io
+
+import pytest
+
+import graze.retry
+from graze.base import Internet
+from graze.retry import RetryPolicy
+from graze.util import download_url_contents
+
+
+def failing_first(n_failures, body=b"finally", status=503, headers=None):
+    """A route answering ``status`` for the first ``n_failures`` requests."""
+    calls = []
+
+    def answer(handler):
+        calls.append(1)
+        if len(calls) <= n_failures:
+            return status, b"try again", dict(headers or {})
+        return 200, body, {}
+
+    return answer
+
+
+def no_wait_policy(**kwargs):
+    waited = []
+    kwargs.setdefault("jitter", 0)
+    return RetryPolicy(sleep=waited.append, **kwargs), waited
+
+
+def test_transient_failures_are_retried(server):
+    url = server.route("/flaky", failing_first(2))
+    policy, waited = no_wait_policy(max_attempts=3, backoff_base=0.1)
+
+    assert Internet(retry=policy)[url] == b"finally"
+    assert server.hits("/flaky") == 3
+    assert waited == pytest.approx([0.1, 0.2])
+
+
+def test_without_a_policy_there_is_one_attempt(server):
+    url = server.route("/flaky", failing_first(1))
+    with pytest.raises(KeyError):
+        Internet()[url]
+    assert server.hits("/flaky") == 1
+
+
+def test_non_retryable_statuses_fail_right_away(server):
+    url = server.route("/gone", status=404)
+    policy, waited = no_wait_policy(max_attempts=5)
+    with pytest.raises(KeyError):
+        Internet(retry=policy)[url]
+    assert server.hits("/gone") == 1
+    assert waited == []
+
+
+def test_retry_after_is_honored(server):
+    url = server.route(
+        "/busy", failing_first(1, status=429, headers={"Retry-After": "3"})
+    )
+    policy, waited = no_wait_policy(backoff_base=0.1)
+    assert Internet(retry=policy)[url] == b"finally"
+    assert waited == [3.0]
+
+
+def test_retry_after_is_capped(server):
+    url = server.route(
+        "/busy", failing_first(1, status=503, headers={"Retry-After": "86400"})
+    )
+    policy, waited = no_wait_policy(max_retry_after=5)
+    assert Internet(retry=policy)[url] == b"finally"
+    assert waited == [5]
+
+
+def test_the_deadline_bounds_the_retries(server):
+    url = server.route("/down", status=503)
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    policy = RetryPolicy(
+        max_attempts=100,
+        backoff_base=1,
+        jitter=0,
+        deadline=10,
+        sleep=sleep,
+        clock=lambda: now[0],
+    )
+    with pytest.raises(KeyError):
+        Internet(retry=policy)[url]
+    assert server.hits("/down") == 4  # waits of 1, 2 and 4; the next 8 would pass 10
+
+
+def test_attempts_are_reported_to_hooks(server):
+    url = server.route("/flaky", failing_first(1))
+    attempts = []
+    policy, _ = no_wait_policy(hooks=[attempts.append])
+    Internet(retry=policy)[url]
+    assert [(a.number, a.outcome) for a in attempts] == [(1, "retry"), (2, "success")]
+    assert attempts[0].args == (url,)
+    assert attempts[0].error.status_code == 503
+
+
+def test_iter_chunks_retries_before_the_first_chunk(server):
+    url = server.route("/flaky", failing_first(2))
+    policy, _ = no_wait_policy()
+    assert b"".join(Internet(retry=policy).iter_chunks(url)) == b"finally"
+
+
+def test_download_url_contents_retries(server, tmp_path):
+    url = server.route("/flaky", failing_first(1))
+    policy, _ = no_wait_policy()
+
+    assert download_url_contents(url, retry=policy) == b"finally"
+
+    server.route("/flaky", failing_first(1))
+    filepath = str(tmp_path / "file")
+    download_url_contents(url, filepath, retry=policy)
+    assert open(filepath, "rb").read() == b"finally"
+
+    server.route("/flaky", failing_first(1))
+    file = io.BytesIO(b"header:")
+    file.seek(0, io.SEEK_END)
+    download_url_contents(url, file, retry=policy)
+    assert file.getvalue() == b"header:finally"
+
+
+def test_retry_doctests():
+    results = doctest.testmod(
+        graze.retry, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
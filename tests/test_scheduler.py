@@ -0,0 +1,140 @@
+"""Tests for :mod:`graze.scheduler` and its use by ``Internet``."""
+
+import asyncio
+import doctest
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from graze import scheduler as scheduler_module
+from graze.bandwidth import BACKGROUND, INTERACTIVE, priority_scope
+from graze.base import GrazeBase, Internet
+from graze.scheduler import DownloadScheduler, QueueFull
+from graze.timeouts import check_cancelled
+
+
+def blocked_scheduler(**kwargs):
+    """A one-worker scheduler, and the event that unblocks its first job."""
+    release = threading.Event()
+    scheduler = DownloadScheduler(max_workers=1, **kwargs)
+    scheduler.submit(lambda key: release.wait(), "blocker")
+    while not scheduler.running():
+        time.sleep(0.001)
+    return scheduler, release
+
+
+def test_jobs_run_by_priority():
+    scheduler, release = blocked_scheduler()
+    order = []
+    for key, priority in [("b1", BACKGROUND), ("i1", INTERACTIVE), ("b2", BACKGROUND)]:
+        scheduler.submit(order.append, key, priority=priority)
+    assert [job.key for job in scheduler.queued()] == ["i1", "b1", "b2"]
+    release.set()
+    scheduler.shutdown()
+    assert order == ["i1", "b1", "b2"]
+
+
+def test_queued_keys_are_deduped_and_bumped():
+    scheduler, release = blocked_scheduler()
+    calls = []
+    first = scheduler.submit(calls.append, "k", priority=BACKGROUND)
+    scheduler.submit(calls.append, "other", priority=INTERACTIVE)
+    second = scheduler.submit(calls.append, "k", priority=INTERACTIVE)
+    assert first is second
+    assert [job.key for job in scheduler.queued()] == ["other", "k"]
+    release.set()
+    scheduler.shutdown()
+    assert calls == ["other", "k"]
+
+
+def test_cancelling_a_queued_job():
+    scheduler, release = blocked_scheduler()
+    calls = []
+    job = scheduler.submit(calls.append, "k")
+    assert scheduler.cancel("k")
+    assert job.state == "cancelled" and len(scheduler) == 0
+    release.set()
+    scheduler.shutdown()
+    assert calls == []
+    with pytest.raises(CancelledError):
+        job.result()
+
+
+def test_cancelling_a_running_fetch(server):
+    url = server.route("/big", bytes(1_000_000))
+    scheduler = DownloadScheduler(max_workers=1)
+    started = threading.Event()
+
+    def fetch(url):
+        from graze.util import chks_of_url_contents
+
+        for _ in chks_of_url_contents(url, chk_size=10):
+            started.set()
+            time.sleep(0.001)
+
+    job = scheduler.submit(fetch, url)
+    started.wait()
+    job.cancel()
+    with pytest.raises(CancelledError):
+        job.result(timeout=2)
+    assert scheduler.stats()["cancelled"] == 1
+    scheduler.shutdown()
+
+
+def test_resubmitting_a_cancelled_running_job():
+    scheduler = DownloadScheduler(max_workers=2)
+    started = threading.Event()
+
+    def stop_when_cancelled(key):
+        started.set()
+        while True:
+            check_cancelled()
+            time.sleep(0.001)
+
+    job = scheduler.submit(stop_when_cancelled, "k")
+    started.wait()
+    job.cancel()
+    again = scheduler.submit(str, "k")
+    assert again is not job
+    assert again.result(timeout=2) == "k"
+    with pytest.raises(CancelledError):
+        job.result(timeout=2)
+    scheduler.shutdown()
+
+
+def test_backpressure():
+    scheduler, release = blocked_scheduler(max_queued=2)
+    scheduler.submit(str, "a")
+    scheduler.submit(str, "b")
+    with pytest.raises(QueueFull):
+        scheduler.submit(str, "c", block=False)
+    with pytest.raises(QueueFull):
+        scheduler.submit(str, "c", timeout=0.05)
+    release.set()
+    assert scheduler.submit(str, "c", timeout=2).result() == "c"
+    scheduler.shutdown()
+
+
+def test_internet_fetches_are_scheduled(server, tmp_path):
+    urls = [server.route(f"/{i}", f"contents {i}".encode()) for i in range(5)]
+    with DownloadScheduler(max_workers=2) as scheduler:
+        g = GrazeBase(str(tmp_path), source=Internet(scheduler=scheduler))
+        assert g[urls[0]] == b"contents 0"  # sync
+        with priority_scope(BACKGROUND):  # batch (g[url] in jobs: run inline)
+            assert scheduler.map(g.__getitem__, urls[1:3]) == [
+                b"contents 1",
+                b"contents 2",
+            ]
+        assert asyncio.run(scheduler.asubmit(g.__getitem__, urls[3])) == b"contents 3"
+        assert scheduler.stats()["done"] == 4
+        with pytest.raises(KeyError):
+            g[server.base_url + "/missing"]
+
+
+def test_scheduler_doctests():
+    results = doctest.testmod(
+        scheduler_module, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
@@ -10,6 +10,7 @@ import doctest
 import pytest
 
 import graze.util as util
+from graze import share_links
 from graze.share_links import (
     ResolvedShareLink,
     ShareLinkKind,
@@ -17,6 +18,9 @@ from graze.share_links import (
     add_share_link_resolver,
     direct_download_url,
     resolve_share_url,
+    resolve_share_urls,
+    resolvers_of_host,
+    share_link_resolver_hosts,
     share_link_resolvers,
 )
 
@@ -386,6 +390,116 @@ def test_every_default_resolver_returns_none_for_a_foreign_url():
         assert resolve("https://example.com/a.mp4") is None, provider
 
 
+def _counting_resolver(prefix, provider="counted"):
+    calls = []
+
+    def resolve(url):
+        calls.append(url)
+        if url.startswith(prefix):
+            return ResolvedShareLink(
+                url=url,
+                provider=provider,
+                kind=ShareLinkKind.FILE,
+                direct_url=url + "?raw=1",
+            )
+
+    return resolve, calls
+
+
+def test_resolutions_are_memoized_until_the_registry_changes():
+    resolve, calls = _counting_resolver("https://counted.example/")
+    add_share_link_resolver("counted", resolve)  # (no hosts: shown every url)
+    try:
+        for _ in range(3):
+            assert resolve_share_url("https://counted.example/a").provider == "counted"
+            assert resolve_share_url(" https://example.com/b ").provider == "http"
+        assert calls == ["https://counted.example/a", "https://example.com/b"]
+
+        share_link_resolvers["counted"] = resolve  # (a change: resolutions forgotten)
+        resolve_share_url("https://counted.example/a")
+        assert len(calls) == 3
+    finally:
+        del share_link_resolvers["counted"]
+    assert resolve_share_url("https://counted.example/a").provider == "http"
+
+
+def test_adapters_are_only_shown_urls_of_their_hosts():
+    resolve, calls = _counting_resolver("https://files.counted.example/")
+    add_share_link_resolver("counted", resolve, hosts=["*.counted.example"])
+    try:
+        assert resolve_share_url("https://example.com/x").provider == "http"
+        assert resolve_share_url("https://www.dropbox.com/s/a1/x?dl=0").provider == (
+            "dropbox"
+        )
+        assert calls == []
+        assert resolve_share_url("https://files.counted.example/x").provider == (
+            "counted"
+        )
+        assert calls == ["https://files.counted.example/x"]
+    finally:
+        del share_link_resolvers["counted"]
+
+
+def test_editing_the_hosts_of_adapters_forgets_resolutions():
+    resolve, calls = _counting_resolver("https://files.counted.example/")
+    add_share_link_resolver("counted", resolve, hosts=["other.example"])
+    try:
+        url = "https://files.counted.example/x"
+        assert resolve_share_url(url).provider == "http"
+        share_link_resolver_hosts["counted"] = ("*.counted.example",)
+        assert resolve_share_url(url).provider == "counted"
+        del share_link_resolver_hosts["counted"]  # (shown every url)
+        assert resolve_share_url("https://example.com/y").provider == "http"
+        assert calls == [url, "https://example.com/y"]
+    finally:
+        del share_link_resolvers["counted"]
+
+
+def test_the_index_of_adapters_by_host_is_bounded():
+    for i in range(share_links.DFLT_HOST_CACHE_SIZE + 10):
+        resolvers_of_host(f"host{i}.example")
+    info = share_links._resolvers_of_host.cache_info()
+    assert info.currsize == share_links.DFLT_HOST_CACHE_SIZE
+
+
+def test_bulk_resolution_is_that_of_each_url_in_order():
+    urls = [
+        "https://www.dropbox.com/scl/fo/a1/x?rlkey=z&dl=0",
+        "https://example.com/a.mp4",
+        "https://1drv.ms/f/s!AbCd",
+        " https://www.dropbox.com/scl/fo/a1/x?rlkey=z&dl=0",
+        "https://drive.google.com/open?id=1AbC",
+        "not a url",
+    ]
+    resolutions = resolve_share_urls(iter(urls))
+    assert list(resolutions) == [resolve_share_url(url) for url in urls]
+    assert len(resolutions) == 6 and resolutions[1].provider == "http"
+    assert resolutions.stats == {
+        "dropbox": {"urls": 2, "unique": 1, "unresolved": 0},
+        "http": {"urls": 1, "unique": 1, "unresolved": 0},
+        "onedrive": {"urls": 1, "unique": 1, "unresolved": 1},
+        "google_drive": {"urls": 1, "unique": 1, "unresolved": 0},
+        "unknown": {"urls": 1, "unique": 1, "unresolved": 1},
+    }
+    assert resolve_share_urls([]).stats == {}
+
+
+def test_bulk_resolution_resolves_each_distinct_url_once():
+    resolve, calls = _counting_resolver("https://counted.example/")
+    urls = ["https://counted.example/a", "https://counted.example/a", "https://b.com/x"]
+    resolutions = resolve_share_urls(urls, resolvers={"counted": resolve})
+    assert [r.provider for r in resolutions] == ["counted", "counted", "http"]
+    assert calls == ["https://counted.example/a", "https://b.com/x"]
+
+    add_share_link_resolver("counted", resolve, hosts=["counted.example"])
+    try:
+        calls.clear()
+        assert resolve_share_urls(urls).stats["counted"]["unique"] == 1
+        assert calls == ["https://counted.example/a"]  # (not shown the b.com url)
+    finally:
+        del share_link_resolvers["counted"]
+
+
 # --------------------------------------------------------------------------------------
 # The transport-side routing that consumes the resolution
 
@@ -416,6 +530,58 @@ def test_an_unresolvable_route_raises_instead_of_fetching_the_share_page(monkeyp
             util.download_from_special_url(url)
 
 
+def test_a_route_is_given_the_resolution_of_its_url(monkeypatch):
+    """Resolved once: the download functions don't resolve again."""
+    resolve, calls = _counting_resolver("https://counted.example/", "counted")
+    seen = []
+    monkeypatch.setattr(
+        util, "download_url_contents", lambda url, file, **kw: seen.append(url)
+    )
+    add_share_link_resolver("counted", resolve, hosts=["counted.example"])
+    try:
+        url = "https://counted.example/bundle"
+        route = util.special_url_route(url)  # (providers without a route of their own
+        assert route.func is util.download_from_share_link  # are rewrite-then-GET)
+        util.download_from_special_url(url, route=route)
+        util.download_from_special_url(url)
+        assert seen == [url + "?raw=1"] * 2 and calls == [url]
+    finally:
+        del share_link_resolvers["counted"]
+
+    url = "https://drive.google.com/file/d/1AbC/view"
+    route = util.special_url_route(url)
+    assert route.func is util.download_from_google_drive
+    assert route.keywords["resolved"] is resolve_share_url(url)  # (the memoized one)
+
+
+def test_extra_special_url_routes():
+    downloads = []
+    condition = lambda url: url.startswith("https://special.example/")
+    util.add_special_url_route(condition, lambda url, file, **kw: downloads.append(url))
+    try:
+        assert util.is_special_url("https://special.example/x") is True
+        util.download_from_special_url("https://special.example/x")
+        assert downloads == ["https://special.example/x"]
+        assert util.is_special_url("https://example.com/x") is False
+    finally:
+        del util.special_url_routes[condition]
+
+
+def test_added_routes_take_precedence_over_share_link_routes(monkeypatch):
+    monkeypatch.setattr(util, "download_url_contents", _no_network)
+    downloads = []
+    download = lambda url, file, **kw: downloads.append(url)
+    util.add_special_url_route(util.is_dropbox_url, download)
+    try:
+        url = "https://www.dropbox.com/s/a1/x.csv?dl=0"
+        assert util.special_url_route(url) is download
+        util.download_from_special_url(url)
+        assert downloads == [url]
+    finally:
+        del util.special_url_routes[util.is_dropbox_url]
+    assert util.special_url_route(url).func is util.download_from_share_link
+
+
 def test_a_plain_url_is_not_routed_as_special():
     """Pass-through is the fallback, not a registered route -- otherwise every URL
     in the world would be a "special url" and `Internet` would reroute all of them."""
@@ -0,0 +1,99 @@
+"""Tests for :mod:`graze.spill` and its use by ``graze``."""
+
+import doctest
+import gc
+import os
+import tracemalloc
+
+from graze import spill
+from graze.base import GrazeBase, Internet, graze, graze_chunks
+from graze.spill import SpilledContents, SpillingCache
+
+PAYLOAD = bytes(range(256)) * 8000  # 2 MB
+
+
+def test_big_downloads_are_spilled_as_they_come(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    cache = SpillingCache(max_in_memory=100_000, spill_dir=str(tmp_path))
+
+    Internet()[url]  # (warm up: imports, connection machinery)
+    tracemalloc.start()
+    try:
+        contents = graze(url, cache, cache_key="big")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < len(PAYLOAD) / 2
+
+    assert isinstance(contents, SpilledContents)
+    assert contents.read() == PAYLOAD
+    assert contents.mmap()[:256] == PAYLOAD[:256]
+    assert os.path.dirname(contents.path) == str(tmp_path)
+    assert cache.stats() == {
+        "in_memory": 0,
+        "in_memory_bytes": 0,
+        "spilled": 1,
+        "spilled_bytes": len(PAYLOAD),
+    }
+
+    assert graze(url, cache, cache_key="big") is contents  # (a cache hit)
+    assert server.hits("/big.bin") == 2  # (the warm up, and the first graze)
+
+
+def test_small_contents_stay_in_memory(server):
+    url = server.route("/small", b"small")
+    g = GrazeBase(SpillingCache(max_in_memory=100))
+    assert g[url] == b"small"
+    assert g.cache.stats()["in_memory"] == 1
+
+
+def test_streamed_contents_are_spilled_too(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    cache = SpillingCache(max_in_memory=100_000, spill_dir=str(tmp_path))
+    assert b"".join(graze_chunks(url, cache, cache_key="big")) == PAYLOAD
+    assert cache["big"].read() == PAYLOAD
+
+    chunks = graze_chunks(url, cache, cache_key="abandoned", chunk_size=10_000)
+    for _ in range(20):
+        next(chunks)
+    chunks.close()
+    assert "abandoned" not in cache
+    assert os.listdir(tmp_path) == [os.path.basename(cache["big"].path)]
+
+
+def test_spill_files_are_removed_with_their_entries(tmp_path):
+    cache = SpillingCache(max_in_memory=10, spill_dir=str(tmp_path))
+    cache["a"] = b"x" * 100
+    cache["b"] = b"y" * 100
+    path_a = cache["a"].path
+
+    cache["a"] = b"small"  # (replaced)
+    assert not os.path.exists(path_a)
+    cache["b"] = cache["b"]  # (set to itself: kept)
+    assert cache["b"].read() == b"y" * 100
+    del cache["b"]
+    assert os.listdir(tmp_path) == []
+    assert cache.stats() == {
+        "in_memory": 1,
+        "in_memory_bytes": 5,
+        "spilled": 0,
+        "spilled_bytes": 0,
+    }
+
+
+def test_a_dropped_handle_removes_its_file(tmp_path):
+    spool = spill.Spool(max_in_memory=1, dir=str(tmp_path))
+    spool.write(b"abc")
+    spool.close()
+    contents = spool.contents()
+    assert len(os.listdir(tmp_path)) == 1
+    del contents, spool
+    gc.collect()
+    assert os.listdir(tmp_path) == []
+
+
+def test_doctests():
+    results = doctest.testmod(
+        spill, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"
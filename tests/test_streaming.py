@@ -0,0 +1,108 @@
+"""Tests for the streaming (chunked) paths: ``graze_chunks`` and ``iter_chunks``."""
+
+import os
+import zlib
+
+import pytest
+from dol import Files
+
+from graze.base import Graze, GrazeBase, Internet, graze_chunks
+
+PAYLOAD = bytes(range(256)) * 1000  # 256 KB
+
+
+def test_miss_streams_from_the_network_and_commits_to_the_cache(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    g = GrazeBase(cache=str(tmp_path))
+
+    chunks = list(g.iter_chunks(url, chunk_size=10_000))
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == PAYLOAD
+    assert url in g
+    assert g[url] == PAYLOAD
+    assert server.hits("/big.bin") == 1
+
+
+def test_hit_streams_from_disk(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    g = Graze(str(tmp_path))
+    _ = g[url]
+
+    chunks = list(g.iter_chunks(url, chunk_size=100_000))
+
+    assert [len(c) for c in chunks] == [100_000, 100_000, 56_000]
+    assert server.hits("/big.bin") == 1
+
+
+def test_first_chunk_arrives_before_the_cache_is_written(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    g = GrazeBase(cache=str(tmp_path))
+
+    it = g.iter_chunks(url, chunk_size=1000)
+    assert next(it) == PAYLOAD[:1000]
+    assert url not in g  # not committed yet
+    b"".join(it)
+    assert url in g
+
+
+def test_an_abandoned_stream_commits_nothing(server, tmp_path):
+    url = server.route("/big.bin", PAYLOAD)
+    g = GrazeBase(cache=str(tmp_path))
+
+    it = g.iter_chunks(url, chunk_size=1000)
+    next(it)
+    it.close()
+
+    assert url not in g
+    leftovers = [f for _, _, files in os.walk(tmp_path) for f in files]
+    assert leftovers == []
+
+
+def test_a_failed_fetch_raises_key_error_and_caches_nothing(server, tmp_path):
+    url = server.route("/gone", b"nope", status=404)
+    g = GrazeBase(cache=str(tmp_path))
+
+    with pytest.raises(KeyError):
+        list(g.iter_chunks(url))
+    assert url not in g
+
+
+def test_non_file_cache_gets_the_whole_contents_at_the_end(server):
+    url = server.route("/big.bin", PAYLOAD)
+    cache = {}
+
+    chunks = graze_chunks(url, cache, cache_key="k", source=Internet())
+    assert b"".join(chunks) == PAYLOAD
+    assert cache == {"k": PAYLOAD}
+
+
+def test_wrapped_file_stores_are_read_and_written_through(server, tmp_path):
+    from graze.graze_exceptional import graze_cache
+
+    exceptional = tmp_path / "local.txt"
+    exceptional.write_bytes(b"local contents")
+    cache = graze_cache(str(tmp_path / "cache"), exceptions={"k": str(exceptional)})
+    source = lambda url: b"remote contents"
+    assert b"".join(graze_chunks("u", cache, cache_key="k", source=source)) == (
+        b"local contents"
+    )
+
+    class Compressed(Files):  # (a store transforming what it's given)
+        def __setitem__(self, k, v):
+            super().__setitem__(k, zlib.compress(v))
+
+    store = Compressed(str(tmp_path / "cache"))
+    list(graze_chunks("u", store, cache_key="other", source=source))
+    assert zlib.decompress(store["other"]) == b"remote contents"
+
+
+def test_a_plain_callable_source_is_chunked():
+    cache = {}
+    chunks = list(
+        graze_chunks(
+            "u", cache, cache_key="k", source=lambda u: b"abcdef", chunk_size=4
+        )
+    )
+    assert chunks == [b"abcd", b"ef"]
+    assert cache == {"k": b"abcdef"}
@@ -0,0 +1,98 @@
+"""Tests for :mod:`graze.timeouts` and its use by the fetch functions."""
+
+import doctest
+import time
+from urllib.error import URLError
+
+import pytest
+import requests
+
+from graze import timeouts
+from graze.base import Internet, graze
+from graze.rate_limit import HostScheduler
+from graze.retry import RetryPolicy
+from graze.timeouts import (
+    DeadlineExceeded,
+    Timeouts,
+    remaining,
+    timeout_scope,
+    within,
+)
+from graze.util import chks_of_url_contents, get_content_size
+
+
+def slow(seconds, body=b"late"):
+    def answer(handler):
+        time.sleep(seconds)
+        return 200, body, {}
+
+    return answer
+
+
+def test_read_timeout(server):
+    url = server.route("/slow", slow(0.5))
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        Internet(timeouts=Timeouts(read=0.1))[url]
+    assert time.monotonic() - started < 0.4
+
+
+def test_urllib_paths_have_timeouts_too(server):
+    url = server.route("/slow", slow(0.5))
+    with timeout_scope(Timeouts(connect=0.1, read=0.1)):
+        with pytest.raises((TimeoutError, URLError)):
+            list(chks_of_url_contents(url))
+        with pytest.raises((TimeoutError, URLError)):
+            get_content_size(url)
+
+
+def test_the_deadline_bounds_retries(server, tmp_path):
+    url = server.route("/down", status=503)
+    source = Internet(retry=RetryPolicy(max_attempts=100, backoff_base=0.05, jitter=0))
+    started = time.monotonic()
+    with pytest.raises((KeyError, DeadlineExceeded)):
+        graze(url, str(tmp_path), source=source, timeout=0.3)
+    assert time.monotonic() - started < 0.6
+    assert 1 < server.hits("/down") < 10
+
+
+def test_internet_deadline(server):
+    url = server.route("/slow", slow(0.5))
+    with pytest.raises((requests.exceptions.Timeout, DeadlineExceeded)):
+        Internet(deadline=0.1)[url]
+
+
+def test_total_timeout():
+    def trickle():
+        for _ in range(5):
+            time.sleep(0.05)
+            yield b"x"
+
+    with pytest.raises(DeadlineExceeded):
+        b"".join(within(trickle(), time.monotonic() + 0.1))
+
+
+def test_deadline_exceeded_is_not_retried():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise DeadlineExceeded("late")
+
+    with pytest.raises(DeadlineExceeded):
+        RetryPolicy(sleep=lambda s: None).call(fetch)
+    assert len(calls) == 1
+
+
+def test_scopes_carry_over_to_batches():
+    with timeout_scope(deadline=10):
+        left = HostScheduler().map(lambda url: remaining(), ["http://a.com/x"])
+    assert 0 < left[0] <= 10
+    assert remaining() is None
+
+
+def test_timeouts_doctests():
+    results = doctest.testmod(
+        timeouts, optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE
+    )
+    assert results.failed == 0, f"{results.failed} doctest failure(s)"